@@ -0,0 +1,115 @@
+"""
+Semantic answer cache for repeated questions.
+
+Answers to questions asked without chat history are cached per document
+set, keyed by the question's embedding. A later question whose embedding
+is at least `threshold` cosine-similar to a cached one ("what is this
+document about?" / "What's this document about") is answered from the
+cache without retrieval or an LLM call. Entries expire after a TTL, the
+least recently used are evicted past max_entries, and re-indexing a
+document drops every entry that was answered from it.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+Scope = FrozenSet[str]  # the (resolved) document ids an answer was generated from
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = ("scope", "question", "vector", "answer", "created")
+
+    def __init__(self, scope: Scope, question: str, vector: np.ndarray, answer: str):
+        self.scope = scope
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.created = time.monotonic()
+
+
+class SemanticAnswerCache:
+    """Thread-safe LRU of answers, looked up by cosine similarity within a document set."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # LRU order
+        self._by_scope: Dict[Scope, Set[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, document_ids: Iterable[str], query_vector: List[float]) -> Optional[Tuple[str, float]]:
+        """Returns (answer, similarity) of the closest fresh entry above the threshold, else None."""
+        scope = frozenset(document_ids)
+        vector = _normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_similarity = None, self.threshold
+            for entry_id in list(self._by_scope.get(scope, ())):
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl_seconds:
+                    self._drop(entry_id)
+                    continue
+                similarity = float(np.dot(entry.vector, vector))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id].answer, best_similarity
+
+    def store(self, document_ids: Iterable[str], question: str, query_vector: List[float], answer: str):
+        scope = frozenset(document_ids)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(scope, question, _normalize(query_vector), answer)
+            self._by_scope.setdefault(scope, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, document_id: str) -> int:
+        """Drops every answer generated from a document (call after it is re-indexed). Returns the count."""
+        with self._lock:
+            stale = [entry_id for scope in self._by_scope if document_id in scope for entry_id in self._by_scope[scope]]
+            for entry_id in stale:
+                self._drop(entry_id)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_scope[entry.scope]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_scope[entry.scope]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,99 @@
+"""
+Dynamic micro-batching.
+
+Concurrent callers submit single items; a background worker collects them
+for up to max_wait_ms (or until max_batch_size are waiting), runs the whole
+batch with one call on a dedicated thread, and routes each result back to
+its caller. Used in two places:
+
+- the local LLM (main.py), where one batched generate costs about as much
+  as a single prompt;
+- chat queries (query_service.py), where concurrent questions are embedded
+  with one encoder call and searched with one batched index search.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+class MicroBatcher:
+    """Batches concurrent submit() calls into run_batch(items) -> results (same order)."""
+
+    def __init__(self, run_batch: Callable[[List], List], max_batch_size: int = 8, max_wait_ms: float = 10, name: str = "batch"):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # One thread: batches run back to back, never two model calls at once
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.busy_seconds = 0.0
+
+    async def submit(self, item):
+        """Queues one item and waits for its result."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> List:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            # asyncio.wait (not wait_for) so a get that loses the race leaves its item in the queue
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                getter.cancel()
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that gave up while waiting don't take a slot in the batch
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.busy_seconds += time.perf_counter() - started
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
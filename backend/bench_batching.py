@@ -0,0 +1,93 @@
+"""
+Benchmark local LLM throughput vs p95 latency with and without micro-batching.
+
+Fires N concurrent requests at the real flan-t5-small model (closed loop:
+each client sends its next prompt as soon as the previous one returns) and
+reports requests/s and latency percentiles per concurrency level. The
+"unbatched" run uses max_batch_size=1, i.e. one generate per request.
+
+    python bench_batching.py --concurrency 1 2 4 8 16 --requests 64
+    python bench_batching.py --max-batch 16 --wait-ms 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from local_llm import BatchedSeq2SeqLLM
+
+PROMPT = (
+    "Use the following pieces of retrieved context to answer the question.\n\n"
+    "Context: The agreement may be terminated by either party with thirty days written notice. "
+    "Payment is due within fifteen days of the invoice date. Late payments accrue interest at 1% per month.\n\n"
+    "Question: {question}\n\nAnswer:"
+)
+QUESTIONS = [
+    "How can the agreement be terminated?",
+    "When is payment due?",
+    "What happens if a payment is late?",
+    "How much notice is required?",
+]
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def run_level(llm: BatchedSeq2SeqLLM, concurrency: int, total: int) -> dict:
+    latencies = []
+    counter = iter(range(total))
+
+    async def client():
+        for i in counter:
+            start = time.perf_counter()
+            await llm.ainvoke(PROMPT.format(question=QUESTIONS[i % len(QUESTIONS)]))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests_per_s": round(total / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+    }
+
+
+async def bench(model, tokenizer, args) -> list:
+    results = []
+    for mode, max_batch in (("unbatched", 1), ("batched", args.max_batch)):
+        for concurrency in args.concurrency:
+            # Fresh batcher per level so avg_batch_size only counts this level
+            llm = BatchedSeq2SeqLLM.from_model(model, tokenizer, max_new_tokens=args.max_new_tokens,
+                                               max_batch_size=max_batch, max_wait_ms=args.wait_ms)
+            row = {"mode": mode, **await run_level(llm, concurrency, max(args.requests, concurrency))}
+            row["avg_batch_size"] = llm.stats()["avg_batch_size"]
+            results.append(row)
+            print(f"{mode:>9}  c={concurrency:<3} {row['requests_per_s']:>7.2f} req/s  p50 {row['p50_ms']:>8.1f}ms  p95 {row['p95_ms']:>8.1f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="google/flan-t5-small")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForSeq2SeqLM.from_pretrained(args.model).eval()
+    model.generate(**tokenizer(["warm up"], return_tensors="pt"), max_new_tokens=4)
+    print(json.dumps(asyncio.run(bench(model, tokenizer, args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
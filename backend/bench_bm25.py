@@ -0,0 +1,75 @@
+"""
+Benchmark the per-document BM25 index: build time, memory and the query-time
+cost hybrid retrieval adds (lexical search + reciprocal rank fusion).
+
+Uses synthetic ~500-character chunks sprinkled with part numbers, so it runs
+without PDFs or the embedding model.
+
+    python bench_bm25.py --chunks 500 2000 20000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from bm25 import HYBRID_CANDIDATES, BM25Index, reciprocal_rank_fusion
+
+WORDS = ("contract payment notice party agreement invoice clause term interest document section shall "
+         "provide written days within date late accrue month either supplier warranty delivery").split()
+
+
+def make_chunks(n: int, rng: random.Random):
+    chunks = []
+    for i in range(n):
+        words = [rng.choice(WORDS) for _ in range(80)]
+        words.insert(rng.randrange(len(words)), f"PN-{i:06d}")  # one unique identifier per chunk
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[500, 2000, 20000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=HYBRID_CANDIDATES or 20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = []
+    for n_chunks in args.chunks:
+        chunks = make_chunks(n_chunks, rng)
+        start = time.perf_counter()
+        index = BM25Index.build(chunks)
+        build_s = time.perf_counter() - start
+
+        targets = [rng.randrange(n_chunks) for _ in range(args.queries)]
+        queries = [f"what is the warranty for part PN-{target:06d}" for target in targets]
+        dense = [[rng.randrange(n_chunks) for _ in range(args.candidates)] for _ in queries]  # stand-in dense ranking
+
+        latencies, found = [], 0
+        for query, target, dense_ranking in zip(queries, targets, dense):
+            start = time.perf_counter()
+            lexical = [position for position, _ in index.search(query, args.candidates)]
+            fused = reciprocal_rank_fusion([dense_ranking, lexical])[:6]
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += any(position == target for position, _ in fused)
+        latencies.sort()
+
+        row = {
+            "chunks": n_chunks,
+            "build_s": round(build_s, 3),
+            "index_kb": round(index.nbytes / 1024, 1),
+            "hybrid_p50_ms": round(statistics.median(latencies), 3),
+            "hybrid_p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))], 3),
+            "identifier_hit_rate": round(found / len(queries), 3),
+        }
+        results.append(row)
+        print(f"{n_chunks:>7} chunks  build {row['build_s']:.3f}s  {row['index_kb']:>9.1f} KB  "
+              f"search+fusion p50 {row['hybrid_p50_ms']:.3f}ms p99 {row['hybrid_p99_ms']:.3f}ms  "
+              f"exact-id hit rate {row['identifier_hit_rate']:.2f}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark the embedding backends (torch, onnx, onnx-int8) on both hot paths.
+
+Each backend runs in its own process so import cost and peak RSS are
+measured in isolation:
+  - ingestion: chunks/s for embed_documents over batches of chunk-sized texts
+  - query:     p50/p95 latency of single embed_query calls
+
+    python bench_embeddings.py
+    python bench_embeddings.py --backends torch onnx-int8 --chunks 2048 --batch-size 64
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+
+WORDS = ("contract payment notice party agreement invoice clause term interest document "
+         "section shall provide written days within date late accrue month either").split()
+
+
+def make_texts(n: int, words_per_text: int, seed: int = 0):
+    import random
+
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_text)) for _ in range(n)]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KB on Linux
+
+
+def run_backend(backend: str, args, results):
+    start = time.perf_counter()
+    from embedding_backends import load_embeddings
+
+    embeddings = load_embeddings(backend)
+    load_s = time.perf_counter() - start
+
+    chunks = make_texts(args.chunks, 90)  # ~500 characters, like the ingestion splitter's chunks
+    embeddings.embed_documents(chunks[:args.batch_size])  # warm-up
+    start = time.perf_counter()
+    for i in range(0, len(chunks), args.batch_size):
+        embeddings.embed_documents(chunks[i:i + args.batch_size])
+    chunks_per_s = len(chunks) / (time.perf_counter() - start)
+
+    queries = make_texts(args.queries, 8, seed=1)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    results[backend] = {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "ingest_chunks_per_s": round(chunks_per_s, 1),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--chunks", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Manager().dict()
+    rows = []
+    for backend in args.backends:
+        process = ctx.Process(target=run_backend, args=(backend, args, results))
+        process.start()
+        process.join()
+        if backend not in results:
+            print(f"{backend:>10}  failed (see error above)")
+            continue
+        row = results[backend]
+        rows.append(row)
+        print(f"{backend:>10}  load {row['load_s']:>6.2f}s  ingest {row['ingest_chunks_per_s']:>8.1f} chunks/s  "
+              f"query p50 {row['query_p50_ms']:>6.2f}ms p95 {row['query_p95_ms']:>6.2f}ms  peak RSS {row['peak_rss_mb']} MB")
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark the tiered index engine against an exact flat index.
+
+Uses synthetic clustered, unit-norm 384-d vectors (the shape of
+all-MiniLM-L6-v2 embeddings) so it runs without the embedding model.
+
+    python bench_index.py --sizes 1000 5000 20000 50000 --queries 200
+    python bench_index.py --sizes 50000 --tiers ivf ivfsq8 ivfpq   # compare tiers directly
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from index_engine import build_faiss_index, describe_index, index_tier, read_index
+
+
+def make_vectors(n: int, dim: int, n_clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def time_queries(index: faiss.Index, queries: np.ndarray, k: int):
+    """Single-query latencies (what /chat does) and the returned ids."""
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    return latencies, np.array(ids)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) > 1 else values[0]
+
+
+def bench_tier(vectors: np.ndarray, queries: np.ndarray, flat: faiss.Index, tier: str, args) -> dict:
+    n = len(vectors)
+    start = time.perf_counter()
+    tiered = build_faiss_index(vectors, tier=tier)
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(tiered, path)
+        file_bytes = os.path.getsize(path)
+        mmapped = read_index(path)
+
+        result = {
+            "vectors": n,
+            "tier": tier,
+            "index": describe_index(mmapped),
+            "build_s": round(build_s, 3),
+            "index_bytes": file_bytes,
+            "flat_bytes": n * args.dim * 4,
+            "k": {},
+        }
+        for k in args.k:
+            flat_lat, truth = time_queries(flat, queries, k)
+            tier_lat, found = time_queries(mmapped, queries, k)
+            result["k"][str(k)] = {
+                "recall": round(recall_at_k(found, truth), 4),
+                "flat_p50_ms": round(percentile(flat_lat, 50), 4),
+                "flat_p95_ms": round(percentile(flat_lat, 95), 4),
+                "tiered_p50_ms": round(percentile(tier_lat, 50), 4),
+                "tiered_p95_ms": round(percentile(tier_lat, 95), 4),
+            }
+        del mmapped
+    return result
+
+
+def bench_size(n: int, args, rng) -> list:
+    vectors = make_vectors(n, args.dim, max(8, n // 200), rng)
+    queries = vectors[rng.integers(0, n, size=args.queries)] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(vectors)
+    return [bench_tier(vectors, queries, flat, tier, args) for tier in (args.tiers or [index_tier(n)])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000])
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 6])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tiers", nargs="+", choices=["flat", "ivf", "ivfsq8", "ivfpq"],
+                        help="Force these tiers instead of the automatic choice for each size")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for n in args.sizes:
+        for result in bench_size(n, args, rng):
+            results.append(result)
+            for k, stats in result["k"].items():
+                print(f"n={n:>6} {result['tier']:>6} k={k} recall={stats['recall']:.3f} "
+                      f"p50 {stats['flat_p50_ms']:.3f}ms -> {stats['tiered_p50_ms']:.3f}ms  "
+                      f"size {result['flat_bytes'] // 1024}KB -> {result['index_bytes'] // 1024}KB")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
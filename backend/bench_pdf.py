@@ -0,0 +1,87 @@
+"""
+Benchmark PDF text extraction: PyPDFLoader (the old ingestion path) against
+pdf_extract.PageExtractor with 1..N worker processes, and a re-run served
+from the page cache.
+
+The corpus is generated (fake_pdf.py). By default it is one text-only
+document and one where every --scanned-every'th page is an image without
+text. Real PDFs can be passed with --pdf. Parallel speedup is bounded by
+the number of cores.
+
+    python bench_pdf.py --pages 300 --workers 1 2 4
+    python bench_pdf.py --pdf contract.pdf --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+
+from fake_pdf import write_pdf
+from ingest import file_sha256
+from pdf_extract import PageExtractor, PageTextCache
+
+
+def timed(pages_of) -> dict:
+    start = time.perf_counter()
+    pages = list(pages_of())
+    elapsed = time.perf_counter() - start
+    return {"pages": len(pages), "seconds": round(elapsed, 3), "pages_per_s": round(len(pages) / elapsed, 1),
+            "chars": sum(len(page.page_content) for page in pages)}
+
+
+def bench_file(path: str, label: str, worker_counts, mode: str):
+    rows = []
+    baseline = timed(lambda: PyPDFLoader(path).lazy_load())
+    rows.append({"document": label, "extractor": "PyPDFLoader", **baseline})
+
+    for workers in worker_counts:
+        extractor = PageExtractor(workers=workers, mode=mode)
+        extractor.start()  # pool start-up is paid once per server, not per document
+        row = timed(lambda: extractor.iter_pages(path))
+        rows.append({"document": label, "extractor": f"PageExtractor x{workers}", **row,
+                     "pages_without_text": extractor.pages_without_text})
+        extractor.shutdown()
+
+    cache = PageTextCache(os.path.join(tempfile.mkdtemp(prefix="bench_pdf_"), "pages.sqlite3"))
+    extractor = PageExtractor(mode=mode, cache=cache)
+    file_hash = file_sha256(path)
+    list(extractor.iter_pages(path, file_hash=file_hash))  # fills the cache
+    rows.append({"document": label, "extractor": "PageExtractor (cached)", **timed(lambda: extractor.iter_pages(path, file_hash=file_hash))})
+
+    for row in rows:
+        row["speedup"] = round(row["pages_per_s"] / baseline["pages_per_s"], 2)
+        print(f"{label:<14} {row['extractor']:<24} {row['pages']:>5} pages  {row['pages_per_s']:>8.1f} pages/s  "
+              f"x{row['speedup']:<6.2f} {row['chars']:>8} chars")
+    return rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="*", default=[], help="Benchmark these files instead of generated ones")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--scanned-every", type=int, default=3, help="Every Nth page of the 'scanned' document is an image")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mode", default="plain", choices=("plain", "layout"))
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPU core(s) available")
+
+    files = [(path, os.path.basename(path)) for path in args.pdf]
+    if not files:
+        folder = tempfile.mkdtemp(prefix="bench_pdf_")
+        for label, scanned_every in (("text", 0), ("scanned-mix", args.scanned_every)):
+            path = os.path.join(folder, f"{label}.pdf")
+            write_pdf(path, args.pages, random.Random(7), scanned_every=scanned_every)
+            files.append((path, label))
+
+    results = []
+    for path, label in files:
+        results += bench_file(path, label, args.workers, args.mode)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
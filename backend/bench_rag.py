@@ -0,0 +1,309 @@
+"""
+End-to-end RAG benchmark and load test.
+
+Drives the real FastAPI `app` in-process, with a deterministic stand-in LLM
+(fake_llm.py, configurable latency and tokens/s) and fake embeddings by
+default (--embedding-backend torch|onnx|onnx-int8 uses a real model):
+
+- ingestion: a corpus of generated PDFs is uploaded through /upload.
+  Reports pages/s, chunks/s and peak RSS.
+- retrieval: p50 / p95 / p99 per k, for one document and across all of
+  them.
+- chat: N concurrent clients on /chat/stream. Reports time-to-first-token
+  and throughput (answers/s, streamed tokens/s). Frames are timed as the
+  app sends them, through a minimal ASGI driver, because httpx's
+  ASGITransport buffers whole responses.
+
+Results are printed and written as JSON (--output). Pass a previous result
+file as --baseline to compare against it: the run exits with status 1 when
+a metric is more than --tolerance worse.
+
+    python bench_rag.py --output bench_results.json
+    python bench_rag.py --baseline bench_results.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+os.environ.setdefault("DOCUMENT_STORE_PATH", tempfile.mkdtemp(prefix="bench_rag_"))
+
+import httpx
+import orjson
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import main
+from fake_llm import FakeChatModel
+from fake_pdf import WORDS, write_pdf
+from query_service import QueryService
+
+
+# --- Helpers ---
+@contextlib.contextmanager
+def quiet():
+    """The app logs every request; keep the benchmark output readable."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def percentiles(values_ms: List[float]) -> Dict[str, float]:
+    values = sorted(values_ms)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))], 3)
+    return {"p50_ms": round(statistics.median(values), 3), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB on Linux
+
+
+async def stream_request(app, path: str, payload: dict) -> Dict:
+    """POSTs to a streaming endpoint through the ASGI interface, timing frames as the app sends them."""
+    body = orjson.dumps(payload)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    result = {"status": None, "ttft_ms": None, "tokens": 0, "error": None}
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            return
+        for frame in message.get("body", b"").split(b"\n\n"):
+            if not frame.startswith(b"data: "):
+                continue
+            event = orjson.loads(frame[6:])
+            if event.get("chunk"):
+                if result["ttft_ms"] is None:
+                    result["ttft_ms"] = (time.perf_counter() - start) * 1000
+                result["tokens"] += len(event["chunk"].split())
+            elif event.get("error"):
+                result["error"] = event["error"]
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    result["total_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+# --- Sections ---
+async def bench_ingestion(client: httpx.AsyncClient, corpus_dir: str, docs: int, pages: int) -> Dict:
+    rng = random.Random(0)
+    paths = []
+    for i in range(docs):
+        path = os.path.join(corpus_dir, f"doc{i}.pdf")
+        write_pdf(path, pages, rng)
+        paths.append(path)
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    document_ids = []
+    for path in paths:
+        with open(path, "rb") as f:
+            response = await client.post("/upload", files={"file": (os.path.basename(path), f, "application/pdf")})
+        document_ids.append(response.json()["document_id"])
+    while True:
+        entries = {entry["document_id"]: entry for entry in (await client.get("/documents")).json()["documents"]}
+        statuses = [entries[doc_id]["status"] for doc_id in document_ids]
+        if all(status in ("ready", "error", "cancelled") for status in statuses):
+            break
+        await asyncio.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    if any(status != "ready" for status in statuses):
+        raise RuntimeError(f"ingestion failed: {statuses}")
+
+    chunks = sum(entries[doc_id]["progress"]["chunks_total"] or 0 for doc_id in document_ids)
+    return {
+        "document_ids": document_ids,
+        "documents": docs,
+        "pages": docs * pages,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(docs * pages / elapsed, 1),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+    }
+
+
+async def bench_retrieval(document_ids: List[str], ks: List[int], queries: int) -> Dict:
+    rng = random.Random(1)
+    questions = [f"what does item PN-{rng.randrange(20):04d}-{rng.randrange(45):02d} say about {rng.choice(WORDS)}"
+                 for _ in range(queries)]
+    all_stores, error = await main.load_target_stores(main.ChatRequest(question="warm up", document_ids=document_ids))
+    if error:
+        raise RuntimeError(error)
+    single = {document_ids[0]: all_stores[document_ids[0]]} if document_ids[0] in all_stores else dict(list(all_stores.items())[:1])
+
+    results = {}
+    for scope_name, stores in (("single_document", single), ("all_documents", all_stores)):
+        for k in ks:
+            latencies = []
+            for question in questions:
+                start = time.perf_counter()
+                await main.search_stores(stores, question, k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[f"{scope_name}_k{k}"] = percentiles(latencies)
+    return results
+
+
+async def bench_chat(document_ids: List[str], clients: int, requests_per_client: int) -> Dict:
+    results = []
+
+    async def client_loop(client_id: int):
+        for i in range(requests_per_client):
+            # Unique questions so neither the answer cache nor request coalescing kicks in
+            payload = {"question": f"What is the notice period for item {client_id}-{i}?", "document_ids": document_ids}
+            results.append(await stream_request(main.app, "/chat/stream", payload))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    answered = [r for r in results if r["status"] == 200 and r["ttft_ms"] is not None and not r["error"]]
+    ttft = percentiles([r["ttft_ms"] for r in answered]) if answered else {}
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(answered),
+        "ttft_p50_ms": ttft.get("p50_ms"),
+        "ttft_p95_ms": ttft.get("p95_ms"),
+        "ttft_p99_ms": ttft.get("p99_ms"),
+        "answer_p50_ms": round(statistics.median(r["total_ms"] for r in answered), 3) if answered else None,
+        "answers_per_s": round(len(answered) / elapsed, 2),
+        "tokens_per_s": round(sum(r["tokens"] for r in answered) / elapsed, 1),
+    }
+
+
+# --- Baseline comparison ---
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Returns the metrics that got worse than the baseline by more than tolerance (relative)."""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for name in sorted(current.keys() & previous.keys()):
+        if name.startswith("config."):
+            continue
+        if name.endswith("_per_s"):
+            change = (previous[name] - current[name]) / previous[name] if previous[name] else 0.0  # lower is worse
+        elif name.endswith(("_ms", "_mb")):
+            change = (current[name] - previous[name]) / previous[name] if previous[name] else 0.0  # higher is worse
+        else:
+            continue
+        marker = "REGRESSION" if change > tolerance else ""
+        print(f"  {name:<45} {previous[name]:>11} -> {current[name]:>11}  {-change * 100:+7.1f}%  {marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+async def run(args) -> Dict:
+    if args.embedding_backend:
+        from embedding_backends import load_embeddings
+        main.embeddings_model = load_embeddings(args.embedding_backend, "all-MiniLM-L6-v2")
+    else:
+        main.embeddings_model = DeterministicFakeEmbedding(size=384)
+    main.llm = FakeChatModel(latency_s=args.llm_latency_ms / 1000, tokens_per_s=args.tokens_per_s, reply_tokens=args.reply_tokens)
+    main.query_service = QueryService(main.embeddings_model, main.QUERY_BATCH_MAX_SIZE, main.QUERY_BATCH_MAX_WAIT_MS)
+    main.warmup.ready()
+
+    results = {"config": {**vars(args), "python": platform.python_version(), "cpus": os.cpu_count()}}
+    # The lifespan would also load the real models - start only the ingestion workers
+    await main.ingestion_scheduler.start()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            with tempfile.TemporaryDirectory() as corpus_dir, quiet():
+                ingestion = await bench_ingestion(client, corpus_dir, args.docs, args.pages)
+        document_ids = ingestion.pop("document_ids")
+        results["ingestion"] = ingestion
+        print(f"ingestion: {ingestion['pages']} pages, {ingestion['chunks']} chunks in {ingestion['seconds']}s - "
+              f"{ingestion['pages_per_s']} pages/s, {ingestion['chunks_per_s']} chunks/s, peak RSS {ingestion['peak_rss_mb']} MB")
+
+        with quiet():
+            results["retrieval"] = await bench_retrieval(document_ids, args.k, args.queries)
+        for name, row in results["retrieval"].items():
+            print(f"retrieval {name:<22} p50 {row['p50_ms']:>8.3f}ms  p95 {row['p95_ms']:>8.3f}ms  p99 {row['p99_ms']:>8.3f}ms")
+
+        results["chat"] = {}
+        for clients in args.clients:
+            with quiet():
+                row = await bench_chat(document_ids, clients, args.requests_per_client)
+            results["chat"][f"clients_{clients}"] = row
+            print(f"chat/stream {clients:>3} clients  TTFT p50 {row['ttft_p50_ms']}ms p95 {row['ttft_p95_ms']}ms  "
+                  f"{row['answers_per_s']} answers/s  {row['tokens_per_s']} tokens/s  errors {row['errors']}")
+    finally:
+        await main.ingestion_scheduler.stop()
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=3, help="generated PDFs to ingest")
+    parser.add_argument("--pages", type=int, default=20, help="pages per PDF")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 6, 10])
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries per k")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="concurrent chat clients")
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="stand-in LLM time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=200, help="stand-in LLM generation speed")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx", "onnx-int8"], help="real embeddings (default: fake)")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} (tolerance {args.tolerance:.0%}, positive = better):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,70 @@
+"""
+Benchmark cross-document retrieval latency as the number of documents grows.
+
+Compares a sequential loop over per-document indexes, the parallel fan-out
+and the shared index (see retrieval.py). Uses synthetic 384-d vectors, so
+it runs without the embedding model.
+
+    python bench_retrieval.py --docs 1 4 16 64 --chunks 2000
+"""
+import argparse
+import json
+import statistics
+import time
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import retrieval
+from index_engine import build_faiss_index
+
+
+def make_store(n_chunks: int, dim: int, rng: np.random.Generator) -> FAISS:
+    vectors = rng.normal(size=(n_chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [str(i) for i in range(n_chunks)]
+    docstore = InMemoryDocstore({i: Document(page_content=f"chunk {i}") for i in ids})
+    return FAISS(DeterministicFakeEmbedding(size=dim), build_faiss_index(vectors), docstore, dict(enumerate(ids)))
+
+
+def p50_ms(func, queries) -> float:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(latencies), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks per document")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    all_stores = {f"doc-{i}": make_store(args.chunks, args.dim, rng) for i in range(max(args.docs))}
+    queries = [list(q) for q in rng.normal(size=(args.queries, args.dim)).astype(np.float32)]
+
+    results = []
+    for n_docs in args.docs:
+        stores = dict(list(all_stores.items())[:n_docs])
+        sequential = p50_ms(lambda q: [s.similarity_search_with_score_by_vector(q, k=args.k) for s in stores.values()], queries)
+        fan_out = p50_ms(lambda q: retrieval.search_many(stores, q, args.k, allow_shared=False), queries)
+        shared = retrieval.SharedIndex(stores)
+        shared_ms = p50_ms(lambda q: shared.search(q, args.k, stores), queries)
+        results.append({"documents": n_docs, "sequential_p50_ms": sequential, "parallel_p50_ms": fan_out,
+                        "shared_p50_ms": shared_ms, "shared_index": type(shared.index).__name__})
+        print(f"{n_docs:>4} docs  sequential {sequential:.3f}ms  parallel {fan_out:.3f}ms  shared {shared_ms:.3f}ms ({type(shared.index).__name__})")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark time-to-first-token of /chat/stream with and without chat history,
+for the query rewrite modes (QUERY_REWRITE=llm is the old "always reformulate
+first" behaviour, auto is heuristics + LLM only when needed + speculative
+search).
+
+Serves the app with uvicorn on a local port (a real socket, so streamed
+frames arrive as they are sent) with fake embeddings and a fake LLM with a
+fixed first-token latency - it measures the request path, not a model.
+
+    python bench_rewrite.py --requests 20 --llm-latency-ms 300
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import socket
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+os.environ.setdefault("DOCUMENT_STORE_PATH", tempfile.mkdtemp(prefix="bench_rewrite_"))
+
+import httpx
+import uvicorn
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import main
+from fake_llm import FakeChatModel
+from query_service import QueryService
+
+HISTORY = [
+    {"sender": "user", "text": "Which projects are listed in the resume?"},
+    {"sender": "ai", "text": "There are two projects: ContextAI, a document chat app, and Weather Now, a forecast dashboard."},
+]
+SCENARIOS = {
+    "no_history": ("What programming languages does the candidate know {i}?", []),
+    "simple_follow_up": ("What about the second one {i}?", HISTORY),
+    "ambiguous_follow_up": ("And how does it store the uploaded files when the server restarts in the middle {i}?", HISTORY),
+}
+
+
+def add_document(n_chunks: int) -> str:
+    document_id = "bench-doc"
+    texts = [f"Chunk {i}: project notes, uploads, storage, restarts, languages and frameworks." for i in range(n_chunks)]
+    main.document_store.add(document_id, "bench.pdf", status="ready")
+    main.document_store.publish_index(document_id, main.document_store.save_index(document_id, FAISS.from_texts(texts, main.embeddings_model)))
+    return document_id
+
+
+def start_server() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # No lifespan: the fake models are installed below instead of the warm-up loading real ones
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def first_token_ms(client: httpx.AsyncClient, payload: dict) -> Optional[float]:
+    start = time.perf_counter()
+    async with client.stream("POST", "/chat/stream", json=payload) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data:") and '"chunk"' in line:
+                return (time.perf_counter() - start) * 1000
+    return None
+
+
+async def run(args) -> List[dict]:
+    main.embeddings_model = DeterministicFakeEmbedding(size=384)
+    main.llm = FakeChatModel(latency_s=args.llm_latency_ms / 1000, tokens_per_s=args.tokens_per_s, reply_tokens=13)
+    main.query_service = QueryService(main.embeddings_model)
+    main.warmup.ready()
+    document_id = add_document(args.chunks)
+
+    results = []
+    async with httpx.AsyncClient(base_url=start_server(), timeout=60) as client:
+        for mode in args.modes:
+            main.QUERY_REWRITE = mode
+            for scenario, (template, history) in SCENARIOS.items():
+                latencies = []
+                for i in range(args.requests):
+                    # Unique questions so neither the answer cache nor request coalescing kicks in
+                    question = template.format(i=f"#{mode}-{i}")
+                    payload = {"question": question, "document_id": document_id, "chat_history": history + [{"sender": "user", "text": question}]}
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        latency = await first_token_ms(client, payload)
+                    if latency is not None:
+                        latencies.append(latency)
+                latencies.sort()
+                row = {
+                    "mode": mode,
+                    "scenario": scenario,
+                    "ttft_p50_ms": round(statistics.median(latencies), 1),
+                    "ttft_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1),
+                }
+                results.append(row)
+                print(f"{mode:>5}  {scenario:<20} TTFT p50 {row['ttft_p50_ms']:>7.1f}ms  p95 {row['ttft_p95_ms']:>7.1f}ms")
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="requests per mode and scenario")
+    parser.add_argument("--modes", nargs="+", default=["llm", "auto"], choices=["llm", "auto", "off"])
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="fake LLM time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=100)
+    parser.add_argument("--chunks", type=int, default=500)
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
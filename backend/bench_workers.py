@@ -0,0 +1,176 @@
+"""
+Benchmark /chat throughput against the number of uvicorn worker processes
+sharing one document store, and check that a document published while the
+server runs shows up in every worker without a restart.
+
+The workers serve this module's `app`: main.app with fake embeddings and a
+fake LLM that burns --work-ms of CPU per answer, the way the local model
+does. The numbers show how the request path scales across cores, not how
+fast a model is. Throughput can only scale up to the number of cores.
+
+    python bench_workers.py --workers 1 2 4 --concurrency 16 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _fake_models_app():
+    """Runs inside each worker process: main.app with fake, CPU-bound models."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import main
+    from fake_llm import FakeChatModel
+    from query_service import QueryService
+
+    main.embeddings_model = DeterministicFakeEmbedding(size=384)
+    # CPU work only - no waiting, so throughput is bounded by cores
+    main.llm = FakeChatModel(latency_s=0, tokens_per_s=1e9, reply_tokens=4, cpu_ms=float(os.environ.get("BENCH_WORK_MS", 50)))
+    main.query_service = QueryService(main.embeddings_model)
+    main.warmup.ready()
+    return main.app
+
+
+if __name__ != "__main__":
+    app = _fake_models_app()
+
+
+def publish_document(store_path: str, n_chunks: int) -> str:
+    """Writes an index and then marks it ready - the same order ingestion uses."""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from storage import DocumentStore
+
+    store = DocumentStore(store_path)
+    document_id = str(uuid.uuid4())
+    texts = [f"Chunk {i}: contract terms, payment schedule, notice period and warranty." for i in range(n_chunks)]
+    version = store.save_index(document_id, FAISS.from_texts(texts, DeterministicFakeEmbedding(size=384)))
+    store.add(document_id, "bench.pdf", status="ready", index_version=version)
+    return document_id
+
+
+def start_server(workers: int, store_path: str, work_ms: float):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, DOCUMENT_STORE_PATH=store_path, BENCH_WORK_MS=str(work_ms))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench_workers:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--lifespan", "off", "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_up(url: str, timeout: float = 120):
+    import httpx
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with httpx.AsyncClient(base_url=url) as client:
+                if (await client.get("/health")).status_code == 200:
+                    return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+async def measure_throughput(url: str, document_id: str, concurrency: int, duration: float):
+    import httpx
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+
+    async def client_loop(client_id: int):
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            i = 0
+            while time.perf_counter() < stop_at:
+                # Unique questions so neither the answer cache nor request coalescing kicks in
+                payload = {"question": f"What is the notice period? ({client_id}-{i})", "document_id": document_id}
+                start = time.perf_counter()
+                response = await client.post("/chat", json=payload)
+                if response.status_code == 200 and "answer" in response.json():
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+                i += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None,
+        "errors": errors,
+    }
+
+
+async def measure_publish_visibility(url: str, store_path: str, workers: int, n_chunks: int) -> float:
+    """Publishes a document and returns the ms until it is answerable on fresh connections (any worker)."""
+    import httpx
+    document_id = await asyncio.to_thread(publish_document, store_path, n_chunks)
+    published = time.perf_counter()
+    streak = 0
+    while streak < 4 * workers:  # fresh connections land on arbitrary workers
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            response = await client.post("/chat", json={"question": "notice period?", "document_id": document_id})
+        streak = streak + 1 if "answer" in response.json() else 0
+        if time.perf_counter() - published > 30:
+            raise RuntimeError("published document never became visible to all workers")
+    return round((time.perf_counter() - published) * 1000, 1)
+
+
+async def run(args):
+    results = []
+    baseline = None
+    for workers in args.workers:
+        store_path = tempfile.mkdtemp(prefix="bench_workers_")
+        document_id = publish_document(store_path, args.chunks)
+        process, url = start_server(workers, store_path, args.work_ms)
+        try:
+            await wait_until_up(url)
+            await measure_throughput(url, document_id, workers, 1.0)  # warm every worker's index cache
+            row = {"workers": workers, **await measure_throughput(url, document_id, args.concurrency, args.duration)}
+            baseline = baseline or row["requests_per_s"]
+            row["speedup"] = round(row["requests_per_s"] / baseline, 2)
+            row["publish_visible_ms"] = await measure_publish_visibility(url, store_path, workers, args.chunks)
+        finally:
+            process.terminate()
+            process.wait()
+        results.append(row)
+        print(f"{workers:>2} worker(s)  {row['requests_per_s']:>7.1f} req/s  x{row['speedup']:.2f}  "
+              f"p50 {row['p50_ms']}ms  p95 {row['p95_ms']}ms  errors {row['errors']}  "
+              f"new document visible after {row['publish_visible_ms']}ms")
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per worker count")
+    parser.add_argument("--work-ms", type=float, default=50, help="CPU time the fake LLM spends per answer")
+    parser.add_argument("--chunks", type=int, default=2000)
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPU core(s) available")
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
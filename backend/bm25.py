@@ -0,0 +1,134 @@
+"""
+Compact per-document BM25 index and reciprocal rank fusion.
+
+Dense embeddings blur exact tokens - part numbers, identifiers, names - so
+each document also gets a small inverted index over its chunks, built at
+ingestion next to the FAISS index (chunk i here is vector i there). Postings
+are stored CSR-style in flat numpy arrays (term -> slice of chunk ids and
+term frequencies), so a document with thousands of chunks costs a few
+hundred KB and a query is a handful of vectorized adds.
+
+Dense and lexical rankings are combined with reciprocal rank fusion, which
+needs no score normalization between the two.
+"""
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # standard RRF damping constant
+# Candidates taken from each ranking before fusion (0 = dense retrieval only)
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+
+# Words, plus identifiers that keep their inner separators: "AB-1234", "v2.1", "part_no"
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT_RE = re.compile(r"[-./_]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was what when where "
+    "which who why will with does do about can you me my".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers are indexed whole and by their parts."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if _SPLIT_RE.search(token):
+            tokens += [part for part in _SPLIT_RE.split(token) if part and part not in STOPWORDS]
+    return tokens
+
+
+class BM25Index:
+    """Inverted index over one document's chunks (positions match the FAISS ids)."""
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, chunk_ids: np.ndarray, term_freqs: np.ndarray, chunk_lengths: np.ndarray):
+        self.terms = terms
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets  # postings of term t: [offsets[t], offsets[t + 1])
+        self.chunk_ids = chunk_ids
+        self.term_freqs = term_freqs
+        self.chunk_lengths = chunk_lengths
+        self.n_chunks = len(chunk_lengths)
+        avg_length = float(chunk_lengths.mean()) if self.n_chunks else 0.0
+        # Per-chunk length normalization is fixed - precompute it once
+        self._norm = (BM25_K1 * (1 - BM25_B + BM25_B * chunk_lengths / max(avg_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "BM25Index":
+        postings = defaultdict(list)  # term -> [(chunk_id, tf)]
+        lengths = []
+        for chunk_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((chunk_id, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = [posting for term in terms for posting in postings[term]]
+        chunk_ids = np.array([chunk_id for chunk_id, _ in flat], dtype=np.int32)
+        term_freqs = np.array([min(tf, 65535) for _, tf in flat], dtype=np.uint16)
+        return cls(terms, offsets, chunk_ids, term_freqs, np.array(lengths, dtype=np.float32))
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k (chunk position, BM25 score) for the query; only chunks sharing a term with it."""
+        term_ids = [self.term_ids[term] for term in set(tokenize(query)) if term in self.term_ids]
+        if not term_ids or k <= 0:
+            return []
+        scores = np.zeros(self.n_chunks, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            ids = self.chunk_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1 + (self.n_chunks - df + 0.5) / (df + 0.5))
+            # Each chunk appears once per posting list, so fancy-index += is safe here
+            scores[ids] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[ids])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in candidates]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = self.offsets.nbytes + self.chunk_ids.nbytes + self.term_freqs.nbytes + self.chunk_lengths.nbytes + self._norm.nbytes
+        # Vocabulary: the strings plus the term -> id dict (~100 bytes per entry)
+        return arrays + sum(len(term) + 100 for term in self.terms)
+
+    # --- Persistence (one .npz next to index.faiss) ---
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer(json.dumps(self.terms).encode("utf-8"), dtype=np.uint8),
+                offsets=self.offsets,
+                chunk_ids=self.chunk_ids,
+                term_freqs=self.term_freqs,
+                chunk_lengths=self.chunk_lengths,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            terms = json.loads(data["terms"].tobytes().decode("utf-8"))
+            return cls(terms, data["offsets"], data["chunk_ids"], data["term_freqs"], data["chunk_lengths"])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Fuses ranked lists of keys: score = sum of 1 / (k + rank). Returns (key, score), best first."""
+    scores: Dict[Hashable, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,97 @@
+"""
+Pluggable embedding backends for all-MiniLM-L6-v2.
+
+EMBEDDING_BACKEND selects how chunks and queries are encoded:
+
+    torch      sentence-transformers on PyTorch (HuggingFaceEmbeddings, the default)
+    onnx       the same model exported to ONNX, run with onnxruntime
+    onnx-int8  the int8-quantized ONNX export - smallest and fastest on CPU
+
+The ONNX backends only need onnxruntime + tokenizers (no torch import) and
+load the exports published in the model's HuggingFace repo. They apply the
+same mean pooling + L2 normalization as sentence-transformers, so vectors
+are interchangeable with torch ones (test_embedding_parity.py checks this).
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+HUB_REPO = "sentence-transformers/{model_name}"
+# Exports shipped in the model repo; the int8 one uses AVX2 kernels, which every x86-64 server has
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+MAX_SEQ_LENGTH = 256  # sentence-transformers' max_seq_length for all-MiniLM-L6-v2
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an ONNX export: tokenize -> onnxruntime -> mean pool -> normalize."""
+
+    def __init__(self, model_name: str, onnx_file: str, batch_size: int = 32, threads: Optional[int] = None):
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        repo = HUB_REPO.format(model_name=model_name)
+        self.model_name = model_name
+        self.onnx_file = onnx_file
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repo, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            hf_hub_download(repo, onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: value for name, value in inputs.items() if name in self._input_names})[0]
+
+        # Mean pooling over real (non-padding) tokens, then L2 normalize - as sentence-transformers does
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = [self._encode(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        return np.vstack(vectors).tolist() if vectors else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def load_embeddings(backend: str = "torch", model_name: str = "all-MiniLM-L6-v2") -> Embeddings:
+    """Creates the embedding model for a backend name (see EMBEDDING_BACKENDS)."""
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': 'cpu'}  # Force CPU for free tier
+        )
+    if backend in ONNX_FILES:
+        onnx_file = os.getenv("EMBEDDING_ONNX_FILE", ONNX_FILES[backend])
+        return OnnxEmbeddings(model_name, onnx_file, threads=int(os.getenv("EMBEDDING_THREADS", 0)) or None)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def cache_model_name(backend: str, model_name: str = "all-MiniLM-L6-v2") -> str:
+    """Embedding-cache namespace: quantized vectors differ slightly, so they are never mixed with torch ones."""
+    return model_name if backend in ("torch", "onnx") else f"{model_name}:{backend}"
@@ -0,0 +1,86 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Wraps any LangChain Embeddings model. Chunk vectors are stored in SQLite,
+keyed by sha256(model name + chunk text), so re-uploads and shared
+boilerplate pages skip the encoder. Least-recently-used entries are evicted
+once the cache grows past max_entries (see sqlite_lru.py).
+"""
+import hashlib
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from sqlite_lru import SQLiteLRU
+
+
+def chunk_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).digest()
+
+
+class CachedEmbeddings(SQLiteLRU, Embeddings):
+    """Embeddings wrapper that serves embed_documents() from a persistent cache."""
+
+    def __init__(self, underlying: Embeddings, model_name: str, path: str, max_entries: int = 50000):
+        SQLiteLRU.__init__(self, path, "embeddings", "key BLOB NOT NULL, vector BLOB NOT NULL", "key", max_entries)
+        self.underlying = underlying
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [chunk_key(self.model_name, text) for text in texts]
+        cached = self._lookup(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            # Embed each distinct missing text once, even if it repeats within the batch
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = self.underlying.embed_documents(unique_texts)
+            # Round through float32 so results are identical whether or not they came from the cache
+            fresh = {
+                chunk_key(self.model_name, text): np.asarray(vector, dtype=np.float32).tolist()
+                for text, vector in zip(unique_texts, vectors)
+            }
+            self._store(fresh)
+            cached.update(fresh)
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [list(cached[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries are rarely repeated verbatim - don't pollute the chunk cache with them
+        return self.underlying.embed_query(text)
+
+    # --- SQLite helpers ---
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def _store(self, vectors: Dict[bytes, List[float]]):
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            self._evict()
+
+    def stats(self) -> Dict:
+        return {"model": self.model_name, **self._lru_stats()}
@@ -0,0 +1,65 @@
+"""
+Deterministic stand-in chat model for benchmarks.
+
+Behaves like a remote or local LLM from the app's point of view - same
+LangChain interface, ainvoke / astream - but the timing is configurable:
+a fixed latency before the first token, a generation speed in tokens/s,
+and optionally CPU time burnt per answer (holding the GIL, like a local
+model). The reply is always the same N words, so runs are comparable.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORDS = "the contract requires written notice within thirty days and payment is due on receipt of the invoice".split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Waits latency_s, then emits reply_tokens words at tokens_per_s (after cpu_ms of busy work, if set)."""
+    latency_s: float = 0.3
+    tokens_per_s: float = 100.0
+    reply_tokens: int = 40
+    cpu_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    @property
+    def reply_words(self):
+        return [_WORDS[i % len(_WORDS)] for i in range(self.reply_tokens)]
+
+    def _burn_cpu(self):
+        deadline = time.perf_counter() + self.cpu_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self._burn_cpu()
+        time.sleep(self.latency_s + self.reply_tokens / self.tokens_per_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(self.reply_words)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.cpu_ms:
+            await asyncio.to_thread(self._burn_cpu)
+        await asyncio.sleep(self.latency_s + self.reply_tokens / self.tokens_per_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(self.reply_words)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self._burn_cpu()
+        time.sleep(self.latency_s)
+        for word in self.reply_words:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            time.sleep(1 / self.tokens_per_s)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.cpu_ms:
+            await asyncio.to_thread(self._burn_cpu)
+        await asyncio.sleep(self.latency_s)
+        for word in self.reply_words:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            await asyncio.sleep(1 / self.tokens_per_s)
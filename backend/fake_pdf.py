@@ -0,0 +1,57 @@
+"""
+Generated PDFs for benchmarks: minimal files pypdf and PyPDFLoader can read,
+with reproducible text (seeded) and optionally image-only "scanned" pages.
+"""
+import random
+
+WORDS = ("contract payment notice party agreement invoice clause term interest document section shall provide "
+         "written days within date late accrue month either supplier warranty delivery").split()
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: int, rng: random.Random, lines_per_page: int = 45, scanned_every: int = 0):
+    """Minimal PDF (Helvetica, one content stream per page) - enough for PyPDFLoader.
+    With scanned_every=N every Nth page only paints an image, like a scanned page without OCR."""
+    pixels = bytes((i * 37) % 256 for i in range(64 * 64))
+    objects = {
+        1: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        3: (b"<< /Type /XObject /Subtype /Image /Width 64 /Height 64 /ColorSpace /DeviceGray "
+            b"/BitsPerComponent 8 /Length %d >>\nstream\n" % len(pixels) + pixels + b"\nendstream"),
+    }
+    page_ids = []
+    next_id = 4
+    for page in range(pages):
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        if scanned_every and (page + 1) % scanned_every == 0:
+            stream = b"q 595 0 0 842 0 0 cm /Im0 Do Q"
+            objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                                f"/Resources << /XObject << /Im0 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+            objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+            page_ids.append(page_id)
+            continue
+        lines = [f"Page {page + 1} item PN-{page:04d}-{line:02d} " + " ".join(rng.choice(WORDS) for _ in range(11))
+                 for line in range(lines_per_page)]
+        stream = ("BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET").encode()
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 1 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        page_ids.append(page_id)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode()
+    catalog_id = next_id
+    objects[catalog_id] = b"<< /Type /Catalog /Pages 2 0 R >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (catalog_id + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[i] for i in range(1, catalog_id + 1))
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (catalog_id + 1, catalog_id, xref)
+    with open(path, "wb") as f:
+        f.write(out)
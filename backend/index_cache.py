@@ -0,0 +1,98 @@
+"""
+Memory-budgeted LRU cache for loaded FAISS indexes.
+
+Every index in the cache is also on disk (see storage.py), so evicting one
+only drops it from RAM; the next query for that document reloads it.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from index_engine import index_heap_bytes
+
+# Rough per-chunk overhead of the docstore (Document object, metadata dict, id mapping)
+DOCSTORE_ENTRY_OVERHEAD = 400
+
+
+def estimate_index_bytes(vector_store) -> int:
+    """Approximate resident size of a LangChain FAISS store: vectors + chunk texts + BM25 index."""
+    # Memory-mapped vectors live in the (reclaimable) OS page cache, not our heap
+    vector_bytes = index_heap_bytes(vector_store.index)
+
+    docstore = getattr(vector_store.docstore, "_dict", {})
+    text_bytes = sum(len(doc.page_content) + DOCSTORE_ENTRY_OVERHEAD for doc in docstore.values())
+    lexical_index = getattr(vector_store, "lexical_index", None)
+    lexical_bytes = lexical_index.nbytes if lexical_index is not None else 0
+    return vector_bytes + text_bytes + lexical_bytes
+
+
+class IndexCache:
+    """LRU cache of FAISS stores bounded by an (estimated) byte budget."""
+
+    def __init__(self, max_bytes: int, on_evict: Optional[Callable] = None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict  # called as on_evict(doc_id, store) - e.g. to spill to disk
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # doc_id -> (store, size)
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, doc_id: str):
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(doc_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, doc_id: str, vector_store):
+        """Insert (or replace) an index, evicting least-recently-used ones to stay under budget."""
+        size = estimate_index_bytes(vector_store)
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(doc_id, None)
+            if old is not None:
+                self.resident_bytes -= old[1]
+            self._entries[doc_id] = (vector_store, size)
+            self.resident_bytes += size
+            # Never evict the entry we just inserted, even if it alone exceeds the budget
+            while self.resident_bytes > self.max_bytes and len(self._entries) > 1:
+                victim_id, (victim, victim_size) = self._entries.popitem(last=False)
+                self.resident_bytes -= victim_size
+                self.evictions += 1
+                evicted.append((victim_id, victim))
+
+        for victim_id, victim in evicted:
+            print(f"♻️ Evicted index from memory: {victim_id}")
+            if self.on_evict:
+                self.on_evict(victim_id, victim)
+
+    def pop(self, doc_id: str):
+        with self._lock:
+            entry = self._entries.pop(doc_id, None)
+            if entry is None:
+                return None
+            self.resident_bytes -= entry[1]
+            return entry[0]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "resident_indexes": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,180 @@
+"""
+Tiered FAISS index builder.
+
+Small documents get an exact IndexFlatL2. Larger ones get an IVF index
+(k-means coarse quantizer) with full vectors, then IVF with 8-bit scalar
+quantization (4x smaller, ~0.99 recall), and only huge ones IVF-PQ, which
+stores each vector in a few dozen bytes at a noticeable recall cost.
+Indexes are read back memory-mapped, so a big document's vectors (flat
+codes, or an IVF index's inverted lists) live in the OS page cache rather
+than the Python heap. What stays in the heap - IVF centroids, IVF-PQ's
+precomputed distance table - is reported by index_heap_bytes.
+
+Run bench_index.py to see recall@k / latency of each tier against flat.
+"""
+import math
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# Tier thresholds (number of chunks)
+IVF_MIN_VECTORS = int(os.getenv("INDEX_IVF_MIN_VECTORS", 2000))
+SQ8_MIN_VECTORS = int(os.getenv("INDEX_SQ8_MIN_VECTORS", 20000))
+PQ_MIN_VECTORS = int(os.getenv("INDEX_PQ_MIN_VECTORS", 500000))
+# IVF lists probed per query - higher = better recall, slower search
+IVF_NPROBE = int(os.getenv("INDEX_NPROBE", 16))
+# Bytes per vector for IVF-PQ (must divide the embedding dimension)
+PQ_BYTES_PER_VECTOR = int(os.getenv("INDEX_PQ_BYTES", 48))
+
+# Read indexes with their vectors memory-mapped (falls back to a normal read on older faiss).
+# IO_FLAG_MMAP_IFC only maps flat codes; IVF indexes need IO_FLAG_MMAP, which maps the inverted lists.
+FLAT_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+IVF_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP", 0)
+
+
+def index_tier(n_vectors: int) -> str:
+    if n_vectors < IVF_MIN_VECTORS:
+        return "flat"
+    if n_vectors < SQ8_MIN_VECTORS:
+        return "ivf"
+    if n_vectors < PQ_MIN_VECTORS:
+        return "ivfsq8"
+    return "ivfpq"
+
+
+def _n_lists(n_vectors: int) -> int:
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid (faiss' own guideline)
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    m = min(PQ_BYTES_PER_VECTOR, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_faiss_index(vectors: np.ndarray, tier: Optional[str] = None) -> faiss.Index:
+    """Builds (and trains, if needed) the right index for the number of vectors."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    tier = tier or index_tier(n_vectors)
+
+    if tier == "flat":
+        index = faiss.IndexFlatL2(dim)
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        n_lists = _n_lists(n_vectors)
+        if tier == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, n_lists)
+        elif tier == "ivfsq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, n_lists, faiss.ScalarQuantizer.QT_8bit)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, n_lists, _pq_subquantizers(dim), 8)
+        index.train(vectors)
+        index.nprobe = min(IVF_NPROBE, n_lists)
+
+    index.add(vectors)
+    return index
+
+
+def _make_store(index: faiss.Index, documents: List[Document], embedding) -> FAISS:
+    ids = [str(i) for i in range(len(documents))]
+    return FAISS(embedding, index, InMemoryDocstore(dict(zip(ids, documents))), dict(enumerate(ids)))
+
+
+def build_vector_store(text_embeddings: Iterable[Tuple[str, List[float]]], embedding, metadatas: Optional[List[dict]] = None) -> FAISS:
+    """Drop-in replacement for FAISS.from_embeddings that picks the index tier."""
+    text_embeddings = list(text_embeddings)
+    texts = [text for text, _ in text_embeddings]
+    vectors = np.array([vector for _, vector in text_embeddings], dtype=np.float32)
+    metadatas = metadatas or [{} for _ in texts]
+
+    index = build_faiss_index(vectors)
+    documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+    return _make_store(index, documents, embedding)
+
+
+class IncrementalIndex:
+    """
+    Flat index that grows micro-batch by micro-batch during ingestion.
+
+    snapshot() hands out an immutable copy that can be queried while the
+    ingestion thread keeps adding to the original; finalize() converts the
+    whole thing into the right tier once every page is in.
+    """
+
+    def __init__(self):
+        self.index: Optional[faiss.Index] = None
+        self.documents: List[Document] = []
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, documents: List[Document], vectors: List[List[float]]):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.index is None:
+            self.index = faiss.IndexFlatL2(vectors.shape[1])
+        self.index.add(vectors)
+        self.documents.extend(documents)
+
+    def snapshot(self, embedding) -> FAISS:
+        # Copying the flat vectors is a memcpy - cheap next to the lock-free reads it buys
+        return _make_store(faiss.clone_index(self.index), list(self.documents), embedding)
+
+    def finalize(self, embedding) -> FAISS:
+        if self.index is None:
+            raise ValueError("No extractable text found in this PDF.")
+        n_vectors = self.index.ntotal
+        tier = index_tier(n_vectors)
+        index = self.index if tier == "flat" else build_faiss_index(self.index.reconstruct_n(0, n_vectors), tier=tier)
+        return _make_store(index, self.documents, embedding)
+
+
+def _mmap_flag(path: str) -> int:
+    with open(path, "rb") as f:
+        fourcc = f.read(4)
+    # IVF index files start with "Iw" (IwFl, IwSq, IwPQ), flat ones with "IxF"
+    return IVF_MMAP_FLAG if fourcc.startswith(b"Iw") else FLAT_MMAP_FLAG
+
+
+def read_index(path: str, mmap: bool = True) -> faiss.Index:
+    """Reads an index, memory-mapped where this faiss build can; index.mmapped says whether it was."""
+    flag = _mmap_flag(path) if mmap else 0
+    index = faiss.read_index(path, flag)
+    index.mmapped = bool(flag)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+    return index
+
+
+def index_heap_bytes(index: faiss.Index) -> int:
+    """Approximate bytes an index holds in the process heap (memory-mapped codes excluded)."""
+    mmapped = getattr(index, "mmapped", False)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return 0 if mmapped else index.ntotal * getattr(index, "code_size", index.d * 4)
+    heap = ivf.nlist * ivf.d * 4  # coarse centroids
+    if not mmapped:
+        heap += ivf.ntotal * (ivf.code_size + 8)  # codes + ids in the inverted lists
+    precomputed = getattr(faiss.downcast_index(index), "precomputed_table", None)  # IVF-PQ only
+    if precomputed is not None:
+        heap += precomputed.size() * 4
+    return heap
+
+
+def describe_index(index: faiss.Index) -> dict:
+    ivf = faiss.try_extract_index_ivf(index)
+    return {
+        "type": type(index).__name__,
+        "vectors": index.ntotal,
+        "dim": index.d,
+        "nlist": ivf.nlist if ivf is not None else None,
+        "nprobe": ivf.nprobe if ivf is not None else None,
+    }
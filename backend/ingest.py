@@ -1,43 +1,291 @@
+"""
+Bulk ingestion CLI - preloads PDFs into the server's document store.
+
+PDFs are parsed and chunked in a process pool (page text is cached per
+file hash, so indexing a file again - into another store, with another
+--profile - parses nothing); chunks from many documents are embedded
+together in large batches to keep the encoder busy, and each document is
+written as its own index (the same format /upload produces, so the server
+picks them up lazily). Re-running skips every file whose content hash is
+already indexed, so an interrupted run can simply be started again. Files
+that failed before (unreadable or encrypted PDFs, no text) are skipped
+too, unless --retry-errors is given. Indexed files keep their profile; to
+change it, re-index them through the server (POST /documents/{id}/reindex).
+
+    python ingest.py                                # ingests test.pdf
+    python ingest.py ./contracts --workers 4
+    python ingest.py --manifest files.txt --batch-size 256
+    python ingest.py ./manuals --profile long       # chunking presets, see profiles.py
+
+Catalog entries are written in batches (--catalog-every documents per
+write), and a running server picks them up through the shared catalog.
+A document whose entry was not written yet (the run was killed) is
+simply ingested again on the next run.
+"""
+import argparse
+import hashlib
 import os
+import shutil
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List
+
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings  # <-- NEW IMPORT
-from langchain_community.vectorstores import FAISS
 
-DB_FAISS_PATH = 'faiss_index' # Folder to save the vector store
+# Load .env first - the modules below, the settings here and the CLI option defaults read the environment
+load_dotenv()
+
+from pdf_extract import PageExtractor, PageTextCache
+from profiles import DEFAULT_EMBEDDING_MODEL, IndexingProfile, load_profiles
+from storage import DocumentStore
+
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "document_store")
+
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def collect_pdfs(paths: List[str], manifest: str = None) -> List[str]:
+    """Expands directories (recursively) and manifest files into a list of PDF paths."""
+    candidates = list(paths)
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as f:
+            candidates += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    pdfs = []
+    for path in candidates:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                pdfs += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf")]
+        else:
+            pdfs.append(path)
+    return list(dict.fromkeys(pdfs))
+
+
+_page_cache = None  # one per worker process, opened by _init_worker
+
+
+def _init_worker(page_cache_path: str):
+    global _page_cache
+    _page_cache = PageTextCache(page_cache_path)
+
+
+def parse_pdf(path: str, file_hash: str, profile: IndexingProfile, mode: str) -> Dict:
+    """Runs in a worker process: load + split one PDF (documents are already spread over processes - pages aren't)."""
+    extractor = PageExtractor(workers=1, mode=mode, cache=_page_cache)
+    docs = list(extractor.iter_pages(path, file_hash=file_hash))
+    chunks = profile.make_splitter().split_documents(docs)
+    return {
+        "path": path,
+        "pages": len(docs),
+        "texts": [chunk.page_content for chunk in chunks],
+        "metadatas": [chunk.metadata for chunk in chunks],
+    }
+
+
+def load_embeddings(store_path: str):
+    from embedding_backends import cache_model_name, load_embeddings as load_backend
+    from embedding_cache import CachedEmbeddings
+
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    return CachedEmbeddings(
+        load_backend(backend, EMBEDDING_MODEL),
+        model_name=cache_model_name(backend, EMBEDDING_MODEL),
+        path=os.getenv("EMBEDDING_CACHE_PATH", os.path.join(store_path, "embedding_cache.sqlite3")),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000)),
+    )
+
+
+class BulkIngestor:
+    """Embeds chunks from many documents in shared batches and writes each finished document."""
+
+    def __init__(self, store: DocumentStore, embeddings, batch_size: int, profile: IndexingProfile, catalog_every: int = 100):
+        self.store = store
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.profile = profile
+        self.catalog_every = catalog_every
+        self.entries: Dict[str, Dict] = {}  # doc_id -> catalog entry not written yet
+        self.documents: Dict[str, Dict] = {}  # doc_id -> parsed doc + vectors
+        self.queue = []  # (doc_id, chunk_index, text) waiting for the next batch
+        self.pages = 0
+        self.chunks = 0
+        self.completed = 0
+
+    def add(self, doc_id: str, file_hash: str, parsed: Dict):
+        texts = parsed["texts"]
+        if not texts:
+            self.add_error(doc_id, parsed["path"], file_hash, "No extractable text found in this PDF.")
+            return
+        self.documents[doc_id] = {**parsed, "file_hash": file_hash, "vectors": [None] * len(texts), "remaining": len(texts)}
+        self.queue += [(doc_id, i, text) for i, text in enumerate(texts)]
+        self.flush()
+
+    def add_error(self, doc_id: str, path: str, file_hash: str, error: str):
+        """Records a file that cannot be indexed - later runs skip it unless --retry-errors."""
+        self._record(doc_id, filename=os.path.basename(path), status="error", file_hash=file_hash,
+                     profile=self.profile.to_dict(), error=error)
+
+    def flush(self, force: bool = False):
+        while len(self.queue) >= self.batch_size or (force and self.queue):
+            batch = self.queue[:self.batch_size]
+            del self.queue[:self.batch_size]
+            vectors = self.embeddings.embed_documents([text for _, _, text in batch])
+            for (doc_id, i, _), vector in zip(batch, vectors):
+                doc = self.documents[doc_id]
+                doc["vectors"][i] = vector
+                doc["remaining"] -= 1
+                if doc["remaining"] == 0:
+                    self._write(doc_id)
+
+    def _write(self, doc_id: str):
+        from index_engine import build_vector_store
+
+        doc = self.documents.pop(doc_id)
+        # Output of a run that was killed before its catalog write - not referenced by the catalog, replaced here
+        if doc_id not in self.store:
+            shutil.rmtree(os.path.join(self.store.root, doc_id), ignore_errors=True)
+        vector_store = build_vector_store(zip(doc["texts"], doc["vectors"]), self.embeddings, metadatas=doc["metadatas"])
+        version = self.store.save_index(doc_id, vector_store)
+        self._record(
+            doc_id,
+            index_version=version,
+            filename=os.path.basename(doc["path"]),
+            status="ready",
+            file_hash=doc["file_hash"],
+            pages_total=doc["pages"],
+            pages_indexed=doc["pages"],
+            chunks_total=len(doc["texts"]),
+            profile=self.profile.to_dict(),
+        )
+        self.pages += doc["pages"]
+        self.chunks += len(doc["texts"])
+        self.completed += 1
+
+    def _record(self, doc_id: str, **entry):
+        # Every catalog write rewrites the whole catalog.json - write them in batches
+        self.entries[doc_id] = entry
+        if len(self.entries) >= self.catalog_every:
+            self.write_catalog()
+
+    def write_catalog(self):
+        if self.entries:
+            self.store.add_many(self.entries)
+            self.entries = {}
+
 
 def main():
-    # Load .env file (for the GROQ key later, not needed now)
-    load_dotenv()
-    
-    # 1. Load the PDF
-    print("Loading PDF...")
-    loader = PyPDFLoader("test.pdf")
-    docs = loader.load()
-
-    # 2. Chunk the PDF
-    print("Splitting document into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(docs)
-
-    print(f"\nSuccessfully loaded 'test.pdf' and split it into {len(chunks)} chunks.")
-
-    # 3. Create Embeddings (Locally!)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="PDF files or directories (default: test.pdf)")
+    parser.add_argument("--manifest", help="Text file with one PDF path (or directory) per line")
+    parser.add_argument("--store", default=DOCUMENT_STORE_PATH, help="Document store folder the server reads")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF parsing processes")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch (across documents)")
+    parser.add_argument("--catalog-every", type=int, default=100, help="Documents per catalog.json write")
+    parser.add_argument("--retry-errors", action="store_true", help="Ingest files that failed in an earlier run again")
+    parser.add_argument("--profile", default=os.getenv("DEFAULT_INDEXING_PROFILE", "default"), help="Indexing profile (chunking preset)")
+    parser.add_argument("--chunk-size", type=int, help="Override the profile's chunk size")
+    parser.add_argument("--chunk-overlap", type=int, help="Override the profile's chunk overlap")
+    parser.add_argument("--extraction-mode", default=os.getenv("PDF_EXTRACTION_MODE", "plain"), choices=("plain", "layout"))
+    args = parser.parse_args()
+
+    try:
+        profiles = load_profiles(os.getenv("INDEXING_PROFILES"))
+        if args.profile not in profiles:
+            parser.error(f"unknown profile '{args.profile}' (available: {', '.join(profiles)})")
+        profile = profiles[args.profile]
+        overrides = {key: value for key, value in (("chunk_size", args.chunk_size), ("chunk_overlap", args.chunk_overlap)) if value is not None}
+        if overrides:
+            profile = profile.replace(**overrides)
+    except ValueError as e:
+        parser.error(str(e))
+    if profile.embedding_model != EMBEDDING_MODEL:
+        parser.error(f"profile '{profile.name}' uses {profile.embedding_model}; the server embeds queries with {EMBEDDING_MODEL}")
+
+    pdfs = collect_pdfs(args.paths or ([] if args.manifest else ["test.pdf"]), args.manifest)
+    store = DocumentStore(args.store)
+
+    # Resume: skip files whose exact content is already indexed - or already failed, unless retrying those
+    skipped_statuses = ("ready",) if args.retry_errors else ("ready", "error")
+    already_done = {entry.get("file_hash") for _, entry in store.items() if entry.get("status") in skipped_statuses}
+    todo = []
+    queued_hashes = set()
+    for path in pdfs:
+        file_hash = file_sha256(path)
+        if file_hash in already_done or file_hash in queued_hashes:
+            continue
+        queued_hashes.add(file_hash)  # identical files within this run are ingested once
+        todo.append((path, file_hash))
+    print(f"📚 {len(pdfs)} PDF(s) found, {len(pdfs) - len(todo)} already indexed, failed before or duplicate, {len(todo)} to ingest")
+    if not todo:
+        return
+
+    page_cache_path = os.getenv("PAGE_CACHE_PATH", os.path.join(args.store, "page_cache.sqlite3"))
     print("Loading local embedding model (this may take a moment the first time)...")
-    # We use a popular, fast, and small model
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # 4. Create Vector Store and save it
-    print("Creating FAISS vector store...")
-    vectorstore = FAISS.from_documents(chunks, embedding=embeddings)
-    
-    # Save the vector store locally
-    vectorstore.save_local(DB_FAISS_PATH)
-    
+    print(f"Indexing profile: {profile}")
+    ingestor = BulkIngestor(store, load_embeddings(args.store), args.batch_size, profile, args.catalog_every)
+
+    start = time.perf_counter()
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(page_cache_path,)) as pool:
+            remaining = iter(todo)
+            in_flight = {}
+
+            def submit_next():
+                item = next(remaining, None)
+                if item:
+                    path, file_hash = item
+                    in_flight[pool.submit(parse_pdf, path, file_hash, profile, args.extraction_mode)] = item
+
+            # Keep a bounded number of parsed documents waiting for the encoder
+            for _ in range(args.workers * 2):
+                submit_next()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, file_hash = in_flight.pop(future)
+                    # Deterministic id: a re-run after a crash overwrites half-written output instead of duplicating it
+                    doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"sha256:{file_hash}"))
+                    try:
+                        parsed = future.result()
+                    except Exception as e:
+                        # Unreadable or encrypted PDF - no point parsing it again on the next run
+                        failed += 1
+                        print(f"❌ {path}: {e}")
+                        ingestor.add_error(doc_id, path, file_hash, f"Could not read PDF: {e}")
+                        submit_next()
+                        continue
+                    try:
+                        ingestor.add(doc_id, file_hash, parsed)
+                    except Exception as e:
+                        failed += 1
+                        print(f"❌ {path}: {e}")
+                    submit_next()
+
+                elapsed = time.perf_counter() - start
+                print(f"   {ingestor.completed}/{len(todo)} docs | {ingestor.pages / elapsed:.1f} pages/s | {ingestor.chunks / elapsed:.1f} chunks/s")
+
+        ingestor.flush(force=True)
+    finally:
+        # Interrupted or done: record what was indexed so far
+        ingestor.write_catalog()
+    elapsed = time.perf_counter() - start
+
     print(f"\n--- SUCCESS! ---")
-    print(f"Vector store created from {len(chunks)} chunks and saved locally in '{DB_FAISS_PATH}' folder.")
+    print(f"Ingested {ingestor.completed} document(s), {ingestor.pages} pages, {ingestor.chunks} chunks in {elapsed:.1f}s "
+          f"({ingestor.pages / elapsed:.1f} pages/s, {ingestor.chunks / elapsed:.1f} chunks/s). Failed: {failed}")
+    print(f"Indexes saved in '{args.store}' - the server will load them on first query.")
     print("------------------")
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
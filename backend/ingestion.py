@@ -0,0 +1,151 @@
+"""
+Ingestion scheduler: runs PDF processing jobs off the event loop.
+
+Jobs go into a bounded FIFO queue and are picked up by a fixed number of
+workers. Each worker hands the (synchronous) job to a thread pool, so
+parsing/embedding never blocks /chat, /chat/stream or /health.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+
+class IngestionJob:
+    """A single unit of ingestion work plus its cancellation flag and progress."""
+
+    def __init__(self, job_id: str, func: Callable, args: tuple, on_progress: Optional[Callable] = None):
+        self.job_id = job_id
+        self.func = func
+        self.args = args
+        self.progress: Dict = {}
+        self._cancel_event = threading.Event()
+        self._on_progress = on_progress
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        """Call between stages - aborts the job if it was cancelled."""
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def report(self, **progress):
+        """Record progress (pages parsed, chunks embedded, ...) for this job."""
+        self.progress.update(progress)
+        if self._on_progress:
+            self._on_progress(self.job_id, dict(self.progress))
+
+    def run(self):
+        # The job function always runs (even if cancelled while queued) so it
+        # can clean up its temp files; it should call check_cancelled() first.
+        return self.func(self, *self.args)
+
+
+class IngestionScheduler:
+    """Bounded worker pool with a FIFO job queue, backpressure and cancellation."""
+
+    def __init__(self, max_workers: int = 1, max_queue_size: int = 16, on_progress: Optional[Callable] = None):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.on_progress = on_progress
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = []
+        self._jobs: Dict[str, IngestionJob] = {}  # queued + running jobs
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    async def stop(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Let jobs that never started run their (cancelled) cleanup, e.g. removing spool files
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            try:
+                job.run()
+            except JobCancelled:
+                pass
+            self._jobs.pop(job.job_id, None)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, job_id: str, func: Callable, *args) -> IngestionJob:
+        """Queue a job. Raises QueueFullError when the queue is at capacity."""
+        job = IngestionJob(job_id, func, args, on_progress=self.on_progress)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Ingestion queue is full ({self.max_queue_size} jobs waiting)")
+        self._jobs[job_id] = job
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if the job is unknown/finished."""
+        job = self._jobs.get(job_id)
+        if not job:
+            return False
+        job.cancel()
+        return True
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position of a job still waiting in the queue, else None."""
+        if not self._queue:
+            return None
+        for position, job in enumerate(list(self._queue._queue), start=1):
+            if job.job_id == job_id:
+                return position
+        return None
+
+    def __contains__(self, job_id: str) -> bool:
+        """Is this job queued or running?"""
+        return job_id in self._jobs
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def active_jobs(self) -> int:
+        return len(self._jobs) - self.queue_depth
+
+    def stats(self) -> Dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+            "queued": self.queue_depth,
+            "active": self.active_jobs,
+        }
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                await loop.run_in_executor(self._executor, job.run)
+            except JobCancelled:
+                print(f"🛑 Ingestion job cancelled: {job.job_id}")
+            except Exception as e:
+                print(f"❌ Ingestion job failed: {job.job_id}: {e}")
+            finally:
+                self._jobs.pop(job.job_id, None)
+                self._queue.task_done()
@@ -0,0 +1,426 @@
+"""
+Gateway between the chat endpoints and the upstream LLM (Groq).
+
+On its own, ChatGroq retries every throttled request after the same backoff.
+A burst that hits the quota turns into a retry storm, and an outage fails
+every request until it ends. LLMGateway wraps the model. It is a chat model
+itself, so chains and astream work unchanged. It adds:
+
+- Rate limiting. Token buckets for requests/minute, requests/day and
+  tokens/minute are sized to the account's quota. A caller reserves its
+  share and sleeps until it is covered instead of being rejected upstream.
+  A 429's Retry-After pauses every caller, and the token estimate is
+  corrected with the usage Groq reports.
+- A concurrency cap. At most max_concurrency requests go upstream; the rest
+  queue.
+- Retries with jittered backoff for 429s, 5xx and connection errors. A
+  stream is only retried before its first token.
+- A circuit breaker. After failure_threshold consecutive failures, calls
+  skip Groq for reset_timeout_s. Then one probe request decides whether the
+  breaker closes again.
+- A fallback model (the local flan-t5), loaded on first use. It answers
+  while the breaker is open, when Groq keeps failing, and when a request
+  would wait longer than max_queue_wait_s for its turn.
+
+Without a fallback those cases raise LLMUnavailable, which carries a
+Retry-After for the 503. Callers that keep answers (the answer cache) call
+watch_fallback() first and skip storing what the fallback produced. Connection pooling comes from the shared httpx
+client that the caller hands to the primary model.
+"""
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from prompt_budget import estimate_tokens
+
+try:
+    import groq
+    _TRANSIENT_ERRORS = (httpx.TransportError, asyncio.TimeoutError, groq.APIConnectionError)
+except ImportError:  # only used to recognise Groq's connection errors
+    _TRANSIENT_ERRORS = (httpx.TransportError, asyncio.TimeoutError)
+
+EXPECTED_COMPLETION_TOKENS = 200  # reserved per call on top of the prompt, until Groq reports the real usage
+MAX_BACKOFF_S = 8.0
+
+
+class FallbackUse:
+    """Set by the gateway when the fallback model answered a call made after watch_fallback()."""
+
+    def __init__(self):
+        self.used = False
+
+
+_fallback_use: ContextVar[Optional[FallbackUse]] = ContextVar("llm_fallback_use", default=None)
+
+
+def watch_fallback() -> FallbackUse:
+    """Watches LLM calls made from now on in this task (and tasks it starts); .used says if the fallback answered any."""
+    use = FallbackUse()
+    _fallback_use.set(use)
+    return use
+
+
+class LLMUnavailable(Exception):
+    """Neither the upstream LLM nor a fallback can answer right now."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Throttled(Exception):
+    """Waiting for a rate-limit share or a concurrency slot would take longer than allowed."""
+
+    def __init__(self, wait_s: float):
+        super().__init__(f"rate limited for {wait_s:.1f}s")
+        self.wait_s = wait_s
+
+
+class _PrimaryUnavailable(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """capacity units refilled at rate_per_s. Reservations may take the level below zero - that is the queue."""
+
+    def __init__(self, capacity: float, rate_per_s: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity, self.rate, self.clock = capacity, rate_per_s, clock
+        self.level = float(capacity)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes amount (at most a full bucket) now; returns the seconds until it is actually covered."""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def credit(self, amount: float):
+        """Gives back a reservation (negative: takes more, e.g. when the real usage was higher)."""
+        self._refill()
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class RateLimiter:
+    """Requests/minute, requests/day and tokens/minute buckets (0 disables one). Meant for a single event loop."""
+
+    def __init__(self, requests_per_minute: float = 0, requests_per_day: float = 0, tokens_per_minute: float = 0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.request_buckets = [TokenBucket(limit, limit / period, clock)
+                                for limit, period in ((requests_per_minute, 60), (requests_per_day, 86400)) if limit]
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60, clock) if tokens_per_minute else None
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Upstream said Retry-After: nobody is admitted before then."""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def reserve(self, tokens: float, max_wait: float) -> float:
+        """Reserves one request and `tokens`; returns the wait. Raises Throttled (reserving nothing) past max_wait."""
+        wait = max(0.0, self.paused_until - self.clock())
+        for bucket in self.request_buckets:
+            wait = max(wait, bucket.reserve(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        if wait > max_wait:
+            self.release(tokens)
+            raise Throttled(wait)
+        return wait
+
+    def release(self, tokens: float):
+        for bucket in self.request_buckets:
+            bucket.credit(1)
+        if self.token_bucket:
+            self.token_bucket.credit(tokens)
+
+    def correct(self, reserved: float, used: float):
+        if self.token_bucket:
+            self.token_bucket.credit(reserved - used)
+
+    async def acquire(self, tokens: float, max_wait: float):
+        deadline = self.clock() + max_wait
+        wait = self.reserve(tokens, max_wait)
+        try:
+            await asyncio.sleep(wait)
+            # A 429 that arrived while we slept pauses us too
+            while self.paused_until > self.clock():
+                if self.paused_until > deadline:
+                    raise Throttled(self.paused_until - self.clock())
+                await asyncio.sleep(self.paused_until - self.clock())
+        except BaseException:
+            self.release(tokens)
+            raise
+
+    def stats(self) -> Dict:
+        for bucket in self.request_buckets + ([self.token_bucket] if self.token_bucket else []):
+            bucket._refill()
+        return {
+            "requests_available": [round(bucket.level, 1) for bucket in self.request_buckets],
+            "tokens_available": round(self.token_bucket.level) if self.token_bucket else None,
+            "paused_for_s": round(max(0.0, self.paused_until - self.clock()), 1),
+        }
+
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold consecutive failures -> half_open (one probe) after reset_timeout_s."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold, self.reset_timeout_s, self.clock = failure_threshold, reset_timeout_s, clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self.opened_at >= self.reset_timeout_s else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 1.0
+        return max(1.0, self.opened_at + self.reset_timeout_s - self.clock())
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print("✅ LLM circuit breaker closed - upstream is answering again")
+        self.failures, self.opened_at, self.probing = 0, None, False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+                print(f"⚡ LLM circuit breaker open after {self.failures} failure(s) - skipping upstream for {self.reset_timeout_s}s")
+            self.opened_at = self.clock()
+        self.probing = False
+
+    def release(self):
+        """A probe ended without telling us anything (cancelled) - let the next request probe."""
+        self.probing = False
+
+
+def _status(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _used_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _text(output) -> str:
+    return output if isinstance(output, str) else output.content
+
+
+class LLMGateway(BaseChatModel):
+    """Rate-limited, concurrency-capped, circuit-broken access to `primary`, with a lazily loaded fallback."""
+    primary: Any
+    fallback_factory: Optional[Callable[[], Any]] = None  # builds the fallback model (runs once, on a thread)
+    limiter: Any
+    breaker: Any
+    max_concurrency: int = 4
+    max_queue_wait_s: float = 10.0
+    max_attempts: int = 3
+    backoff_s: float = 0.5
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def model_post_init(self, __context):
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._fallback = None
+        self._fallback_lock = asyncio.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        self._counts = {"upstream": 0, "retried": 0, "throttled": 0, "failed": 0, "fallback": 0, "rejected": 0}
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    # --- Admission ---
+    async def _admit(self, tokens: float):
+        """Breaker, then rate limit, then a concurrency slot - all within max_queue_wait_s."""
+        if not self.breaker.allow():
+            raise _PrimaryUnavailable("circuit breaker open", self.breaker.retry_after())
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            await self.limiter.acquire(tokens, self.max_queue_wait_s)
+            remaining = self.max_queue_wait_s - (time.monotonic() - started)
+            await asyncio.wait_for(self._slots.acquire(), max(remaining, 0.001))
+        except Throttled as e:
+            self.breaker.release()
+            raise _PrimaryUnavailable(f"upstream busy ({e})", e.wait_s) from None
+        except asyncio.TimeoutError:
+            self.breaker.release()
+            self.limiter.release(tokens)
+            raise _PrimaryUnavailable(f"all {self.max_concurrency} upstream slots busy", self.max_queue_wait_s) from None
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        self._counts["upstream"] += 1
+
+    def _done(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    def _failed(self, error: Exception, attempt: int) -> float:
+        """Books a failed attempt. Returns the delay before retrying, or raises when retrying makes no sense."""
+        status = _status(error)
+        if status == 429:
+            self._counts["throttled"] += 1
+            # Upstream is healthy, we're over quota: hold everyone back instead of counting it as an outage
+            self.breaker.release()
+            delay = _retry_after(error) or self.backoff_s * 2 ** attempt
+            self.limiter.pause(delay)
+            if delay > self.max_queue_wait_s:
+                raise _PrimaryUnavailable(f"rate limited upstream for {delay:.0f}s", delay) from error
+        elif (status is not None and status >= 500) or (status is None and isinstance(error, _TRANSIENT_ERRORS)):
+            self._counts["failed"] += 1
+            self.breaker.record_failure()
+            delay = min(MAX_BACKOFF_S, self.backoff_s * 2 ** attempt)
+        else:
+            self.breaker.record_success()  # it answered - the request itself is wrong
+            raise error
+        if attempt + 1 >= self.max_attempts or self.breaker.state != "closed":
+            raise _PrimaryUnavailable(f"upstream failing ({type(error).__name__}: {error})", self.breaker.retry_after()) from error
+        self._counts["retried"] += 1
+        print(f"🔁 LLM call failed ({status or type(error).__name__}) - retrying in {delay:.1f}s")
+        return delay * (0.5 + random.random())
+
+    def _succeeded(self, reserved: float, used: Optional[int]):
+        self.breaker.record_success()
+        if used:
+            self.limiter.correct(reserved, used)
+
+    async def _fallback_model(self, reason: _PrimaryUnavailable):
+        if self.fallback_factory is None:
+            self._counts["rejected"] += 1
+            raise LLMUnavailable(f"LLM unavailable: {reason}", reason.retry_after)
+        async with self._fallback_lock:
+            if self._fallback is None:
+                print(f"🛟 Loading fallback LLM ({reason})...")
+                try:
+                    self._fallback = await asyncio.to_thread(self.fallback_factory)
+                except Exception as e:
+                    self._counts["rejected"] += 1
+                    raise LLMUnavailable(f"LLM unavailable: {reason}; fallback failed to load: {e}", reason.retry_after) from e
+        self._counts["fallback"] += 1
+        use = _fallback_use.get()
+        if use is not None:
+            use.used = True
+        print(f"🛟 Answering with the fallback LLM ({reason})")
+        return self._fallback
+
+    # --- Chat model interface ---
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # The app only calls the model asynchronously; sync callers go straight to the primary model
+        return self.primary._generate(messages, stop=stop, **kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reserved = sum(estimate_tokens(str(message.content)) for message in messages) + EXPECTED_COMPLETION_TOKENS
+        try:
+            for attempt in range(self.max_attempts):
+                await self._admit(reserved)
+                try:
+                    result = await self.primary._agenerate(messages, stop=stop, **kwargs)
+                except Exception as e:
+                    delay = self._failed(e, attempt)
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                else:
+                    self._succeeded(reserved, _used_tokens(result.generations[0].message))
+                    return result
+                finally:
+                    self._done()
+                await asyncio.sleep(delay)
+        except _PrimaryUnavailable as reason:
+            fallback = await self._fallback_model(reason)
+            answer = await fallback.ainvoke(messages, stop=stop)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=_text(answer)))])
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        return self.primary._stream(messages, stop=stop, **kwargs)
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reserved = sum(estimate_tokens(str(message.content)) for message in messages) + EXPECTED_COMPLETION_TOKENS
+        try:
+            for attempt in range(self.max_attempts):
+                await self._admit(reserved)
+                started, used = False, None
+                try:
+                    async for chunk in self.primary._astream(messages, stop=stop, **kwargs):
+                        started = True
+                        used = _used_tokens(chunk.message) or used
+                        yield chunk
+                except Exception as e:
+                    if started:  # part of the answer is out - no retry or fallback possible
+                        self.breaker.record_failure()
+                        raise
+                    delay = self._failed(e, attempt)
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                else:
+                    self._succeeded(reserved, used)
+                    return
+                finally:
+                    self._done()
+                await asyncio.sleep(delay)
+        except _PrimaryUnavailable as reason:
+            fallback = await self._fallback_model(reason)
+            async for piece in fallback.astream(messages, stop=stop):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=_text(piece)))
+
+    def stats(self) -> Dict:
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "fallback_loaded": self._fallback is not None,
+            "rate_limit": self.limiter.stats(),
+            **self._counts,
+        }
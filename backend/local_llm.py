@@ -0,0 +1,139 @@
+"""
+Local seq2seq LLM (flan-t5) with dynamic micro-batching.
+
+Replaces HuggingFacePipeline for local mode: concurrent prompts are
+grouped by a MicroBatcher and answered by one padded model.generate call.
+Streaming requests ride in the same batch - a per-row streamer decodes each
+row's new tokens as they are generated and hands the text deltas back to
+that row's caller.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from transformers.generation.streamers import BaseStreamer
+
+from batching import MicroBatcher
+
+
+class GenerationRequest:
+    def __init__(self, prompt: str, on_text: Optional[Callable[[str], None]] = None):
+        self.prompt = prompt
+        self.on_text = on_text  # called from the model thread with each new piece of text
+
+
+class _RowStreamer(BaseStreamer):
+    """Streams every row of a batched generate separately (TextStreamer only handles batch size 1)."""
+
+    def __init__(self, tokenizer, callbacks: List[Optional[Callable[[str], None]]]):
+        self.tokenizer = tokenizer
+        self.callbacks = callbacks
+        self.tokens: List[List[int]] = [[] for _ in callbacks]
+        self.sent: List[int] = [0] * len(callbacks)  # characters already handed out per row
+        self.first = True
+
+    def put(self, value):
+        if self.first:
+            # The first call carries the decoder start tokens, not generated text
+            self.first = False
+            return
+        for row, token_id in enumerate(value.reshape(len(self.callbacks), -1)[:, -1].tolist()):
+            if self.callbacks[row] is None:
+                continue
+            self.tokens[row].append(token_id)
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            # Hold back text ending in a partial character until it is complete
+            if text.endswith("�"):
+                continue
+            if len(text) > self.sent[row]:
+                self.callbacks[row](text[self.sent[row]:])
+                self.sent[row] = len(text)
+
+    def end(self):
+        pass
+
+
+class Seq2SeqGenerator:
+    """Runs one greedy, padded generate for a batch of prompts."""
+
+    def __init__(self, model, tokenizer, max_new_tokens: int = 256):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+
+    def generate(self, requests: List[GenerationRequest]) -> List[str]:
+        import torch
+
+        inputs = self.tokenizer([request.prompt for request in requests], return_tensors="pt", padding=True)
+        callbacks = [request.on_text for request in requests]
+        streamer = _RowStreamer(self.tokenizer, callbacks) if any(callbacks) else None
+        with torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,  # Greedy decoding = faster
+                streamer=streamer,
+            )
+        return self.tokenizer.batch_decode(output, skip_special_tokens=True)
+
+
+class BatchedSeq2SeqLLM(LLM):
+    """LangChain LLM whose async calls (ainvoke/astream) share batched generate calls."""
+
+    generator: Any
+    batcher: Any
+
+    @classmethod
+    def from_model(cls, model, tokenizer, max_new_tokens: int = 256, max_batch_size: int = 8, max_wait_ms: float = 10):
+        generator = Seq2SeqGenerator(model, tokenizer, max_new_tokens)
+        return cls(
+            generator=generator,
+            batcher=MicroBatcher(generator.generate, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name="llm-batch"),
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "batched_seq2seq"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": getattr(self.generator.model, "name_or_path", None), **self.batcher.stats()}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> str:
+        # Sync callers (e.g. /debug/model) bypass the batcher
+        return self.generator.generate([GenerationRequest(prompt)])[0]
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> str:
+        return await self.batcher.submit(GenerationRequest(prompt))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> Iterator[GenerationChunk]:
+        yield GenerationChunk(text=self._call(prompt, stop, run_manager, **kwargs))
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> AsyncIterator[GenerationChunk]:
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+
+        def on_text(text: str):
+            loop.call_soon_threadsafe(deltas.put_nowait, text)
+
+        result = asyncio.ensure_future(self.batcher.submit(GenerationRequest(prompt, on_text)))
+        # Deltas are scheduled before the result is set, so None always arrives last
+        result.add_done_callback(lambda _: deltas.put_nowait(None))
+        try:
+            while True:
+                text = await deltas.get()
+                if text is None:
+                    break
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    await run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+            await result  # surfaces generation errors
+        finally:
+            if not result.done():
+                result.cancel()
+
+    def stats(self) -> Dict:
+        return self.batcher.stats()
@@ -1,51 +1,482 @@
+import time
+_PROCESS_STARTED = time.perf_counter()  # import time and time-to-ready are measured from here
+
 import os
 import uuid
-import tempfile
 from datetime import datetime
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException
+# Before the project imports below - index_engine, retrieval, bm25, metrics, ... read their settings at import time
+load_dotenv()
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, AsyncGenerator
-import json
+from typing import List, AsyncGenerator, Optional
 import asyncio
+import math
+import re
 
 # LangChain imports (modern 1.x style)
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFacePipeline
-from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
+# Model libraries (langchain_groq, transformers/torch, sentence-transformers) are imported lazily in
+# _load_models, and only for the backend actually selected
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+from langchain_core.documents import Document
 
 # --- CONVERSATIONAL MEMORY IMPORTS ---
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import MessagesPlaceholder
 
-# Utility to turn list[Document] into a string for the prompt
-def _format_docs(docs):
-    return "\n\n".join(d.page_content for d in docs)
-# -----------------------------------------------
+# --- Ingestion scheduler (runs PDF processing off the event loop) ---
+from ingestion import IngestionScheduler, QueueFullError, JobCancelled
 
-# --- Load Environment Variables ---
-load_dotenv()
+# --- Persistent document store (indexes + metadata catalog on disk) ---
+from storage import DocumentStore, IN_FLIGHT_STATUSES, MULTI_WORKER_SUPPORTED, chunk_documents
+from index_cache import IndexCache
+from embedding_cache import CachedEmbeddings
+from embedding_backends import load_embeddings, cache_model_name
+from index_engine import IncrementalIndex, describe_index
+from uploads import spool_upload, check_page_limit
+from retrieval import retrieve_across, shared_indexes
+from answer_cache import SemanticAnswerCache
+from singleflight import SingleFlight, request_fingerprint
+from query_service import QueryService, StageTimings
+from query_rewrite import REWRITE_STRATEGIES, expand_follow_up, rewrite_strategy, same_question
+from warmup import Warmup
+from sse import coalesce_events, with_heartbeats
+from prompt_budget import PromptStats, compact_history, estimate_tokens, pack_context
+from metrics import Trace, registry, span
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable, RateLimiter, watch_fallback
+from pdf_extract import PageExtractor, PageTextCache
+from profiles import DEFAULT_EMBEDDING_MODEL, IndexingProfile, load_profiles, profile_of, rebuild_pages
+
+IMPORT_SECONDS = round(time.perf_counter() - _PROCESS_STARTED, 3)
+print(f"⏱️ Imports done in {IMPORT_SECONDS}s")
+
+# --- Environment Variables (.env was loaded before the imports) ---
 groq_api_key = os.getenv("GROQ_API_KEY")
 
 # Determine which model to use based on environment
 USE_GROQ = groq_api_key is not None
 print(f"🔧 Environment: {'PRODUCTION (Groq)' if USE_GROQ else 'LOCAL (HuggingFace)'}")
 
-# --- Global Variables & In-Memory Storage ---
+# Ingestion settings (keep workers low on the free tier - embedding is CPU bound)
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", 1))
+INGEST_MAX_QUEUE = int(os.getenv("INGEST_MAX_QUEUE", 16))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+# Documents become queryable ("partial") after this many pages, then refresh every PARTIAL_PUBLISH_EVERY pages
+PARTIAL_READY_PAGES = int(os.getenv("PARTIAL_READY_PAGES", 5))
+PARTIAL_PUBLISH_EVERY = int(os.getenv("PARTIAL_PUBLISH_EVERY", 10))
+# Upload limits - enforced while streaming, before any parsing
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", 50))
+MAX_UPLOAD_PAGES = int(os.getenv("MAX_UPLOAD_PAGES", 1000))
+
+# Where per-document indexes and the metadata catalog are persisted
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "document_store")
+# Memory budget for loaded indexes - least recently used ones are dropped (they stay on disk)
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", 256))
+# torch (sentence-transformers), onnx or onnx-int8 - see embedding_backends.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL  # queries are embedded with this one model - every profile must use it
+# Persistent chunk-embedding cache (~1.5KB per entry for all-MiniLM-L6-v2)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(DOCUMENT_STORE_PATH, "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+# PDF text extraction (pdf_extract.py): page ranges on a process pool, text cached per (file hash, page)
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_EXTRACTION_MODE = os.getenv("PDF_EXTRACTION_MODE", "plain")  # or "layout" (keeps columns/tables, slower)
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join(DOCUMENT_STORE_PATH, "page_cache.sqlite3"))
+PAGE_CACHE_MAX_PAGES = int(os.getenv("PAGE_CACHE_MAX_PAGES", 20000))
+# Chunking per document (profiles.py): built-in profiles plus JSON definitions, and the one uploads use by default
+INDEXING_PROFILES = load_profiles(os.getenv("INDEXING_PROFILES"))
+DEFAULT_INDEXING_PROFILE = os.getenv("DEFAULT_INDEXING_PROFILE", "default")
+if DEFAULT_INDEXING_PROFILE not in INDEXING_PROFILES:
+    raise ValueError(f"DEFAULT_INDEXING_PROFILE '{DEFAULT_INDEXING_PROFILE}' is not defined. Available: {', '.join(INDEXING_PROFILES)}")
+# Answers to history-free questions, reused for near-identical questions on the same document(s)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))  # seconds
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))  # cosine similarity of the questions
+# Local LLM micro-batching: concurrent prompts wait up to LLM_BATCH_MAX_WAIT_MS to share one generate call
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", 8))
+LLM_BATCH_MAX_WAIT_MS = float(os.getenv("LLM_BATCH_MAX_WAIT_MS", 10))
+# Groq gateway (llm_gateway.py): client-side quota, concurrency cap, circuit breaker, local fallback
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", 30))  # free tier llama-3.1-8b-instant
+GROQ_REQUESTS_PER_DAY = float(os.getenv("GROQ_REQUESTS_PER_DAY", 14400))
+GROQ_TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", 6000))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 4))
+GROQ_TIMEOUT_S = float(os.getenv("GROQ_TIMEOUT_S", 30))
+LLM_MAX_QUEUE_WAIT_S = float(os.getenv("LLM_MAX_QUEUE_WAIT_S", 10))  # longer than this -> fallback / 503
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", 30))
+LLM_FALLBACK = os.getenv("LLM_FALLBACK", "local")  # "local" (flan-t5, loaded on first use) or "off"
+# Query embedding/search micro-batching for chat requests
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 32))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 2))
+# Follow-up rewriting in /chat/stream: "auto" (heuristics, LLM only when needed, speculative search in parallel),
+# "llm" (always ask the LLM first - the old behaviour) or "off"
+QUERY_REWRITE = os.getenv("QUERY_REWRITE", "auto")
+QUERY_REWRITE_TIMEOUT = float(os.getenv("QUERY_REWRITE_TIMEOUT", 3))  # seconds before the speculative search is used
+# /chat/stream frames: tokens after the first are merged for up to SSE_FLUSH_MS or SSE_FLUSH_BYTES
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", 25))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", 256))
+SSE_HEARTBEAT_S = float(os.getenv("SSE_HEARTBEAT_S", 15))
+# Prompt token budgets: retrieved context, and chat history (recent messages + summary of older turns)
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", 1500))
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", 600))
+HISTORY_WINDOW_MESSAGES = int(os.getenv("HISTORY_WINDOW_MESSAGES", 6))
+
+# --- Global Variables & Storage ---
 embeddings_model = None
 llm = None
-vector_stores = {}  # Stores the FAISS "brains" { "doc_id": faiss_index }
-documents_db = {}   # Stores the metadata { "doc_id": "filename.pdf" }
-processing_status = {}  # Track processing status { "doc_id": {"status": "processing", "filename": "x.pdf"} }
+llm_http_client = None  # pooled connections to Groq, shared by every request
+query_service = None  # batched query embedding + search, created with the embeddings model
+# Models load in the background after startup - /health reports "warming" until they are ready
+warmup = Warmup(started_at=_PROCESS_STARTED)
+warmup.timings["import_s"] = IMPORT_SECONDS
+
+def _require_models():
+    """Chat endpoints answer 503 (with Retry-After) until the background warm-up has finished."""
+    if warmup.state == "warming":
+        raise HTTPException(status_code=503, detail="Models are still loading. Please try again in a few seconds.", headers={"Retry-After": "5"})
+    if warmup.state == "error":
+        raise HTTPException(status_code=503, detail=f"Model loading failed: {warmup.error}")
+# Metadata + processing status for every document { "doc_id": {"filename": "x.pdf", "status": "ready", ...} }
+document_store = DocumentStore(DOCUMENT_STORE_PATH)
+print(f"📚 Document catalog loaded: {len(document_store.catalog)} document(s) in '{DOCUMENT_STORE_PATH}'")
+
+def _spill_index(document_id: str, vector_store):
+    """Eviction hook - make sure an index dropped from memory can be reloaded from disk."""
+    # Shared indexes hold on to the document's chunks - they go with it
+    shared_indexes.invalidate(document_id)
+    # Partial snapshots are simply dropped - the ingestion job will publish a newer one
+    entry = document_store.get(document_id) or {}
+    if entry.get("status") == "ready" and not document_store.has_index(document_id):
+        document_store.publish_index(document_id, document_store.save_index(document_id, vector_store))
+
+# Loaded FAISS "brains" { "doc_id": faiss_index } - LRU, filled lazily from disk
+vector_stores = IndexCache(max_bytes=INDEX_CACHE_MAX_MB * 1024 * 1024, on_evict=_spill_index)
+_index_loads = {}  # doc_id -> in-flight load task, so concurrent misses share one disk read
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+# Identical concurrent chat requests share one LLM generation (protects the Groq quota during bursts)
+chat_flights = SingleFlight()
+prompt_stats = PromptStats()
+# Time to first streamed token, and time from question to retrieved context per rewrite strategy
+stream_timings = StageTimings(("ttft_no_history", "ttft_with_history") + tuple(f"retrieve_{strategy}" for strategy in REWRITE_STRATEGIES))
+
+def _invalidate_document(document_id: str):
+    """A document's index changed - drop everything derived from the old one."""
+    shared_indexes.invalidate(document_id)
+    answer_cache.invalidate(document_id)
+
+def _index_published_elsewhere(document_id: str):
+    """Another worker published a new index for this document - reload it from disk on next use."""
+    vector_stores.pop(document_id)
+    _invalidate_document(document_id)
+
+document_store.on_index_changed = _index_published_elsewhere
+
+def _report_progress(document_id: str, progress: dict):
+    """Called from ingestion workers - merges job progress into the (in-memory) catalog entry."""
+    document_store.update(document_id, persist=False, **progress)
+
+def _load_index(document_id: str):
+    vector_store = document_store.load_index(document_id, embeddings_model)
+    if vector_store is not None:
+        print(f"📂 Loaded index from disk: {document_id}")
+        vector_stores.put(document_id, vector_store)
+    return vector_store
+
+def _check_profile(profile: IndexingProfile) -> IndexingProfile:
+    """400 for profiles this server cannot serve - a query and the chunks it is compared with must share one embedding model."""
+    if profile.embedding_model != EMBEDDING_MODEL:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profile '{profile.name}' uses embedding model '{profile.embedding_model}', but this server embeds queries with '{EMBEDDING_MODEL}'.",
+        )
+    return profile
+
+def _named_profile(name: str) -> IndexingProfile:
+    if name not in INDEXING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown indexing profile '{name}'. Available: {', '.join(INDEXING_PROFILES)}")
+    return _check_profile(INDEXING_PROFILES[name])
+
+def _unavailable_message(document_id: str) -> str:
+    entry = document_store.get(document_id)
+    if entry and entry.get("status") in ("queued", "processing", "partial"):
+        return "Document is still being processed. Please try again in a few seconds."
+    return "Document not found. Please upload it first."
+
+def _target_document_ids(request) -> List[str]:
+    """All documents a chat request asks about: document_id + document_ids + the collection's documents."""
+    document_ids = ([request.document_id] if request.document_id else []) + list(request.document_ids)
+    if request.collection:
+        document_ids += [doc_id for doc_id, entry in document_store.items() if entry.get("collection") == request.collection]
+    return list(dict.fromkeys(document_ids))
+
+async def load_target_stores(request):
+    """
+    Returns ({index_id: vector_store}, error_message) for the documents a request targets.
+    Duplicate uploads resolve to the same index, so it is only searched once.
+    """
+    document_ids = _target_document_ids(request)
+    if not document_ids:
+        return {}, "No document selected. Please upload or select a document first."
+    loaded = await asyncio.gather(*(get_vector_store(doc_id) for doc_id in document_ids))
+    stores = {
+        document_store.resolve(doc_id): store
+        for doc_id, store in zip(document_ids, loaded) if store is not None
+    }
+    if not stores:
+        return {}, _unavailable_message(document_ids[0])
+    return stores, None
+
+def _all_ready(stores: dict) -> bool:
+    return all((document_store.get(doc_id) or {}).get("status") == "ready" for doc_id in stores)
+
+async def search_stores(stores: dict, query: str, k: int, query_vector=None, trace=None):
+    """
+    Top-k chunks for the query - batched single-index search for one document, merged parallel search for many.
+    Pass query_vector when the question is already embedded to skip a second embedding.
+    """
+    if query_vector is None:
+        with span(trace, "embed"):
+            query_vector = await query_service.embed(query)
+    with span(trace, "search"):
+        if len(stores) == 1:
+            return [doc for doc, _ in await query_service.search(next(iter(stores.values())), query_vector, k, query)]
+        start = time.perf_counter()
+        docs = await retrieve_across(stores, embeddings_model, query, k, allow_shared=_all_ready(stores), query_vector=query_vector)
+        query_service.timings.record("search", (time.perf_counter() - start) * 1000)
+        return docs
+
+def _prior_history(request) -> list:
+    """Chat history before this question (the frontend also sends the question itself as the last message)."""
+    history = list(request.chat_history)
+    if history and history[-1].sender == 'user' and history[-1].text.strip() == request.question.strip():
+        history.pop()
+    return history
+
+async def lookup_cached_answer(request, stores: dict, trace=None):
+    """
+    Returns (cached_answer, query_vector). The answer cache only applies to questions without prior chat
+    history on fully indexed documents; query_vector is None when the request isn't cacheable.
+    """
+    if _prior_history(request) or not _all_ready(stores):
+        return None, None
+    with span(trace, "embed"):
+        query_vector = await query_service.embed(request.question)
+    with span(trace, "answer_cache"):
+        cached = answer_cache.lookup(stores, query_vector)
+    if cached is None:
+        return None, query_vector
+    answer, similarity = cached
+    print(f"💾 Answer cache hit (similarity {similarity:.3f})")
+    return answer, query_vector
+
+def _format_docs(docs):
+    """Packs retrieved chunks (best first) into the context budget, dropping repeated / overlapping text."""
+    context, stats = pack_context(docs, PROMPT_CONTEXT_TOKENS)
+    print(f"Packed {stats['chunks_packed']}/{stats['chunks_retrieved']} chunks into {stats['context_tokens']} context tokens "
+          f"({stats['duplicates_dropped']} duplicates, {stats['overlap_chars_trimmed']} overlap chars dropped)")
+    return context
+
+def _history_messages(request) -> list:
+    """Prior chat history as LangChain messages: a recent window, older turns folded into a summary."""
+    history = [(msg.sender, msg.text) for msg in _prior_history(request)]
+    recent, summary = compact_history(history, PROMPT_HISTORY_TOKENS, HISTORY_WINDOW_MESSAGES)
+    messages = [SystemMessage(content=summary)] if summary else []
+    for sender, text in recent:
+        messages.append(HumanMessage(content=text) if sender == 'user' else AIMessage(content=text))
+    return messages
+
+def _count_prompt_tokens(prompt, inputs: dict) -> int:
+    """Estimated size of the prompt actually sent to the LLM; logged and recorded per request."""
+    tokens = estimate_tokens(prompt.invoke(inputs).to_string())
+    prompt_stats.record(tokens)
+    PROMPT_TOKENS.observe(tokens)
+    print(f"Prompt size: ~{tokens} tokens")
+    return tokens
+
+CONTEXTUALIZE_PROMPT = (
+    "You must reformulate the user's question to be standalone. Look at the chat history to understand context.\n\n"
+    "Rules:\n"
+    "1. If the question refers to 'the first one', 'it', 'that', etc., replace with the specific thing from history\n"
+    "2. If history mentions 'projects' and user asks 'what is the first one about?', change to 'what is the first project about?'\n"
+    "3. If no context is needed, return the question unchanged\n"
+    "4. Do NOT answer the question, only reformulate it\n\n"
+    "Return ONLY the reformulated question, nothing else."
+)
+
+def _chunk_text(chunk) -> str:
+    """Streamed text of a chunk - chat models (Groq) yield messages, the local flan-t5 LLM yields plain strings."""
+    return chunk if isinstance(chunk, str) else chunk.content
+
+def _record_ttft(started: float, chat_history: list):
+    stage = "ttft_with_history" if chat_history else "ttft_no_history"
+    stream_timings.record(stage, (time.perf_counter() - started) * 1000)
+
+async def reformulate_question(question: str, chat_history: list) -> str:
+    """LLM rewrite of a follow-up into a standalone question (the question itself if the call fails)."""
+    contextualize_prompt = ChatPromptTemplate.from_messages([
+        ("system", CONTEXTUALIZE_PROMPT),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ])
+    reformulate_chain = contextualize_prompt | llm | StrOutputParser()
+    try:
+        reformulated = (await reformulate_chain.ainvoke({"input": question, "chat_history": chat_history})).strip()
+    except Exception as e:
+        print(f"Error reformulating question, using original: {e}")
+        return question
+    print(f"Original question: {question}")
+    print(f"Reformulated question: {reformulated}")
+    return reformulated or question
+
+def _discard(task: asyncio.Future):
+    """Cancels a task whose result is no longer wanted - without "Task exception was never retrieved" if it already failed."""
+    task.cancel()
+    task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+
+async def retrieve_follow_up(request, stores: dict, chat_history: list, k: int, query_vector=None, trace=None):
+    """
+    Retrieves context for a (possibly follow-up) question; returns (docs, rewrite strategy).
+    Standalone questions are searched as is and simple follow-ups are expanded locally. Only ambiguous ones wait
+    for the LLM rewrite, and even then a speculative search for the expanded question runs alongside it - its
+    results are used when the rewrite changes nothing, fails or takes longer than QUERY_REWRITE_TIMEOUT.
+    """
+    start = time.perf_counter()
+    question = request.question
+    history = [(msg.sender, msg.text) for msg in _prior_history(request)]
+    strategy = "llm" if QUERY_REWRITE == "llm" and history else rewrite_strategy(question, history)
+    if QUERY_REWRITE == "off" and strategy == "llm":
+        strategy = "heuristic"
+    print(f"Query rewrite strategy: {strategy}")
+
+    if strategy == "none":
+        docs = await search_stores(stores, question, k, query_vector=query_vector, trace=trace)
+    elif strategy == "heuristic":
+        docs = await search_stores(stores, expand_follow_up(question, history), k, trace=trace)
+    elif QUERY_REWRITE == "llm":
+        with span(trace, "rewrite"):
+            reformulated = await reformulate_question(question, chat_history)
+        docs = await search_stores(stores, reformulated, k, trace=trace)
+    else:
+        # The two overlap, so their spans add up to more than the wall time
+        speculative = asyncio.ensure_future(search_stores(stores, expand_follow_up(question, history), k, trace=trace))
+        rewrite_started = time.perf_counter()
+        rewrite = asyncio.ensure_future(reformulate_question(question, chat_history))
+        try:
+            reformulated = await asyncio.wait_for(asyncio.shield(rewrite), QUERY_REWRITE_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Rewrite took over {QUERY_REWRITE_TIMEOUT}s - using the speculative search")
+            _discard(rewrite)
+            reformulated = question
+        except BaseException:
+            _discard(speculative)
+            _discard(rewrite)
+            raise
+        if trace is not None:
+            trace.add("rewrite", time.perf_counter() - rewrite_started)
+        if same_question(reformulated, question):
+            docs = await speculative
+        else:
+            _discard(speculative)
+            docs = await search_stores(stores, reformulated, k, trace=trace)
+    stream_timings.record(f"retrieve_{strategy}", (time.perf_counter() - start) * 1000)
+    return docs, strategy
+
+def _flight_key(endpoint: str, request) -> str:
+    """Requests coalesce when they target the same documents with the same question and history."""
+    history = [(msg.sender, msg.text) for msg in request.chat_history]
+    return request_fingerprint(endpoint, _target_document_ids(request), request.question.strip(), history)
+
+def _llm_unavailable(error: LLMUnavailable) -> HTTPException:
+    print(f"❌ {error}")
+    return HTTPException(
+        status_code=503,
+        detail="AI service temporarily unavailable. Please try again shortly.",
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+def _trace_detail(request) -> str:
+    """What the slow-request log prints to identify a chat request."""
+    target = request.document_id or request.collection or ",".join(request.document_ids)
+    return f"[{target}] {request.question[:80]!r}"
+
+def _replay_chunks(answer: str, words_per_chunk: int = 8) -> List[str]:
+    """Splits a cached answer into word groups so the client still renders it as a stream."""
+    words = re.findall(r"\S+\s*", answer)
+    return ["".join(words[i:i + words_per_chunk]) for i in range(0, len(words), words_per_chunk)]
+
+async def get_vector_store(document_id: str):
+    """
+    Returns the FAISS store for a document, loading it from disk on first use.
+    Documents still being ingested are served from their latest partial snapshot.
+    """
+    entry = document_store.get(document_id)
+    if not entry or entry.get("status") not in ("ready", "partial"):
+        return None
+    if entry["status"] == "partial":
+        return vector_stores.get(document_id)
+    # Duplicate uploads share the original document's index
+    document_id = document_store.resolve(document_id)
+    vector_store = vector_stores.get(document_id)
+    if vector_store is not None:
+        return vector_store
+
+    load = _index_loads.get(document_id)
+    if load is None:
+        load = asyncio.ensure_future(asyncio.to_thread(_load_index, document_id))
+        _index_loads[document_id] = load
+        load.add_done_callback(lambda _: _index_loads.pop(document_id, None))
+    # Shielded so a disconnecting client doesn't cancel the load for everyone else
+    return await asyncio.shield(load)
+
+pdf_extractor = PageExtractor(PDF_PARSE_WORKERS, PDF_EXTRACTION_MODE, PageTextCache(PAGE_CACHE_PATH, PAGE_CACHE_MAX_PAGES))
+
+ingestion_scheduler = IngestionScheduler(
+    max_workers=INGEST_MAX_WORKERS,
+    max_queue_size=INGEST_MAX_QUEUE,
+    on_progress=_report_progress,
+)
+
+# --- Metrics (GET /metrics) ---
+# Stage timings come from the traces in the chat and ingestion paths; everything below is read at scrape time.
+PROMPT_TOKENS = registry.histogram("rag_prompt_tokens", "Estimated prompt size sent to the LLM", buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000))
+
+def _embedding_cache_stat(name: str):
+    return getattr(embeddings_model, name) if isinstance(embeddings_model, CachedEmbeddings) else None
+
+def _document_counts() -> dict:
+    counts = {}
+    for _, entry in document_store.items():
+        status = entry.get("status", "ready")
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+registry.gauge("rag_models_ready", "1 once the embedding model and LLM have loaded", lambda: int(warmup.state == "ready"))
+registry.gauge("rag_documents", "Documents in the catalog by status", _document_counts, ("status",))
+registry.gauge("rag_index_cache_resident_bytes", "Memory held by loaded FAISS indexes", lambda: vector_stores.resident_bytes)
+registry.gauge("rag_index_cache_max_bytes", "INDEX_CACHE_MAX_MB in bytes", lambda: vector_stores.max_bytes)
+registry.gauge("rag_index_cache_resident_indexes", "FAISS indexes loaded in memory", lambda: vector_stores.stats()["resident_indexes"])
+registry.gauge("rag_shared_index_resident_bytes", "Memory held by cross-document shared indexes", lambda: shared_indexes.resident_bytes)
+registry.gauge("rag_ingestion_jobs", "Ingestion jobs waiting in the queue / running", lambda: {"queued": ingestion_scheduler.queue_depth, "active": ingestion_scheduler.active_jobs}, ("state",))
+registry.gauge("rag_answer_cache_entries", "Answers held by the semantic answer cache", lambda: answer_cache.stats()["entries"])
+registry.gauge("rag_chat_in_flight", "Chat generations currently running (shared by coalesced requests)", lambda: chat_flights.stats()["in_flight"])
+registry.counter_from("rag_chat_coalesced_total", "Chat requests that joined an identical in-flight generation", lambda: chat_flights.coalesced)
+registry.counter_from("rag_cache_hits_total", "Cache hits", lambda: {"index": vector_stores.hits, "answer": answer_cache.hits, "embedding": _embedding_cache_stat("hits"), "pdf_page": pdf_extractor.cache.hits}, ("cache",))
+registry.counter_from("rag_cache_misses_total", "Cache misses", lambda: {"index": vector_stores.misses, "answer": answer_cache.misses, "embedding": _embedding_cache_stat("misses"), "pdf_page": pdf_extractor.cache.misses}, ("cache",))
+registry.gauge("rag_llm_breaker_open", "1 while the LLM circuit breaker skips Groq (0.5 = probing)",
+               lambda: {"closed": 0, "half_open": 0.5, "open": 1}[llm.breaker.state] if isinstance(llm, LLMGateway) else None)
+registry.gauge("rag_llm_requests", "LLM calls in flight upstream / waiting for a rate-limit share or slot",
+               lambda: {key: llm.stats()[key] for key in ("in_flight", "waiting")} if isinstance(llm, LLMGateway) else {}, ("state",))
+registry.counter_from("rag_llm_calls_total", "LLM gateway calls: sent upstream, retried, throttled (429), failed, answered by the fallback, rejected",
+                      lambda: {key: llm.stats()[key] for key in ("upstream", "retried", "throttled", "failed", "fallback", "rejected")} if isinstance(llm, LLMGateway) else {}, ("result",))
+registry.counter_from("rag_pdf_pages_total", "PDF pages by how their text was obtained",
+                      lambda: {"extracted": pdf_extractor.pages_extracted, "without_text": pdf_extractor.pages_without_text,
+                               "cached": pdf_extractor.pages_from_cache}, ("source",))
+registry.counter_from("rag_cache_evictions_total", "Cache evictions", lambda: {"index": vector_stores.evictions, "answer": answer_cache.evictions, "embedding": _embedding_cache_stat("evictions"), "pdf_page": pdf_extractor.cache.evictions, "shared_index": shared_indexes.evictions}, ("cache",))
 
 # --- Pydantic Models (Defines API Request structure) ---
 class HistoryMessage(BaseModel):
@@ -54,60 +485,117 @@ class HistoryMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     question: str
-    document_id: str
+    document_id: str = ""
+    document_ids: List[str] = []  # search several documents at once...
+    collection: Optional[str] = None  # ...or every document uploaded into a collection
     chat_history: List[HistoryMessage] = [] # <-- UPDATED to accept history
 
+class ReindexRequest(BaseModel):
+    profile: Optional[str] = None  # a named profile (GET /profiles) - default: the one the document has now
+    chunk_size: Optional[int] = None  # ...with any of these settings changed
+    chunk_overlap: Optional[int] = None
+    splitter: Optional[str] = None
+    embedding_model: Optional[str] = None
+
 # --- Server Startup Event ---
 from contextlib import asynccontextmanager
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # This code runs ONCE when the server starts
-    global embeddings_model, llm
-    print("--- Loading models at startup... ---")
-    try:
-        # Load embeddings model
-        embeddings_model = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}  # Force CPU for free tier
+def _load_local_llm():
+    """flan-t5 behind the micro-batcher - the LLM in local mode, and the fallback when Groq is unavailable."""
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    from local_llm import BatchedSeq2SeqLLM
+    model_name = "google/flan-t5-small"  # Small, fast, FREE! (only ~300MB)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    
+    model.eval()
+    
+    # Concurrent requests are micro-batched into one greedy generate call
+    local_llm = BatchedSeq2SeqLLM.from_model(
+        model,
+        tokenizer,
+        max_new_tokens=256,  # Reduced for faster inference
+        max_batch_size=LLM_BATCH_MAX_SIZE,
+        max_wait_ms=LLM_BATCH_MAX_WAIT_MS,
+    )
+    print(f"✅ LLM loaded: {model_name} (100% FREE, no rate limits!) - batching up to {LLM_BATCH_MAX_SIZE} prompts")
+    return local_llm
+
+def _load_models():
+    """Runs on a background thread at startup. Imports only the libraries the selected backends need."""
+    global embeddings_model, llm, llm_http_client, query_service
+    # Load embeddings model
+    with warmup.stage("embeddings"):
+        embeddings_model = CachedEmbeddings(
+            load_embeddings(EMBEDDING_BACKEND, EMBEDDING_MODEL),
+            model_name=cache_model_name(EMBEDDING_BACKEND, EMBEDDING_MODEL),
+            path=EMBEDDING_CACHE_PATH,
+            max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
         )
-        print(f"✅ Embeddings model loaded: all-MiniLM-L6-v2")
-        
-        # Smart model selection based on environment
+        embeddings_model.embed_query("warm up")  # first forward pass allocates buffers - don't make a user wait for it
+    print(f"✅ Embeddings model loaded: {EMBEDDING_MODEL} ({EMBEDDING_BACKEND} backend) in {warmup.timings['embeddings_s']}s")
+    # Concurrent chat queries share one encoder forward pass and one faiss search per index
+    query_service = QueryService(embeddings_model, max_batch_size=QUERY_BATCH_MAX_SIZE, max_wait_ms=QUERY_BATCH_MAX_WAIT_MS)
+    
+    # Smart model selection based on environment
+    with warmup.stage("llm"):
         if USE_GROQ:
             # PRODUCTION: Use Groq API (fast, free tier, no local resources)
             print("🚀 Loading Groq LLM for production...")
-            llm = ChatGroq(
+            import httpx
+            from langchain_groq import ChatGroq
+            llm_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=GROQ_MAX_CONCURRENCY, max_keepalive_connections=GROQ_MAX_CONCURRENCY),
+                timeout=httpx.Timeout(GROQ_TIMEOUT_S, connect=5.0),
+            )
+            groq_llm = ChatGroq(
                 model="llama-3.1-8b-instant",
                 temperature=0,
-                max_retries=3,  # Auto-retry on rate limits
+                max_retries=0,  # retries are paced by the gateway, not by every request on its own
+                http_async_client=llm_http_client,
+            )
+            llm = LLMGateway(
+                primary=groq_llm,
+                fallback_factory=_load_local_llm if LLM_FALLBACK == "local" else None,
+                limiter=RateLimiter(GROQ_REQUESTS_PER_MINUTE, GROQ_REQUESTS_PER_DAY, GROQ_TOKENS_PER_MINUTE),
+                breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S),
+                max_concurrency=GROQ_MAX_CONCURRENCY,
+                max_queue_wait_s=LLM_MAX_QUEUE_WAIT_S,
             )
-            print(f"✅ LLM loaded: Groq (llama-3.1-8b-instant) - 14,400 requests/day FREE!")
+            print(f"✅ LLM loaded: Groq (llama-3.1-8b-instant) - {GROQ_REQUESTS_PER_MINUTE:g} req/min, "
+                  f"{GROQ_MAX_CONCURRENCY} concurrent, fallback: {LLM_FALLBACK}")
         else:
             # LOCAL: Use HuggingFace model (no API, runs on your machine)
             print("🔄 Loading HuggingFace LLM for local development...")
-            model_name = "google/flan-t5-small"  # Small, fast, FREE! (only ~300MB)
-            tokenizer = AutoTokenizer.from_pretrained(model_name)
-            model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-            
-            pipe = pipeline(
-                "text2text-generation",
-                model=model,
-                tokenizer=tokenizer,
-                max_length=256,  # Reduced for faster inference
-                do_sample=False,  # Greedy decoding = faster
-            )
-            
-            llm = HuggingFacePipeline(pipeline=pipe)
-            print(f"✅ LLM loaded: {model_name} (100% FREE, no rate limits!)")
-        
-        print("--- 🚀 Models loaded successfully. Server is ready! ---")
+            llm = _load_local_llm()
+
+async def _warm_up():
+    try:
+        await asyncio.to_thread(_load_models)
+        warmup.ready()
+        print(f"--- 🚀 Models loaded successfully. Ready {warmup.timings['time_to_ready_s']}s after start: {warmup.timings} ---")
     except Exception as e:
+        warmup.failed(e)
         print(f"❌ Error loading models: {e}")
-        raise
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # This code runs ONCE when the server starts - it returns right away, models keep loading in the background
+    # PDF workers are forked first, while this process is still small and has no model threads
+    pdf_extractor.start()
+    await ingestion_scheduler.start()
+    print(f"✅ Ingestion workers started: {INGEST_MAX_WORKERS} worker(s), queue size {INGEST_MAX_QUEUE}")
+    print("--- Loading models in the background (/health reports 'warming' until ready)... ---")
+    warm_task = asyncio.create_task(_warm_up())
     yield
     # This code runs ONCE when the server shuts down (if needed)
     print("--- Server shutting down. ---")
+    await ingestion_scheduler.stop()
+    pdf_extractor.shutdown()
+    if not warm_task.done():
+        warm_task.cancel()
+    if llm_http_client is not None:
+        await llm_http_client.aclose()
 
 # --- FastAPI App Setup ---
 app = FastAPI(lifespan=lifespan)
@@ -143,8 +631,8 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    """Keep the service alive"""
-    return {"status": "alive", "timestamp": str(datetime.now())}
+    """Keep the service alive. status is "warming" while models load in the background, "error" if loading failed."""
+    return {"status": "alive" if warmup.state == "ready" else warmup.state, "models": warmup.status(), "timestamp": str(datetime.now())}
 
 @app.options("/{path:path}")
 async def options_handler(path: str):
@@ -163,6 +651,7 @@ async def options_handler(path: str):
 @app.get("/debug/model")
 async def debug_model():
     """Debug model status - shows which LLM is active"""
+    _require_models()
     try:
         # Test a simple model call
         test_response = llm.invoke("What is 2+2?")
@@ -175,6 +664,7 @@ async def debug_model():
             "test_response": response_text,
             "cost": "FREE" if USE_GROQ else "FREE - No API limits!",
             "rate_limit": "14,400/day" if USE_GROQ else "Unlimited",
+            "batching": llm.stats() if hasattr(llm, "stats") else None,
             "timestamp": str(datetime.now())
         }
     except Exception as e:
@@ -185,6 +675,27 @@ async def debug_model():
             "timestamp": str(datetime.now())
         }
 
+@app.get("/debug/cache")
+def debug_cache():
+    """Cache stats - use these to size INDEX_CACHE_MAX_MB / EMBEDDING_CACHE_MAX_ENTRIES against real traffic"""
+    return {
+        "indexes": vector_stores.stats(),
+        "shared_indexes": shared_indexes.stats(),
+        "answers": answer_cache.stats(),
+        "coalesced_requests": chat_flights.stats(),
+        "queries": query_service.stats() if query_service else None,
+        "embeddings": embeddings_model.stats() if isinstance(embeddings_model, CachedEmbeddings) else None,
+        "prompts": prompt_stats.stats(),
+        "pdf_pages": pdf_extractor.stats(),
+        "llm": llm.stats() if isinstance(llm, LLMGateway) else None,
+        "streaming": stream_timings.stats(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format - per-stage latency histograms, outcomes, memory / queue / cache gauges (this worker only)"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/debug/cors")
 def debug_cors():
     return {"cors": "enabled", "origins": ["*"], "methods": ["*"], "headers": ["*"]}
@@ -195,13 +706,16 @@ async def options_handler(full_path: str):
     return {"message": "OK"}
 
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(file: UploadFile = File(...), collection: Optional[str] = Form(None), profile: Optional[str] = Form(None)):
     """
     Handles PDF file uploads with INSTANT response.
     Processing happens in background - use /documents endpoint to check status.
+    Pass an optional `collection` name to group documents for cross-document chat,
+    and an optional indexing `profile` (see GET /profiles) to choose how it is chunked.
     """
     if not file.filename:
         return {"error": "No file name provided."}
+    indexing_profile = _named_profile(profile or DEFAULT_INDEXING_PROFILE)
 
     print(f"--- Received upload: {file.filename} ---")
     
@@ -209,86 +723,264 @@ async def upload_document(file: UploadFile = File(...)):
         # Generate ID immediately
         document_id = str(uuid.uuid4())
         
-        # Read file content
-        content = await file.read()
-        print(f"📄 File size: {len(content)} bytes")
+        # Stream to a spool file in chunks, hashing on the way (never holds the whole PDF in memory)
+        temp_file_path, file_size, file_hash = await spool_upload(file, max_bytes=MAX_UPLOAD_MB * 1024 * 1024)
+        print(f"📄 File size: {file_size} bytes")
         
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        # Exact duplicate of a file indexed the same way? Reuse its index - no parsing or embedding at all
+        existing_id = document_store.find_ready_by_hash(file_hash, match=lambda entry: profile_of(entry).same_settings(indexing_profile))
+        if existing_id:
+            os.remove(temp_file_path)
+            document_store.add(document_id, file.filename, status="ready", file_hash=file_hash, alias_of=existing_id, collection=collection)
+            print(f"♻️ Duplicate upload - reusing index of {existing_id}")
+            return {
+                "success": True,
+                "document_id": document_id,
+                "filename": file.filename,
+                "message": f"Upload successful! {file.filename} is ready.",
+                "status": "ready",
+                "duplicate_of": existing_id,
+            }
         
-        # Mark as processing
-        processing_status[document_id] = {
-            "status": "processing",
-            "filename": file.filename
-        }
-        documents_db[document_id] = file.filename
+        # Cheap page count (no text extraction) to enforce the page limit up front
+        try:
+            pages_total = await check_page_limit(temp_file_path, MAX_UPLOAD_PAGES)
+        except HTTPException:
+            os.remove(temp_file_path)
+            raise
         
-        # Start background processing
-        asyncio.create_task(process_pdf_background(document_id, temp_file_path, file.filename))
+        # Mark as queued
+        document_store.add(document_id, file.filename, status="queued", file_hash=file_hash, pages_total=pages_total, collection=collection,
+                           profile=indexing_profile.to_dict())
+        
+        # Hand off to the ingestion workers (rejects when the queue is full)
+        try:
+            ingestion_scheduler.submit(document_id, process_pdf_background, document_id, temp_file_path, file.filename, indexing_profile)
+        except QueueFullError as e:
+            print(f"⚠️ Upload rejected: {e}")
+            document_store.remove(document_id)
+            os.remove(temp_file_path)
+            raise HTTPException(
+                status_code=429,
+                detail="Server is busy processing other documents. Please try again shortly.",
+                headers={"Retry-After": "30"},
+            )
         
         # Return IMMEDIATELY
-        print(f"✅ Upload accepted. Processing in background: {document_id}")
+        print(f"✅ Upload accepted. Queued for processing: {document_id}")
         return {
             "success": True,
             "document_id": document_id,
             "filename": file.filename,
             "message": f"Upload successful! Processing {file.filename} in background...",
-            "status": "processing"
+            "status": "queued",
+            "queue_position": ingestion_scheduler.queue_position(document_id),
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error receiving file: {e}")
         raise HTTPException(status_code=400, detail=f"Failed to receive file: {str(e)}")
 
 # Background processing function
-async def process_pdf_background(document_id: str, temp_file_path: str, filename: str):
+def process_pdf_background(job, document_id: str, temp_file_path: str, filename: str, profile: IndexingProfile):
     """
-    Process PDF in background without blocking upload response.
+    Process PDF in an ingestion worker thread without blocking the event loop.
+    Progress is reported through the document catalog; cancellation is checked between stages.
     """
+    def check_cancelled():
+        # Cancel requests that reached another worker arrive through the shared catalog
+        if (document_store.get(document_id) or {}).get("cancel_requested"):
+            job.cancel()
+        job.check_cancelled()
+
+    trace = Trace("ingest", filename)
+    outcome = "error"
+    pages = None
     try:
+        check_cancelled()
         print(f"🔄 Background processing started: {filename}")
+        # Uploads are accepted during warm-up - wait for the embedding model here
+        with trace.span("wait_models"):
+            while not warmup.wait(timeout=1):
+                check_cancelled()
+        document_store.update(document_id, status="processing")
         
-        # Load PDF
-        loader = PyPDFLoader(temp_file_path)
-        docs = loader.load()
-        print(f"✅ Loaded {len(docs)} pages")
-
-        # Split into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = text_splitter.split_documents(docs)
-        print(f"✅ Created {len(chunks)} chunks")
-        
-        # Limit chunks for speed
-        if len(chunks) > 100:
-            print(f"⚠️ Large document. Using first 100 chunks...")
-            chunks = chunks[:100]
-
-        # Create embeddings
-        print(f"🧠 Creating embeddings...")
-        vector_store = FAISS.from_documents(chunks, embedding=embeddings_model)
+        # Stream the PDF page by page: parse (in parallel, or from the page cache) -> split -> embed in micro-batches -> grow the index
+        file_hash = (document_store.get(document_id) or {}).get("file_hash")
+        pages = pdf_extractor.iter_pages(temp_file_path, file_hash=file_hash, source=filename)
+        text_splitter = profile.make_splitter()
+        index = IncrementalIndex()
+        pending = []  # chunks split but not embedded yet
+        pages_parsed = 0
+        pages_published = 0
+
+        def embed_pending(flush: bool = False):
+            while len(pending) >= EMBED_BATCH_SIZE or (flush and pending):
+                check_cancelled()
+                batch = pending[:EMBED_BATCH_SIZE]
+                del pending[:EMBED_BATCH_SIZE]
+                with trace.span("embed"):
+                    vectors = embeddings_model.embed_documents([chunk.page_content for chunk in batch])
+                with trace.span("index_build"):
+                    index.add(batch, vectors)
+                job.report(chunks_embedded=len(index))
+
+        while True:
+            with trace.span("parse"):
+                page = next(pages, None)
+            if page is None:
+                break
+            check_cancelled()
+            with trace.span("split"):
+                pending.extend(text_splitter.split_documents([page]))
+            pages_parsed += 1
+            job.report(pages_parsed=pages_parsed)
+            embed_pending()
+
+            # Make the document queryable early, then keep the snapshot fresh
+            due = PARTIAL_READY_PAGES if not pages_published else pages_published + PARTIAL_PUBLISH_EVERY
+            if pages_parsed >= due:
+                embed_pending(flush=True)
+                if len(index):
+                    with trace.span("publish_partial"):
+                        vector_stores.put(document_id, index.snapshot(embeddings_model))
+                    pages_published = pages_parsed
+                    document_store.update(document_id, persist=False, status="partial", pages_indexed=pages_published)
+                    print(f"⚡ Partially ready: {pages_published} pages indexed")
+
+        embed_pending(flush=True)
+        print(f"✅ Loaded {pages_parsed} pages, {len(index)} chunks")
+
+        # Flat index for small documents, IVF for large ones
+        with trace.span("index_build"):
+            vector_store = index.finalize(embeddings_model)
+        job.report(pages_indexed=pages_parsed, chunks_total=len(index), index=describe_index(vector_store.index))
+        print(f"🔍 Built index: {job.progress['index']}")
+        check_cancelled()
         
-        # Store results
-        vector_stores[document_id] = vector_store
-        processing_status[document_id] = {
-            "status": "ready",
-            "filename": filename
-        }
+        # Persist to disk first, then publish the memory-mapped copy (frees the in-heap vectors)
+        with trace.span("persist"):
+            version = document_store.save_index(document_id, vector_store)
+            vector_stores.put(document_id, document_store.load_index(document_id, embeddings_model, version))
+            # The new index_version tells other workers to drop any copy of this document they hold
+            document_store.publish_index(document_id, version, status="ready", **job.progress)
+        _invalidate_document(document_id)
+        outcome = "ok"
         
         print(f"✅ Processing complete: {filename} ({document_id})")
         
+    except JobCancelled:
+        outcome = "cancelled"
+        print(f"🛑 Processing cancelled: {filename} ({document_id})")
+        vector_stores.pop(document_id)
+        document_store.update(document_id, status="cancelled", **job.progress)
     except Exception as e:
         print(f"❌ Background processing error: {e}")
-        processing_status[document_id] = {
-            "status": "error",
-            "filename": filename,
-            "error": str(e)
-        }
+        vector_stores.pop(document_id)
+        document_store.update(document_id, status="error", error=str(e))
     finally:
+        if pages is not None:
+            pages.close()  # stops extracting the rest of a cancelled / failed document
         # Clean up temp file
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
+        trace.finish(outcome)
+
+def _pages_for_reindex(entry: dict, vector_store):
+    """
+    (pages, source) for re-chunking an indexed document - its temp PDF is gone by now.
+    Page text comes from the page cache when every page is still there, else it is rebuilt from the current chunks.
+    """
+    chunks = chunk_documents(vector_store)
+    pages_total = entry.get("pages_total") or 0
+    cached = pdf_extractor.cache.get(entry["file_hash"], pdf_extractor.mode, pages_total) if entry.get("file_hash") and pages_total else {}
+    if pages_total and len(cached) == pages_total:
+        # Chunks carry their page's metadata (source, label, ...); pages that produced no chunk get the basics
+        metadata = {chunk.metadata.get("page"): chunk.metadata for chunk in reversed(chunks)}
+        default = {"source": entry.get("filename"), "total_pages": pages_total}
+        pages = [
+            Document(page_content=cached[number], metadata=dict(metadata.get(number) or {**default, "page": number, "page_label": str(number + 1)}))
+            for number in range(pages_total)
+        ]
+        return pages, "page_cache"
+    return rebuild_pages(chunks, chunk_overlap=profile_of(entry).chunk_overlap), "chunks"
+
+def reindex_document_background(job, document_id: str, profile: IndexingProfile):
+    """
+    Re-chunks and re-embeds a ready document into another indexing profile, in an ingestion worker.
+    The current index keeps answering until the new one is complete; then it is swapped in, like a finished upload.
+    Chunks that come out the same as before are served from the embedding cache.
+    """
+    trace = Trace("reindex", f"{document_id} -> {profile.name}")
+    outcome = "error"
+    progress = {"profile": profile.name, "state": "running"}
+    try:
+        job.check_cancelled()
+        with trace.span("wait_models"):
+            while not warmup.wait(timeout=1):
+                job.check_cancelled()
+        print(f"🔄 Re-indexing {document_id} into profile {profile}")
+        entry = document_store.get(document_id) or {}
+        current = vector_stores.get(document_id) or document_store.load_index(document_id, embeddings_model)
+        if current is None:
+            raise ValueError("Document has no index to re-chunk.")
+
+        with trace.span("parse"):
+            pages, source = _pages_for_reindex(entry, current)
+        del current
+        with trace.span("split"):
+            chunks = profile.make_splitter().split_documents(pages)
+        if not chunks:
+            raise ValueError("No extractable text found in this PDF.")
+        progress.update(source=source, chunks_total=len(chunks), chunks_embedded=0)
+        job.report(reindex=dict(progress))
+
+        index = IncrementalIndex()
+        for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+            job.check_cancelled()
+            batch = chunks[start:start + EMBED_BATCH_SIZE]
+            with trace.span("embed"):
+                vectors = embeddings_model.embed_documents([chunk.page_content for chunk in batch])
+            with trace.span("index_build"):
+                index.add(batch, vectors)
+            progress["chunks_embedded"] = len(index)
+            job.report(reindex=dict(progress))
+        with trace.span("index_build"):
+            vector_store = index.finalize(embeddings_model)
+        job.check_cancelled()
+
+        # Same publish order as an upload: a new version on disk, then this worker's copy, then the catalog
+        # (the new index_version makes other workers drop theirs; the old version is deleted after that)
+        with trace.span("persist"):
+            version = document_store.save_index(document_id, vector_store)
+            vector_stores.put(document_id, document_store.load_index(document_id, embeddings_model, version))
+            document_store.publish_index(
+                document_id, version, profile=profile.to_dict(), chunks_total=len(chunks),
+                index=describe_index(vector_store.index), reindex={**progress, "state": "done"},
+            )
+        _invalidate_document(document_id)
+        outcome = "ok"
+        print(f"✅ Re-indexed {document_id}: {len(chunks)} chunks ({profile.name}, text from {source})")
+
+    except JobCancelled:
+        outcome = "cancelled"
+        print(f"🛑 Re-indexing cancelled: {document_id}")
+        document_store.update(document_id, reindex={**progress, "state": "cancelled"})
+    except Exception as e:
+        print(f"❌ Re-indexing error: {e}")
+        document_store.update(document_id, reindex={**progress, "state": "error", "error": str(e)})
+    finally:
+        trace.finish(outcome)
+
+@app.get("/profiles")
+def get_profiles():
+    """Indexing profiles uploads and re-indexing can use."""
+    return {
+        "default": DEFAULT_INDEXING_PROFILE,
+        "profiles": [profile.to_dict() for profile in INDEXING_PROFILES.values() if profile.embedding_model == EMBEDDING_MODEL],
+    }
 
 @app.get("/documents")
 async def get_documents():
@@ -296,39 +988,138 @@ async def get_documents():
     Returns a list of all uploaded documents with their processing status.
     """
     doc_list = []
-    for doc_id, filename in documents_db.items():
-        status_info = processing_status.get(doc_id, {"status": "ready"})
+    catalog = dict(document_store.items())
+    for doc_id, status_info in catalog.items():
+        # Duplicate uploads are indexed (and re-indexed) as their original
+        indexed = catalog.get(status_info.get("alias_of"), status_info)
         doc_list.append({
             "document_id": doc_id,
-            "filename": filename,
+            "filename": status_info.get("filename"),
+            "collection": status_info.get("collection"),
             "status": status_info.get("status", "ready"),
-            "error": status_info.get("error") if status_info.get("status") == "error" else None
+            "error": status_info.get("error") if status_info.get("status") == "error" else None,
+            "progress": {
+                "pages_total": status_info.get("pages_total"),
+                "pages_parsed": status_info.get("pages_parsed", 0),
+                "pages_indexed": status_info.get("pages_indexed", 0),
+                "chunks_embedded": status_info.get("chunks_embedded", 0),
+                "chunks_total": status_info.get("chunks_total"),
+                "queue_position": ingestion_scheduler.queue_position(doc_id),
+            },
+            "profile": profile_of(indexed).to_dict(),
+            "reindex": indexed.get("reindex"),
         })
-    return {"documents": doc_list}
+    return {"documents": doc_list, "ingestion": ingestion_scheduler.stats()}
+
+@app.post("/documents/{document_id}/cancel")
+async def cancel_document_processing(document_id: str):
+    """
+    Cancels a queued or in-progress ingestion job.
+    """
+    if document_id not in document_store:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    if not ingestion_scheduler.cancel(document_store.resolve(document_id)):
+        status = document_store.get(document_id).get("status", "ready")
+        if status not in IN_FLIGHT_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Document is not being processed (status: {status}).")
+        # Being ingested by another worker - it picks the flag up between stages
+        document_store.update(document_id, cancel_requested=True)
+    print(f"🛑 Cancellation requested: {document_id}")
+    return {"success": True, "document_id": document_id, "status": "cancelling"}
+
+@app.post("/documents/{document_id}/reindex")
+async def reindex_document(document_id: str, request: ReindexRequest):
+    """
+    Re-chunks a ready document into another indexing profile, in the background.
+    The document keeps answering from its current index until the new one is swapped in;
+    follow the "reindex" field in /documents, or cancel it with /documents/{id}/cancel.
+    """
+    if document_id not in document_store:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    index_id = document_store.resolve(document_id)
+    entry = document_store.get(index_id) or {}
+    if entry.get("status") != "ready":
+        raise HTTPException(status_code=409, detail=f"Only ready documents can be re-indexed (status: {entry.get('status')}).")
+
+    current = profile_of(entry)
+    profile = _named_profile(request.profile) if request.profile else current
+    overrides = request.model_dump(exclude={"profile"}, exclude_none=True)
+    if overrides:
+        try:
+            profile = profile.replace(**overrides)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    _check_profile(profile)
+    if profile.same_settings(current):
+        return {"success": True, "document_id": document_id, "status": "ready", "profile": current.to_dict(),
+                "message": "Document is already indexed with these settings."}
+
+    if index_id in ingestion_scheduler:
+        raise HTTPException(status_code=409, detail="Document is already being re-indexed.")
+    previous = entry.get("reindex")
+    document_store.update(index_id, reindex={"profile": profile.name, "state": "queued"})
+    try:
+        ingestion_scheduler.submit(index_id, reindex_document_background, index_id, profile)
+    except QueueFullError as e:
+        print(f"⚠️ Re-index rejected: {e}")
+        document_store.update(index_id, reindex=previous)
+        raise HTTPException(
+            status_code=429,
+            detail="Server is busy processing other documents. Please try again shortly.",
+            headers={"Retry-After": "30"},
+        )
+    print(f"✅ Re-index queued: {index_id} -> {profile}")
+    return {
+        "success": True,
+        "document_id": document_id,
+        "indexed_as": index_id,
+        "status": "reindexing",
+        "profile": profile.to_dict(),
+        "queue_position": ingestion_scheduler.queue_position(index_id),
+    }
 
 @app.post("/chat")
 async def chat_with_doc(request: ChatRequest):
     """
     UPDATED ENDPOINT: Now handles conversational history with manual history-aware retrieval.
+    Identical questions arriving while one is being answered wait for that answer instead of calling the LLM again.
     """
-    print(f"Received question for doc {request.document_id}: {request.question}")
+    _require_models()
+    return await chat_flights.do(_flight_key("chat", request), lambda: answer_question(request))
+
+async def answer_question(request: ChatRequest):
+    trace = Trace("chat", _trace_detail(request))
+    outcome = "error"
+    try:
+        result = await _answer_question(request, trace)
+        outcome = "cached" if result.get("cached") else ("ok" if "answer" in result else "rejected")
+        return result
+    except HTTPException as e:
+        outcome = "unavailable" if e.status_code == 503 else "error"
+        raise
+    finally:
+        trace.finish(outcome)
+
+async def _answer_question(request: ChatRequest, trace: Trace):
+    print(f"Received question for doc {request.document_id or _target_document_ids(request)}: {request.question}")
     print(f"Chat history length: {len(request.chat_history)}")
     
-    # 1. Get the specific vector store
-    vector_store = vector_stores.get(request.document_id)
-    if not vector_store:
-        return {"error": "Document not found. Please upload it first."}
-    
-    # Reduce retrieved docs from 6 to 3 for faster processing
-    retriever = vector_store.as_retriever(search_kwargs={"k": 3})
+    # 1. Get the vector store(s) for the requested document(s)
+    with trace.span("load_stores"):
+        stores, error = await load_target_stores(request)
+    if error:
+        return {"error": error}
 
-    # 2. Convert simple history to LangChain messages
-    chat_history = []
-    for msg in request.chat_history:
-        if msg.sender == 'user':
-            chat_history.append(HumanMessage(content=msg.text))
-        else:
-            chat_history.append(AIMessage(content=msg.text))
+    # Same question (or a near-duplicate) already answered for these documents?
+    cached_answer, query_vector = await lookup_cached_answer(request, stores, trace)
+    if cached_answer is not None:
+        return {"answer": cached_answer, "cached": True}
+    # Answers from the local fallback LLM (Groq was unavailable) are not cached
+    fallback = watch_fallback()
+
+    # 2. Convert simple history to LangChain messages (recent window + summary of older turns)
+    with trace.span("history"):
+        chat_history = _history_messages(request)
 
     # 3. Manual History-Aware Question Reformulation
     reformulated_question = request.question
@@ -339,8 +1130,10 @@ async def chat_with_doc(request: ChatRequest):
         print("Chat history detected - using enhanced context in answer...")
     
     # 4. Retrieve documents using original question (faster!)
-    docs = retriever.invoke(reformulated_question)
-    context = _format_docs(docs)
+    # Reduce retrieved docs from 6 to 3 for faster processing
+    docs = await search_stores(stores, reformulated_question, k=3, query_vector=query_vector, trace=trace)
+    with trace.span("prompt"):
+        context = _format_docs(docs)
     
     print(f"Retrieved {len(docs)} documents for context")
 
@@ -363,19 +1156,21 @@ async def chat_with_doc(request: ChatRequest):
         
         # Generate answer with history context
         qa_chain = qa_prompt | llm | StrOutputParser()
+        qa_inputs = {
+            "input": request.question,
+            "context": context,
+            "chat_history": chat_history
+        }
+        prompt_tokens = _count_prompt_tokens(qa_prompt, qa_inputs)
         
         try:
-            answer = await qa_chain.ainvoke({
-                "input": request.question,
-                "context": context,
-                "chat_history": chat_history
-            })
+            with trace.span("llm"):
+                answer = await qa_chain.ainvoke(qa_inputs)
+        except LLMUnavailable as e:
+            raise _llm_unavailable(e)
         except Exception as e:
             print(f"❌ Groq API Error in QA chain: {e}")
-            if "500" in str(e) or "Internal server error" in str(e):
-                raise HTTPException(status_code=503, detail="AI service temporarily unavailable. Groq API is experiencing issues. Please try again in a few minutes.")
-            else:
-                raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
     
     else:  # No chat history - simple RAG
         system_prompt = (
@@ -390,82 +1185,70 @@ async def chat_with_doc(request: ChatRequest):
         
         prompt = ChatPromptTemplate.from_template(system_prompt)
         qa_chain = prompt | llm | StrOutputParser()
+        qa_inputs = {
+            "context": context,
+            "question": request.question
+        }
+        prompt_tokens = _count_prompt_tokens(prompt, qa_inputs)
         
         try:
-            answer = await qa_chain.ainvoke({
-                "context": context,
-                "question": request.question
-            })
+            with trace.span("llm"):
+                answer = await qa_chain.ainvoke(qa_inputs)
+        except LLMUnavailable as e:
+            raise _llm_unavailable(e)
         except Exception as e:
             print(f"Error in simple QA chain: {e}")
             raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
     
     # Log for debugging
     print(f"Generated answer: {answer[:100]}...")
+    if query_vector is not None and answer.strip() and not fallback.used:
+        answer_cache.store(stores, request.question, query_vector, answer)
     
-    return {"answer": answer}
+    return {"answer": answer, "prompt_tokens": prompt_tokens}
 
 @app.post("/chat/stream")
-async def chat_with_doc_stream(request: ChatRequest):
+async def chat_with_doc_stream(request: ChatRequest, http_request: Request):
     """
-    STREAMING ENDPOINT: Returns streaming responses with typewriter effect.
+    STREAMING ENDPOINT: Returns the answer as server-sent events (`data: {"chunk": ...}` frames, then `done`).
     """
-    print(f"Received STREAMING question for doc {request.document_id}: {request.question}")
+    _require_models()
+    print(f"Received STREAMING question for doc {request.document_id or _target_document_ids(request)}: {request.question}")
     print(f"Chat history length: {len(request.chat_history)}")
     
-    async def generate_stream() -> AsyncGenerator[str, None]:
+    async def generate_stream() -> AsyncGenerator[dict, None]:
+        started = time.perf_counter()
+        trace = Trace("chat_stream", _trace_detail(request))
+        outcome = "cancelled"  # stays so if the generator is closed early (every client went away)
         try:
-            # 1. Get the specific vector store
-            vector_store = vector_stores.get(request.document_id)
-            if not vector_store:
-                yield f"data: {json.dumps({'error': 'Document not found. Please upload it first.'})}\n\n"
+            # 1. Get the vector store(s) for the requested document(s)
+            with trace.span("load_stores"):
+                stores, error = await load_target_stores(request)
+            if error:
+                outcome = "rejected"
+                yield {'error': error}
                 return
-            
-            retriever = vector_store.as_retriever(search_kwargs={"k": 6})
-
-            # 2. Convert simple history to LangChain messages
-            chat_history = []
-            for msg in request.chat_history:
-                if msg.sender == 'user':
-                    chat_history.append(HumanMessage(content=msg.text))
-                else:
-                    chat_history.append(AIMessage(content=msg.text))
-
-            # 3. Manual History-Aware Question Reformulation
-            reformulated_question = request.question
-            
-            if chat_history:
-                print("Reformulating question based on chat history...")
-                
-                contextualize_prompt = ChatPromptTemplate.from_messages([
-                    ("system", 
-                     "You must reformulate the user's question to be standalone. Look at the chat history to understand context.\n\n"
-                     "Rules:\n"
-                     "1. If the question refers to 'the first one', 'it', 'that', etc., replace with the specific thing from history\n"
-                     "2. If history mentions 'projects' and user asks 'what is the first one about?', change to 'what is the first project about?'\n"
-                     "3. If no context is needed, return the question unchanged\n"
-                     "4. Do NOT answer the question, only reformulate it\n\n"
-                     "Return ONLY the reformulated question, nothing else."),
-                    MessagesPlaceholder("chat_history"),
-                    ("human", "{input}"),
-                ])
-                
-                reformulate_chain = contextualize_prompt | llm | StrOutputParser()
-                
-                try:
-                    reformulated_question = await reformulate_chain.ainvoke({
-                        "input": request.question,
-                        "chat_history": chat_history
-                    })
-                    print(f"Original question: {request.question}")
-                    print(f"Reformulated question: {reformulated_question}")
-                except Exception as e:
-                    print(f"Error reformulating question, using original: {e}")
-                    reformulated_question = request.question
-
-            # 4. Retrieve documents using reformulated question
-            docs = retriever.invoke(reformulated_question)
-            context = _format_docs(docs)
+
+            # Cached answer: replay it as a few SSE frames instead of generating it again
+            cached_answer, query_vector = await lookup_cached_answer(request, stores, trace)
+            if cached_answer is not None:
+                outcome = "cached"
+                for chunk in _replay_chunks(cached_answer):
+                    yield {'chunk': chunk}
+                yield {'done': True, 'cached': True}
+                return
+            answer_parts = []
+            # Answers from the local fallback LLM (Groq was unavailable) are not cached
+            fallback = watch_fallback()
+
+            # 2. Convert simple history to LangChain messages (recent window + summary of older turns)
+            with trace.span("history"):
+                chat_history = _history_messages(request)
+
+            # 3. Retrieve - follow-ups are rewritten cheaply, or by the LLM with a speculative search alongside
+            docs, _ = await retrieve_follow_up(request, stores, chat_history, k=6, query_vector=query_vector, trace=trace)
+            with trace.span("prompt"):
+                context = _format_docs(docs)
             
             print(f"Retrieved {len(docs)} documents for context")
 
@@ -489,16 +1272,24 @@ async def chat_with_doc_stream(request: ChatRequest):
                 # Generate streaming answer with history context
                 qa_chain = qa_prompt | llm
                 
-                # Stream the response
-                async for chunk in qa_chain.astream({
+                qa_inputs = {
                     "input": request.question,
                     "context": context,
                     "chat_history": chat_history
-                }):
-                    if chunk.content:
-                        # Send each chunk as Server-Sent Event
-                        yield f"data: {json.dumps({'chunk': chunk.content})}\n\n"
-                        await asyncio.sleep(0.01)  # Small delay for smoother streaming
+                }
+                prompt_tokens = _count_prompt_tokens(qa_prompt, qa_inputs)
+
+                # Stream the response
+                llm_started = time.perf_counter()
+                async for chunk in qa_chain.astream(qa_inputs):
+                    text = _chunk_text(chunk)
+                    if text:
+                        if not answer_parts:
+                            _record_ttft(started, chat_history)
+                            trace.add("llm_first_token", time.perf_counter() - llm_started)
+                        # Send each chunk as Server-Sent Event (merged into frames by coalesce_events)
+                        yield {'chunk': text}
+                        answer_parts.append(text)
             
             else:  # No chat history - simple RAG streaming
                 system_prompt = (
@@ -514,29 +1305,57 @@ async def chat_with_doc_stream(request: ChatRequest):
                 prompt = ChatPromptTemplate.from_template(system_prompt)
                 qa_chain = prompt | llm
                 
-                # Stream the response
-                async for chunk in qa_chain.astream({
+                qa_inputs = {
                     "context": context,
                     "question": request.question
-                }):
-                    if chunk.content:
-                        # Send each chunk as Server-Sent Event
-                        yield f"data: {json.dumps({'chunk': chunk.content})}\n\n"
-                        await asyncio.sleep(0.01)  # Small delay for smoother streaming
+                }
+                prompt_tokens = _count_prompt_tokens(prompt, qa_inputs)
+
+                # Stream the response
+                llm_started = time.perf_counter()
+                async for chunk in qa_chain.astream(qa_inputs):
+                    text = _chunk_text(chunk)
+                    if text:
+                        if not answer_parts:
+                            _record_ttft(started, chat_history)
+                            trace.add("llm_first_token", time.perf_counter() - llm_started)
+                        # Send each chunk as Server-Sent Event (merged into frames by coalesce_events)
+                        yield {'chunk': text}
+                        answer_parts.append(text)
             
+            trace.add("llm_stream", time.perf_counter() - llm_started)
+            answer = "".join(answer_parts)
+            if query_vector is not None and answer.strip() and not fallback.used:
+                answer_cache.store(stores, request.question, query_vector, answer)
+
             # Send completion signal
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            outcome = "ok"
+            yield {'done': True, 'prompt_tokens': prompt_tokens}
             
+        except LLMUnavailable as e:
+            print(f"❌ {e}")
+            outcome = "unavailable"
+            yield {'error': 'AI service temporarily unavailable. Please try again shortly.', 'retry_after': math.ceil(e.retry_after)}
         except Exception as e:
             print(f"Error in streaming chain: {e}")
-            yield f"data: {json.dumps({'error': f'Error processing question: {str(e)}'})}\n\n"
+            outcome = "error"
+            yield {'error': f'Error processing question: {str(e)}'}
+        finally:
+            trace.finish(outcome)
     
+    # Identical concurrent streams share one generation (and its encoded frames) - every client gets the same frames.
+    # Heartbeats and disconnect detection are per client; the last client leaving cancels the generation.
+    frames = chat_flights.stream(
+        _flight_key("stream", request),
+        lambda: coalesce_events(generate_stream(), SSE_FLUSH_MS, SSE_FLUSH_BYTES),
+    )
     return StreamingResponse(
-        generate_stream(),
-        media_type="text/plain",
+        with_heartbeats(frames, http_request, SSE_HEARTBEAT_S),
+        media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # stop reverse proxies from buffering the stream
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
             "Access-Control-Allow-Headers": "*",
@@ -548,5 +1367,13 @@ if __name__ == "__main__":
     import os
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")  # Allow external connections in production
-    print(f"Starting FastAPI server on {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+    # Several worker processes share DOCUMENT_STORE_PATH (see storage.py); each loads its own models
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    if workers > 1 and not MULTI_WORKER_SUPPORTED:
+        print("⚠️ WEB_CONCURRENCY > 1 needs file locking (fcntl) - running a single worker")
+        workers = 1
+    print(f"Starting FastAPI server on {host}:{port} with {workers} worker(s)")
+    if workers > 1:
+        uvicorn.run("main:app", host=host, port=port, workers=workers)
+    else:
+        uvicorn.run(app, host=host, port=port)
\ No newline at end of file
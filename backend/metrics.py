@@ -0,0 +1,195 @@
+"""
+Per-stage latency spans and a Prometheus text-format /metrics endpoint.
+
+A Trace follows one operation (a chat answer, a streamed answer, a PDF
+ingestion) and adds up the wall time of its stages. Stages can repeat, like
+per-page parsing, and can overlap, like a rewrite running next to a
+speculative search. A span costs two perf_counter() calls and a dict add. When
+the operation ends, each stage total goes into the `rag_stage_seconds`
+histogram, and the operation's duration and outcome into
+`rag_operation_seconds` / `rag_operations_total`. Operations slower than
+SLOW_REQUEST_MS are logged with their breakdown.
+
+Gauges (index memory, queue depth, cache stats, ...) are read through
+callbacks at scrape time, so they cost nothing between scrapes. Metrics are
+per process; with several workers each one reports its own.
+
+No client library is needed - the few metric types used here are small.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds - from sub-millisecond searches to multi-minute ingestions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))  # 0 = slow-request log off
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values: Dict[Tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, values)} {_number(value)}" for values, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket = _labels(self.labelnames, labels, 'le="%s"' % _number(bound))
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            bucket = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(round(series[-1], 6))}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge (or counter) whose samples are read at scrape time: callback() -> number or {labelvalues: number}."""
+
+    def __init__(self, name: str, help_text: str, callback: Callable, labelnames: Sequence[str] = (), kind: str = "gauge"):
+        self.name, self.help, self.callback, self.labelnames, self.kind = name, help_text, callback, tuple(labelnames), kind
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception as e:  # a broken collector must not take /metrics down
+            return [f"# {self.name} unavailable: {e}"]
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, sample in samples:
+            if sample is None:
+                continue
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(sample)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable, labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, callback, labelnames))
+
+    def counter_from(self, name: str, help_text: str, callback: Callable, labelnames: Sequence[str] = ()) -> CallbackMetric:
+        """A counter someone else already keeps (cache hits, ...)."""
+        return self.register(CallbackMetric(name, help_text, callback, labelnames, kind="counter"))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.histogram("rag_stage_seconds", "Time spent per stage of an operation", ("operation", "stage"))
+OPERATION_SECONDS = registry.histogram("rag_operation_seconds", "End-to-end time of an operation", ("operation",))
+OPERATIONS = registry.counter("rag_operations_total", "Finished operations by outcome", ("operation", "outcome"))
+
+
+class Trace:
+    """Stage timings of one operation (see module docstring)."""
+
+    def __init__(self, operation: str, detail: str = ""):
+        self.operation = operation
+        self.detail = detail
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.finished = False
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self, outcome: str = "ok"):
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, self.operation, stage)
+        OPERATION_SECONDS.observe(total, self.operation)
+        OPERATIONS.inc(self.operation, outcome)
+        if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+            breakdown = {stage: round(seconds * 1000, 1) for stage, seconds in sorted(self.stages.items(), key=lambda item: -item[1])}
+            print(f"🐢 Slow {self.operation} ({outcome}) {total * 1000:.0f}ms {self.detail}: {json.dumps(breakdown)}")
+
+
+@contextmanager
+def span(trace: Optional[Trace], stage: str):
+    """trace.span(stage), or nothing when the caller isn't traced."""
+    if trace is None:
+        yield
+    else:
+        with trace.span(stage):
+            yield
+
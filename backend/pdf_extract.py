@@ -0,0 +1,238 @@
+"""
+Parallel PDF text extraction with a per-page cache.
+
+Ingestion used to go through PyPDFLoader (main.py and ingest.py), which
+extracts pages one after another in pure Python. It also rebuilds the
+page-label list for every page. PageExtractor replaces it:
+
+- Page ranges (PAGES_PER_TASK pages each) are extracted on a pool of worker
+  processes that outlives single documents. Results still come back in page
+  order, so the server can publish a partial index after the first pages.
+  A document with only a couple of ranges is extracted in-process.
+- Pages that never draw text are not run through the text extractor. A
+  scanned page only paints an image, and a blank page has no content
+  stream. The check decodes the content stream and looks for a text
+  object, or a form XObject that might hold one.
+- Extracted text is cached in SQLite per (file hash, extraction mode, page).
+  Re-processing the same file, for example with another chunk size, parses
+  nothing.
+- Every page becomes a Document with its page number, page label, total
+  page count and source, and chunks inherit these for citations.
+  PyPDFLoader's producer/creator fields are not copied.
+
+"layout" mode (pypdf's layout extraction) keeps columns and table cells on
+their own lines, but it is several times slower than "plain".
+"""
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+from sqlite_lru import SQLiteLRU
+
+EXTRACTION_MODES = ("plain", "layout")
+PAGES_PER_TASK = 8
+# "BT" (begin text object) as an operator, not as part of a name or another operator
+_BEGIN_TEXT = re.compile(rb"(?<![A-Za-z0-9/#])BT(?![A-Za-z0-9])")
+
+
+# --- Worker side (runs in the pool processes, or inline) ---
+_open_reader: Tuple[Optional[tuple], Optional[PdfReader]] = (None, None)
+
+
+def _reader(path: str) -> PdfReader:
+    """The worker's PdfReader for path - reused across the ranges of one document."""
+    global _open_reader
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _open_reader[0] != key:
+        _open_reader = (key, PdfReader(path))
+    return _open_reader[1]
+
+
+def has_text(page) -> bool:
+    """Cheap check before the (slow) text extractor: does the page draw any text at all?"""
+    contents = page.get_contents()
+    if contents is None:
+        return False
+    if _BEGIN_TEXT.search(contents.get_data()):
+        return True
+    # Text can also sit in form XObjects the page draws
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if xobjects:
+        return any(xobject.get_object().get("/Subtype") == "/Form" for xobject in xobjects.get_object().values())
+    return False
+
+
+def extract_range(path: str, pages: List[int], mode: str) -> List[Tuple[int, Optional[str]]]:
+    """(page, text) for the given pages; text is None for pages that draw no text."""
+    reader = _reader(path)
+    results = []
+    for number in pages:
+        page = reader.pages[number]
+        results.append((number, page.extract_text(extraction_mode=mode).strip() if has_text(page) else None))
+    return results
+
+
+# --- Cache ---
+class PageTextCache(SQLiteLRU):
+    """Extracted page text in SQLite, keyed by (file hash, mode, page); least recently used pages go past max_pages."""
+
+    def __init__(self, path: str, max_pages: int = 20000):
+        super().__init__(
+            path, "pages",
+            "file_hash TEXT NOT NULL, mode TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL",
+            "file_hash, mode, page", max_pages,
+        )
+        self.max_pages = max_pages
+
+    def get(self, file_hash: str, mode: str, total_pages: int) -> Dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT page, text FROM pages WHERE file_hash = ? AND mode = ?", (file_hash, mode)).fetchall()
+            if rows:
+                self._conn.execute("UPDATE pages SET last_used = ? WHERE file_hash = ? AND mode = ?", (time.time(), file_hash, mode))
+                self._conn.commit()
+            self.hits += len(rows)
+            self.misses += total_pages - len(rows)
+        return dict(rows)
+
+    def put(self, file_hash: str, mode: str, pages: List[Tuple[int, str]]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (file_hash, mode, page, text, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(file_hash, mode, number, text, now) for number, text in pages],
+            )
+            self._conn.commit()
+            self._evict()
+
+    def stats(self) -> Dict:
+        stats = self._lru_stats()
+        return {"pages": stats.pop("entries"), "max_pages": stats.pop("max_entries"), **stats}
+
+
+# --- Extractor ---
+class PageExtractor:
+    """Yields a PDF's pages as Documents, extracting uncached page ranges on a process pool."""
+
+    def __init__(self, workers: int = 1, mode: str = "plain", cache: Optional[PageTextCache] = None):
+        if mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown PDF extraction mode '{mode}'. Choose one of: {', '.join(EXTRACTION_MODES)}")
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.cache = cache
+        self.pages_extracted = 0
+        self.pages_without_text = 0
+        self.pages_from_cache = 0
+        self.extract_seconds = 0.0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker processes now - forking a small process (before models load) is cheaper and safer."""
+        if self.workers > 1:
+            self._get_pool().submit(os.getpid).result()
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # fork where available: spawned workers would re-import the server's main module
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("fork" if "fork" in methods else None)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def _extract(self, path: str, tasks: List[List[int]]) -> Iterator[List[Tuple[int, Optional[str]]]]:
+        """Results of the page ranges, in order. At most 2 ranges per worker are queued ahead of the consumer."""
+        if self.workers == 1 or len(tasks) <= 2:
+            for task in tasks:
+                yield extract_range(path, task, self.mode)
+            return
+        pool = self._get_pool()
+        remaining = iter(tasks)
+        futures = deque()
+        try:
+            for task in remaining:
+                futures.append(pool.submit(extract_range, path, task, self.mode))
+                if len(futures) >= self.workers * 2:
+                    break
+            while futures:
+                result = futures.popleft().result()
+                task = next(remaining, None)
+                if task is not None:
+                    futures.append(pool.submit(extract_range, path, task, self.mode))
+                yield result
+        except BrokenProcessPool:
+            # A worker died (out of memory?) - start a fresh pool next time
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        finally:
+            # Closed early (ingestion cancelled): don't leave the pool busy with the rest of the document
+            for future in futures:
+                future.cancel()
+
+    def iter_pages(self, path: str, file_hash: Optional[str] = None, source: Optional[str] = None) -> Iterator[Document]:
+        """Every page in order as a Document (empty text for pages without any). Pass file_hash to use the cache."""
+        reader = PdfReader(path)
+        total_pages = len(reader.pages)
+        try:
+            labels = reader.page_labels
+        except Exception:  # malformed label tree - fall back to plain numbers
+            labels = [str(number + 1) for number in range(total_pages)]
+        metadata = {"source": source or path, "total_pages": total_pages}
+
+        cache = self.cache if file_hash else None
+        cached = cache.get(file_hash, self.mode, total_pages) if cache else {}
+        missing = [number for number in range(total_pages) if number not in cached]
+        tasks = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+        batches = self._extract(path, tasks)
+        extracted = {}
+        try:
+            for number in range(total_pages):
+                if number in cached:
+                    text = cached[number]
+                    self.pages_from_cache += 1
+                else:
+                    while number not in extracted:
+                        started = time.perf_counter()
+                        batch = next(batches)
+                        self.extract_seconds += time.perf_counter() - started
+                        self.pages_extracted += len(batch)
+                        self.pages_without_text += sum(text is None for _, text in batch)
+                        batch = [(page, text or "") for page, text in batch]
+                        if cache:
+                            cache.put(file_hash, self.mode, batch)
+                        extracted.update(batch)
+                    text = extracted.pop(number)
+                yield Document(page_content=text, metadata={**metadata, "page": number, "page_label": labels[number]})
+        finally:
+            batches.close()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "mode": self.mode,
+            "pages_extracted": self.pages_extracted,
+            "pages_without_text": self.pages_without_text,
+            "pages_from_cache": self.pages_from_cache,
+            # Per second ingestion spent waiting for text - parallel extraction overlaps with embedding
+            "pages_per_s": round(self.pages_extracted / self.extract_seconds, 1) if self.extract_seconds else None,
+            "cache": self.cache.stats() if self.cache else None,
+        }
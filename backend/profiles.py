@@ -0,0 +1,143 @@
+"""
+Indexing profiles: how a document is chunked and embedded.
+
+A profile names a chunk size, chunk overlap, splitter and embedding model.
+The profile a document was indexed with is stored in its catalog entry.
+Documents can be re-indexed into another profile without a new upload
+(POST /documents/{id}/reindex). The new index is built next to the current
+one and swapped in when it is complete.
+
+- "default": 500/50 characters, the chunking every document used so far.
+- "compact": 300/30 characters, split on sentence boundaries. Hits are
+  more precise and each retrieved chunk costs fewer prompt tokens, so
+  answers start sooner.
+- "long": 1000/200 characters. Each chunk carries more surrounding text
+  and there are fewer vectors to search. Good for long-form reading.
+
+More profiles can be added, or built-ins overridden, as JSON in
+INDEXING_PROFILES, e.g. '{"faq": {"chunk_size": 200, "chunk_overlap": 0,
+"splitter": "sentence"}}'.
+
+Splitters: "recursive" (paragraphs, then lines, then words), "sentence"
+(keeps sentences whole where it can) and "tokens" (like "recursive", but
+chunk_size and chunk_overlap are estimated tokens instead of characters).
+
+Queries are embedded with the one model the server loads, so a server only
+accepts profiles that use that model.
+"""
+import json
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from prompt_budget import estimate_tokens, overlap_length
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SPLITTERS = ("recursive", "sentence", "tokens")
+_SENTENCE_SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", "; ", ", ", " ", ""]
+
+
+class IndexingProfile:
+    """Chunking + embedding settings; two profiles with the same settings produce the same index."""
+
+    SETTINGS = ("chunk_size", "chunk_overlap", "splitter", "embedding_model")
+
+    def __init__(self, name: str, chunk_size: int, chunk_overlap: int, splitter: str = "recursive",
+                 embedding_model: str = DEFAULT_EMBEDDING_MODEL):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap must be at least 0 and smaller than chunk_size, got {chunk_overlap}")
+        if splitter not in SPLITTERS:
+            raise ValueError(f"Unknown splitter '{splitter}'. Choose one of: {', '.join(SPLITTERS)}")
+        self.name = name
+        self.chunk_size = int(chunk_size)
+        self.chunk_overlap = int(chunk_overlap)
+        self.splitter = splitter
+        self.embedding_model = embedding_model
+
+    @classmethod
+    def from_dict(cls, data: Dict, name: Optional[str] = None) -> "IndexingProfile":
+        unknown = set(data) - set(cls.SETTINGS) - {"name"}
+        if unknown:
+            raise ValueError(f"Unknown profile setting(s): {', '.join(sorted(unknown))}")
+        settings = {key: data[key] for key in cls.SETTINGS if key in data}
+        return cls(name or data.get("name", "custom"), **settings)
+
+    def settings(self) -> Dict:
+        return {key: getattr(self, key) for key in self.SETTINGS}
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, **self.settings()}
+
+    def replace(self, name: str = "custom", **overrides) -> "IndexingProfile":
+        """A copy with some settings changed."""
+        return IndexingProfile.from_dict({**self.settings(), **overrides}, name=name)
+
+    def same_settings(self, other: "IndexingProfile") -> bool:
+        return self.settings() == other.settings()
+
+    def make_splitter(self) -> RecursiveCharacterTextSplitter:
+        if self.splitter == "sentence":
+            return RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap,
+                separators=_SENTENCE_SEPARATORS, keep_separator="end",
+            )
+        if self.splitter == "tokens":
+            return RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap, length_function=estimate_tokens,
+            )
+        return RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+
+    def __repr__(self) -> str:
+        return (f"IndexingProfile({self.name!r}: {self.chunk_size}/{self.chunk_overlap} {self.splitter}, "
+                f"{self.embedding_model})")
+
+
+# Documents indexed before profiles existed were chunked like this
+LEGACY_PROFILE = IndexingProfile("default", chunk_size=500, chunk_overlap=50)
+
+BUILTIN_PROFILES = {
+    "default": LEGACY_PROFILE,
+    "compact": IndexingProfile("compact", chunk_size=300, chunk_overlap=30, splitter="sentence"),
+    "long": IndexingProfile("long", chunk_size=1000, chunk_overlap=200),
+}
+
+
+def load_profiles(extra_json: Optional[str] = None) -> Dict[str, IndexingProfile]:
+    """The built-in profiles plus the ones defined in extra_json ({"name": {settings}}); raises ValueError if invalid."""
+    profiles = dict(BUILTIN_PROFILES)
+    if extra_json:
+        try:
+            extra = json.loads(extra_json)
+        except ValueError as e:
+            raise ValueError(f"INDEXING_PROFILES is not valid JSON: {e}")
+        for name, settings in extra.items():
+            profiles[name] = IndexingProfile.from_dict(settings, name=name)
+    return profiles
+
+
+def profile_of(entry: Dict) -> IndexingProfile:
+    """The profile a catalog entry was indexed with."""
+    data = entry.get("profile")
+    return IndexingProfile.from_dict(data) if data else LEGACY_PROFILE
+
+
+# --- Page text for re-indexing ---
+def rebuild_pages(chunks: List[Document], chunk_overlap: int) -> List[Document]:
+    """
+    Approximate page text from an index's chunks (in index order), for documents whose page text is no longer cached.
+    Neighbouring chunks of a page are joined with their shared overlap removed. The exact whitespace between chunks is lost.
+    """
+    pages: Dict = {}
+    for chunk in chunks:
+        page = chunk.metadata.get("page")
+        if page not in pages:
+            pages[page] = Document(page_content=chunk.page_content, metadata=dict(chunk.metadata))
+            continue
+        merged = pages[page]
+        length = overlap_length(merged.page_content, chunk.page_content, max_chars=chunk_overlap)
+        tail = chunk.page_content[length:] if length else "\n" + chunk.page_content
+        merged.page_content += tail
+    return list(pages.values())
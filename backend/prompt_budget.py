@@ -0,0 +1,141 @@
+"""
+Token budgets for the chat prompt.
+
+Retrieved chunks are packed best-first into a context budget. Adjacent
+chunks from the splitter share up to chunk_overlap characters (50 in the
+default indexing profile, see profiles.py), and duplicate uploads
+or hybrid retrieval can return the same text twice, so repeats and
+overlapping prefixes are removed before they cost tokens. Chat history
+keeps the most recent messages that fit its budget; older turns are folded
+into a short extractive summary instead of being resent in full.
+
+Token counts are estimates (~4 characters per token for English text with
+the llama / t5 tokenizers) - good enough for budgeting, no tokenizer needed.
+"""
+import math
+import re
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+CHARS_PER_TOKEN = 4
+MAX_OVERLAP_CHARS = 256  # a little above the largest built-in profile's chunk_overlap (200)
+MIN_OVERLAP_CHARS = 12  # shorter matches are likely coincidence
+SUMMARY_SNIPPET_CHARS = 160
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def overlap_length(first: str, second: str, max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """Length of the longest end of first that second starts with (the splitter's chunk overlap), or 0."""
+    for length in range(min(max_chars, len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def _trim_overlap(packed: Sequence[str], text: str) -> str:
+    """Drops the part of text already present in a packed neighbour chunk (it may have been retrieved before or after it)."""
+    for previous in packed:
+        length = overlap_length(previous, text)
+        if length:
+            text = text[length:].lstrip()
+        length = overlap_length(text, previous)
+        if length:
+            text = text[:-length].rstrip()
+    return text
+
+
+def pack_context(docs: Sequence, budget_tokens: int) -> Tuple[str, Dict]:
+    """
+    Joins chunk texts, best first, until the budget is used. Returns (context, stats).
+    Chunks that don't fit are skipped (a shorter, lower-ranked one may still fit); the top chunk is truncated if needed.
+    """
+    packed: List[str] = []
+    seen = set()
+    used = 0
+    stats = {"chunks_retrieved": len(docs), "chunks_packed": 0, "duplicates_dropped": 0, "overlap_chars_trimmed": 0, "context_tokens": 0}
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text or text in seen:
+            stats["duplicates_dropped"] += 1
+            continue
+        seen.add(text)
+        trimmed = _trim_overlap(packed, text)
+        stats["overlap_chars_trimmed"] += len(text) - len(trimmed)
+        text = trimmed
+        if not text:
+            continue
+
+        cost = estimate_tokens(text) + 1  # + the blank line between chunks
+        if used + cost > budget_tokens:
+            if packed:
+                continue
+            text = text[:max(0, budget_tokens - 1) * CHARS_PER_TOKEN]
+            cost = estimate_tokens(text) + 1
+        packed.append(text)
+        used += cost
+
+    stats["chunks_packed"] = len(packed)
+    stats["context_tokens"] = used
+    return "\n\n".join(packed), stats
+
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    return sentence if len(sentence) <= SUMMARY_SNIPPET_CHARS else sentence[:SUMMARY_SNIPPET_CHARS].rstrip() + "..."
+
+
+def compact_history(history: Sequence[Tuple[str, str]], budget_tokens: int, max_messages: int) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    history is [(sender, text)], oldest first. Returns (recent_messages, summary_of_older_ones).
+    Keeps at most max_messages recent messages within budget_tokens; everything older becomes a one-line-per-turn summary.
+    """
+    recent: List[Tuple[str, str]] = []
+    used = 0
+    for sender, text in reversed(history):
+        cost = estimate_tokens(text) + 4  # role/formatting overhead
+        if len(recent) >= max_messages or (recent and used + cost > budget_tokens):
+            break
+        recent.insert(0, (sender, text))
+        used += cost
+
+    older = history[:len(history) - len(recent)]
+    if not older:
+        return recent, ""
+    lines = [f"{'User' if sender == 'user' else 'Assistant'}: {_first_sentence(text)}" for sender, text in older]
+    summary = "Summary of the earlier conversation:\n" + "\n".join(lines)
+    # The summary gets what is left of the budget (at least a quarter of it), keeping its most recent lines
+    summary_budget = max(budget_tokens - used, budget_tokens // 4)
+    while len(lines) > 1 and estimate_tokens(summary) > summary_budget:
+        lines.pop(0)
+        summary = "Summary of the earlier conversation:\n" + "\n".join(lines)
+    return recent, summary
+
+
+class PromptStats:
+    """Prompt size per request (estimated tokens): count / avg / max."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+
+    def record(self, tokens: int):
+        with self._lock:
+            self.count += 1
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.count,
+                "avg_prompt_tokens": round(self.total_tokens / self.count, 1) if self.count else None,
+                "max_prompt_tokens": self.max_tokens,
+            }
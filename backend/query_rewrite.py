@@ -0,0 +1,82 @@
+"""
+Cheap query rewriting for follow-up questions.
+
+Retrieval for a follow-up ("what about the second one?") needs the terms the
+question refers back to, but a full LLM reformulation call before retrieval
+roughly doubles time-to-first-token. Instead each question gets a strategy:
+
+- "none"       standalone question (no back-references, enough content words)
+               - searched as is.
+- "heuristic"  short follow-up - searched with the key terms of the previous
+               user question (and names from the last answer) appended. No LLM.
+- "llm"        longer question with references the heuristic can't resolve -
+               the LLM rewrites it while a speculative search for the
+               heuristic expansion runs in parallel (see main.py).
+"""
+import re
+from typing import List, Sequence, Tuple
+
+from bm25 import STOPWORDS, tokenize
+
+REWRITE_STRATEGIES = ("none", "heuristic", "llm")
+
+# Words that point back into the conversation
+REFERENCE_WORDS = frozenset(
+    "it its it's this that these those they them their theirs he him his she her hers one ones former latter "
+    "above previous same there then first second third last other another more else".split()
+)
+FOLLOW_UP_PREFIXES = ("and ", "but ", "also ", "what about", "how about", "why", "how so", "tell me more", "more ")
+MIN_STANDALONE_TERMS = 3  # fewer content words than this can't be searched on their own
+SIMPLE_FOLLOW_UP_WORDS = 8  # follow-ups up to this long get the heuristic rewrite
+MAX_EXPANSION_TERMS = 12
+
+_WORD_RE = re.compile(r"[\w']+")
+_SENTENCE_RE = re.compile(r"[^.!?\n]+")
+
+
+def rewrite_strategy(question: str, history: Sequence[Tuple[str, str]]) -> str:
+    """Picks "none", "heuristic" or "llm" for a question given the prior history [(sender, text)]."""
+    if not history:
+        return "none"
+    words = _WORD_RE.findall(question.lower())
+    content_terms = [term for term in tokenize(question) if term not in REFERENCE_WORDS]
+    refers_back = any(word in REFERENCE_WORDS for word in words) or question.strip().lower().startswith(FOLLOW_UP_PREFIXES)
+    if not refers_back and len(content_terms) >= MIN_STANDALONE_TERMS:
+        return "none"
+    if len(words) <= SIMPLE_FOLLOW_UP_WORDS:
+        return "heuristic"
+    return "llm"
+
+
+def expand_follow_up(question: str, history: Sequence[Tuple[str, str]]) -> str:
+    """The question plus the terms it most likely refers to: the previous user question's keywords, then names from the last answer."""
+    present = set(tokenize(question))
+    terms: List[str] = []
+
+    def add(candidates):
+        for term in candidates:
+            if len(terms) >= MAX_EXPANSION_TERMS:
+                return
+            if term not in present and term not in REFERENCE_WORDS and term not in STOPWORDS:
+                present.add(term)
+                terms.append(term)
+
+    last_user = next((text for sender, text in reversed(history) if sender == "user"), "")
+    last_answer = next((text for sender, text in reversed(history) if sender != "user"), "")
+    add(tokenize(last_user))
+    add(_names(last_answer))
+    return f"{question.strip()} {' '.join(terms)}" if terms else question
+
+
+def _names(text: str) -> List[str]:
+    """Capitalized words that don't start a sentence - names, titles, products in an answer."""
+    names = []
+    for sentence in _SENTENCE_RE.findall(text):
+        words = _WORD_RE.findall(sentence)
+        names += [word.lower() for word in words[1:] if word[0].isupper()]
+    return names
+
+
+def same_question(a: str, b: str) -> bool:
+    """True when an LLM "rewrite" only changed case / punctuation / whitespace."""
+    return _WORD_RE.findall(a.lower()) == _WORD_RE.findall(b.lower())
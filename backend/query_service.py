@@ -0,0 +1,121 @@
+"""
+Batched, non-blocking query embedding and search for chat requests.
+
+Concurrent questions are embedded together: a MicroBatcher collects them
+for a few milliseconds and encodes them in one forward pass on its own
+thread. Searches are batched the same way - pending queries against the
+same index are answered by a single faiss `search` over a query matrix.
+Neither step runs on the event loop. When the store has a BM25 index the
+dense hits are fused with lexical ones (reciprocal rank fusion) on the same
+search thread. Every call records per-stage timings (embed / search,
+including time spent waiting for a batch).
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from batching import MicroBatcher
+from bm25 import HYBRID_CANDIDATES, reciprocal_rank_fusion
+
+STAGES = ("embed", "search")
+
+
+class StageTimings:
+    """Running count / total / max per stage, in milliseconds."""
+
+    def __init__(self, stages=STAGES):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[float]] = {stage: [0, 0.0, 0.0] for stage in stages}
+
+    def record(self, stage: str, ms: float):
+        with self._lock:
+            entry = self._stages[stage]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                stage: {"count": count, "avg_ms": round(total / count, 3) if count else None, "max_ms": round(peak, 3)}
+                for stage, (count, total, peak) in self._stages.items()
+            }
+
+
+def _search_group(store, vectors: np.ndarray, k: int) -> List[List[Tuple[float, int]]]:
+    """One faiss search for many query vectors against the same store. Returns (distance, position) rows."""
+    distances, ids = store.index.search(vectors, k)
+    # id -1 means fewer than k vectors in the index
+    return [[(float(distance), int(i)) for distance, i in zip(row_distances, row_ids) if i >= 0] for row_distances, row_ids in zip(distances, ids)]
+
+
+def _rank(store, dense: List[Tuple[float, int]], k: int, query: Optional[str]) -> List[Tuple[Document, Optional[float]]]:
+    """Top-k (chunk, distance) - dense order, or fused with BM25 when the store has a lexical index."""
+    lexical_index = getattr(store, "lexical_index", None)
+    if query and lexical_index is not None and HYBRID_CANDIDATES:
+        distances = {position: distance for distance, position in dense}
+        lexical = [position for position, _ in lexical_index.search(query, HYBRID_CANDIDATES)]
+        fused = reciprocal_rank_fusion([[position for _, position in dense], lexical])[:k]
+        ranked = [(position, distances.get(position)) for position, _ in fused]
+    else:
+        ranked = [(position, distance) for distance, position in dense[:k]]
+    return [(store.docstore.search(store.index_to_docstore_id[position]), distance) for position, distance in ranked]
+
+
+def search_batch(requests: List[Tuple[object, List[float], int, Optional[str]]]) -> List[List[Tuple[Document, Optional[float]]]]:
+    """Answers (store, query_vector, k, query_text) requests, grouping those that hit the same store."""
+    groups = defaultdict(list)
+    for position, request in enumerate(requests):
+        groups[id(request[0])].append(position)
+
+    results: List[Optional[List]] = [None] * len(requests)
+    for positions in groups.values():
+        store = requests[positions[0]][0]
+        # Hybrid requests need a deeper dense list to fuse with
+        depth = max(max(k, HYBRID_CANDIDATES) if query else k for _, _, k, query in (requests[p] for p in positions))
+        vectors = np.array([requests[position][1] for position in positions], dtype=np.float32)
+        for position, dense in zip(positions, _search_group(store, vectors, depth)):
+            _, _, k, query = requests[position]
+            results[position] = _rank(store, dense, k, query)
+    return results
+
+
+class QueryService:
+    """Embeds and searches chat queries in micro-batches, off the event loop."""
+
+    def __init__(self, embeddings, max_batch_size: int = 32, max_wait_ms: float = 5):
+        # Queries skip the persistent chunk cache (see CachedEmbeddings.embed_query)
+        encoder = getattr(embeddings, "underlying", embeddings)
+        self.embed_batcher = MicroBatcher(encoder.embed_documents, max_batch_size, max_wait_ms, name="query-embed")
+        self.search_batcher = MicroBatcher(search_batch, max_batch_size, max_wait_ms, name="query-search")
+        self.timings = StageTimings()
+
+    async def embed(self, query: str) -> List[float]:
+        start = time.perf_counter()
+        vector = await self.embed_batcher.submit(query)
+        self.timings.record("embed", (time.perf_counter() - start) * 1000)
+        return vector
+
+    async def search(self, vector_store, query_vector: List[float], k: int, query: Optional[str] = None) -> List[Tuple[Document, Optional[float]]]:
+        """(chunk, distance) pairs; pass the query text to fuse in BM25 hits (their distance may be None)."""
+        start = time.perf_counter()
+        hits = await self.search_batcher.submit((vector_store, query_vector, k, query))
+        self.timings.record("search", (time.perf_counter() - start) * 1000)
+        return hits
+
+    async def retrieve(self, vector_store, query: str, k: int, query_vector: Optional[List[float]] = None) -> List[Document]:
+        """Top-k chunks of one store for a question (embedded here unless query_vector is given)."""
+        if query_vector is None:
+            query_vector = await self.embed(query)
+        return [doc for doc, _ in await self.search(vector_store, query_vector, k, query)]
+
+    def stats(self) -> Dict:
+        return {
+            "stages": self.timings.stats(),
+            "embed_batching": self.embed_batcher.stats(),
+            "search_batching": self.search_batcher.stats(),
+        }
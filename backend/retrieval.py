@@ -0,0 +1,249 @@
+"""
+Cross-document retrieval: one question, many document indexes, one top-k.
+
+The query is embedded once. The first time a set of documents is queried,
+every index is searched in parallel on a thread pool (faiss releases the
+GIL while searching) and the per-document hits are merged by distance into
+a single global top-k. All indexes use the same embedding model and L2
+metric, so distances are comparable.
+
+For sets of SHARED_INDEX_MIN_DOCS or more documents a shared index over all
+of their vectors is built in the background (IVF once it is large enough),
+so later queries cost one search instead of one per document. A shared
+index also serves any subset of its documents through an id filter.
+Shared indexes have their own memory budget (SHARED_INDEX_CACHE_MB) and
+are dropped as soon as one of their documents leaves the index cache, so
+they never keep an evicted document's chunks alive.
+
+When the query text is given, each document's BM25 index is searched too
+and the merged lexical hits are fused with the dense ones (reciprocal rank
+fusion, see bm25.py).
+"""
+import asyncio
+import heapq
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from bm25 import HYBRID_CANDIDATES, reciprocal_rank_fusion
+from index_engine import build_faiss_index, index_heap_bytes
+
+RETRIEVAL_THREADS = int(os.getenv("RETRIEVAL_THREADS", min(8, os.cpu_count() or 1)))
+SHARED_INDEX_MIN_DOCS = int(os.getenv("SHARED_INDEX_MIN_DOCS", 4))
+SHARED_INDEX_CACHE_SIZE = int(os.getenv("SHARED_INDEX_CACHE_SIZE", 8))
+SHARED_INDEX_CACHE_MB = int(os.getenv("SHARED_INDEX_CACHE_MB", 64))
+# Per chunk: the (document_id, position, chunk) entry - the chunk itself belongs to its document's store
+CHUNK_ENTRY_OVERHEAD = 100
+
+_search_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_THREADS, thread_name_prefix="search")
+_build_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-index")
+
+Hit = Tuple[float, str, int, Document]  # (distance, document_id, chunk position in its index, chunk)
+
+
+def _chunk(vector_store, position: int) -> Document:
+    return vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+
+
+def _search_one(document_id: str, vector_store, query_vector: List[float], k: int) -> List[Hit]:
+    distances, positions = vector_store.index.search(np.array([query_vector], dtype=np.float32), k)
+    return [
+        (float(distance), document_id, int(position), _chunk(vector_store, position))
+        for distance, position in zip(distances[0], positions[0]) if position >= 0
+    ]
+
+
+def _reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """All vectors of an index. The index is a cached one, shared with searches - it is left as it was found."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None or ivf.direct_map.type != faiss.DirectMap.NoMap:
+        return index.reconstruct_n(0, index.ntotal)
+    # IVF needs an id -> list map to reconstruct; it is only needed here, so free it again
+    # (searches don't use it, and shared indexes are built one at a time)
+    ivf.make_direct_map()
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    finally:
+        ivf.make_direct_map(False)
+
+
+class SharedIndex:
+    """One index over several documents' vectors, with a contiguous id range per document."""
+
+    def __init__(self, stores: Dict[str, object]):
+        blocks = []
+        self.chunks: List[Tuple[str, int, Document]] = []  # global id -> (document_id, position, chunk)
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+        for doc_id, store in stores.items():
+            start = len(self.chunks)
+            blocks.append(_reconstruct_all(store.index))
+            self.chunks += [(doc_id, i, _chunk(store, i)) for i in range(store.index.ntotal)]
+            self.ranges[doc_id] = (start, len(self.chunks))
+        self.document_ids = frozenset(stores)
+        self.index = build_faiss_index(np.vstack(blocks))
+        self.nbytes = index_heap_bytes(self.index) + len(self.chunks) * CHUNK_ENTRY_OVERHEAD
+
+    def search(self, query_vector: List[float], k: int, document_ids: Iterable[str]) -> List[Hit]:
+        params = None
+        document_ids = set(document_ids)
+        if document_ids != self.document_ids:
+            # Per-document filtering: only ids inside the requested documents' ranges
+            allowed = np.concatenate([np.arange(*self.ranges[doc_id]) for doc_id in document_ids]).astype(np.int64)
+            selector = faiss.IDSelectorBatch(allowed)
+            ivf = faiss.try_extract_index_ivf(self.index)
+            if ivf is not None:
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+        distances, ids = self.index.search(np.array([query_vector], dtype=np.float32), k, params=params)
+        return [(float(dist), *self.chunks[i]) for dist, i in zip(distances[0], ids[0]) if i >= 0]
+
+
+class SharedIndexCache:
+    """Small LRU of shared indexes (bounded by count and bytes), built in the background on first use of a document set."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[frozenset, SharedIndex]" = OrderedDict()
+        self._building = set()
+        self._stale = set()  # builds whose documents changed or were evicted meanwhile
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.evictions = 0
+
+    def find(self, document_ids: Iterable[str]) -> Optional[SharedIndex]:
+        """Smallest cached shared index that covers every requested document."""
+        wanted = frozenset(document_ids)
+        with self._lock:
+            covering = [key for key in self._entries if wanted <= key]
+            if not covering:
+                return None
+            key = min(covering, key=len)
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def schedule_build(self, stores: Dict[str, object]):
+        key = frozenset(stores)
+        with self._lock:
+            if key in self._entries or key in self._building:
+                return
+            self._building.add(key)
+        _build_pool.submit(self._build, key, dict(stores))
+
+    def _build(self, key: frozenset, stores: Dict[str, object]):
+        try:
+            shared = SharedIndex(stores)
+            with self._lock:
+                if key in self._stale:
+                    return
+                if shared.nbytes > self.max_bytes:
+                    print(f"⚠️ Shared index over SHARED_INDEX_CACHE_MB ({shared.nbytes} bytes) - not kept")
+                    return
+                self._entries[key] = shared
+                self.resident_bytes += shared.nbytes
+                while len(self._entries) > self.max_entries or self.resident_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.resident_bytes -= evicted.nbytes
+                    self.evictions += 1
+            print(f"🧩 Shared index ready: {len(stores)} documents, {shared.index.ntotal} chunks")
+        except Exception as e:
+            print(f"⚠️ Could not build shared index: {e}")
+        finally:
+            with self._lock:
+                self._building.discard(key)
+                self._stale.discard(key)
+
+    def invalidate(self, document_id: str):
+        """Drop every shared index containing a document (it was re-indexed, or evicted from the index cache)."""
+        with self._lock:
+            for key in [key for key in self._entries if document_id in key]:
+                self.resident_bytes -= self._entries.pop(key).nbytes
+            self._stale.update(key for key in self._building if document_id in key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "shared_indexes": len(self._entries),
+                "building": len(self._building),
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+shared_indexes = SharedIndexCache(SHARED_INDEX_CACHE_SIZE, SHARED_INDEX_CACHE_MB * 1024 * 1024)
+
+
+def merge_top_k(hits: List[Hit], k: int) -> List[Document]:
+    top = heapq.nsmallest(k, hits, key=lambda hit: hit[0])
+    # Copy instead of mutating the cached Documents
+    return [
+        Document(page_content=doc.page_content, metadata={**doc.metadata, "document_id": doc_id, "score": score})
+        for score, doc_id, _, doc in top
+    ]
+
+
+def lexical_hits(stores: Dict[str, object], query: str, k: int) -> List[Hit]:
+    """Top k BM25 hits across the stores that have a lexical index, as (score, document_id, chunk), best first."""
+    hits = []
+    for doc_id, store in stores.items():
+        lexical_index = getattr(store, "lexical_index", None)
+        if lexical_index is None:
+            continue
+        for position, score in lexical_index.search(query, k):
+            hits.append((score, doc_id, position, _chunk(store, position)))
+    return heapq.nlargest(k, hits, key=lambda hit: hit[0])
+
+
+def fuse_hits(dense: List[Hit], lexical: List[Hit], k: int) -> List[Document]:
+    """Reciprocal rank fusion of dense hits (by distance) and lexical hits (by BM25 score)."""
+    # Chunks are keyed by position: a shared index holds its own Document objects, which differ from
+    # the ones a reloaded store hands to the lexical search
+    key = lambda hit: (hit[1], hit[2])
+    dense = sorted(dense, key=lambda hit: hit[0])
+    chunks = {key(hit): hit[3] for hit in dense + lexical}
+    distances = {key(hit): hit[0] for hit in dense}
+    fused = reciprocal_rank_fusion([[key(hit) for hit in dense], [key(hit) for hit in lexical]])[:k]
+    results = []
+    for (doc_id, position), fusion_score in fused:
+        doc = chunks[(doc_id, position)]
+        metadata = {**doc.metadata, "document_id": doc_id, "score": distances.get((doc_id, position)), "fusion_score": fusion_score}
+        results.append(Document(page_content=doc.page_content, metadata=metadata))
+    return results
+
+
+def search_many(stores: Dict[str, object], query_vector: List[float], k: int, allow_shared: bool = True,
+                query: Optional[str] = None) -> List[Document]:
+    """
+    Top k chunks across every store, tagged with their document_id.
+    Pass allow_shared=False while any store is still a partial snapshot - it would go stale inside a shared index.
+    Pass the query text to fuse BM25 hits into the ranking.
+    """
+    depth = max(k, HYBRID_CANDIDATES) if query else k
+    shared = shared_indexes.find(stores) if allow_shared else None
+    if shared is not None:
+        dense = shared.search(query_vector, depth, stores)
+    else:
+        futures = [_search_pool.submit(_search_one, doc_id, store, query_vector, depth) for doc_id, store in stores.items()]
+        dense = heapq.nsmallest(depth, (hit for future in futures for hit in future.result()), key=lambda hit: hit[0])
+        if allow_shared and len(stores) >= SHARED_INDEX_MIN_DOCS:
+            shared_indexes.schedule_build(stores)
+
+    lexical = lexical_hits(stores, query, depth) if query and HYBRID_CANDIDATES else []
+    if not lexical:
+        return merge_top_k(dense, k)
+    return fuse_hits(dense, lexical, k)
+
+
+async def retrieve_across(stores: Dict[str, object], embeddings, query: str, k: int, allow_shared: bool = True,
+                          query_vector: Optional[List[float]] = None) -> List[Document]:
+    if query_vector is None:
+        query_vector = await asyncio.to_thread(embeddings.embed_query, query)
+    return await asyncio.to_thread(search_many, stores, query_vector, k, allow_shared, query)
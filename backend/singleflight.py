@@ -0,0 +1,123 @@
+"""
+Single-flight request coalescing.
+
+Concurrent requests with the same key share one upstream call: the first
+one (the leader) starts it, later ones wait for its result instead of
+calling the LLM again. For streams every subscriber receives the full
+sequence of frames - the ones produced before it joined are replayed from
+a buffer, then new ones are fanned out as they arrive. A flight is
+forgotten as soon as it finishes, so only truly overlapping requests are
+merged (repeats after that are the answer cache's job).
+"""
+import asyncio
+import hashlib
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+def request_fingerprint(*parts) -> str:
+    """Stable key for JSON-serializable request parts (document ids, question, history...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Broadcast:
+    """Frames of one in-flight stream, shared by all of its subscribers."""
+
+    def __init__(self):
+        self.frames: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.updated = asyncio.Event()
+
+    def _notify(self):
+        # Swap in a fresh event so waiters only wake for frames they haven't seen
+        event, self.updated = self.updated, asyncio.Event()
+        event.set()
+
+
+class SingleFlight:
+    """Coalesces identical in-flight calls (await-style and streaming). Use from the event loop only."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable]):
+        """Awaits factory() - or the identical call already in flight."""
+        call = self._calls.get(key)
+        if call is None:
+            self.leaders += 1
+            call = asyncio.ensure_future(factory())
+            self._calls[key] = call
+            call.add_done_callback(lambda finished: self._finish_call(key, finished))
+        else:
+            self.coalesced += 1
+        # Shielded: one client disconnecting must not cancel the answer the others are waiting for
+        return await asyncio.shield(call)
+
+    def _finish_call(self, key: str, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()  # mark retrieved even if every waiter went away
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Yields the frames of factory()'s stream, shared with identical streams already in flight."""
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.leaders += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, factory()))
+        else:
+            self.coalesced += 1
+
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(broadcast.frames):
+                    position += 1
+                    yield broadcast.frames[position - 1]
+                elif broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                else:
+                    await broadcast.updated.wait()
+        finally:
+            broadcast.subscribers -= 1
+            # Last listener left before the end - stop generating for nobody. Forget the broadcast right away:
+            # the cancelled pump only finishes on a later loop iteration, and a request arriving in between
+            # must start a new stream instead of joining one that ends without its frames.
+            if broadcast.subscribers == 0 and not broadcast.done:
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, source: AsyncIterator):
+        try:
+            async for frame in source:
+                broadcast.frames.append(frame)
+                broadcast._notify()
+        except asyncio.CancelledError as e:
+            broadcast.error = e  # anyone still subscribed fails instead of seeing a silently truncated stream
+            raise
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            broadcast.done = True
+            broadcast._notify()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
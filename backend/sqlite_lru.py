@@ -0,0 +1,62 @@
+"""
+SQLite table with least-recently-used eviction, shared by the on-disk caches.
+
+Each row carries a last_used timestamp. Once the table grows past its limit
+it is trimmed to 90%, oldest first, so eviction doesn't run on every insert.
+The connection is in WAL mode and waits on a locked database instead of
+failing, since several ingest.py processes may write the same cache file.
+Subclasses add their own columns and lookups and share the counters and
+stats() fields.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+
+class SQLiteLRU:
+    """One table (columns + last_used, keyed by primary_key) trimmed to 90% of max_entries once it grows past it."""
+
+    def __init__(self, path: str, table: str, columns: str, primary_key: str, max_entries: int):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({columns}, last_used REAL NOT NULL, PRIMARY KEY ({primary_key}))"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)")
+        self._conn.commit()
+
+    def _evict(self):
+        """Call with self._lock held, after committing new rows."""
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE rowid IN (SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._conn.commit()
+        self.evictions += excess
+
+    def _lru_stats(self) -> Dict:
+        with self._lock:
+            (entries,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
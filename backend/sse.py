@@ -0,0 +1,118 @@
+"""
+Server-sent events for /chat/stream.
+
+The answer generator yields payload dicts ({"chunk": ...}, {"done": ...},
+{"error": ...}); this module turns them into `data: {...}\\n\\n` frames:
+
+- Frames are encoded with orjson.
+- Tokens are coalesced. The first chunk goes out immediately (time to
+  first token). Later ones are merged until SSE_FLUSH_MS has passed or
+  SSE_FLUSH_BYTES are buffered, so a fast model causes a few dozen writes
+  per answer instead of one per token.
+- Each client gets a heartbeat comment (": ping") while nothing else has
+  been sent for heartbeat_s, which keeps proxies from closing a slow
+  stream. A client that went away is detected while waiting, and closing
+  its stream cancels the generation upstream (see singleflight.py).
+"""
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import orjson
+
+HEARTBEAT = b": ping\n\n"
+
+
+def encode_event(payload: Dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+async def _close(pending: Optional[asyncio.Future], source):
+    """Stops a source whose next item may still be in flight on its own task."""
+    if pending is not None and not pending.done():
+        pending.cancel()
+        try:
+            await pending
+        except BaseException:
+            pass
+    await source.aclose()
+
+
+async def coalesce_events(events: AsyncIterator[Dict], flush_ms: float, flush_bytes: int) -> AsyncIterator[bytes]:
+    """Encodes payloads as SSE frames, merging consecutive chunks (first chunk unbuffered)."""
+    buffer = []
+    buffered_bytes = 0
+    deadline = None
+    sent_first_chunk = False
+    pending = None
+
+    def flush() -> bytes:
+        nonlocal buffer, buffered_bytes, deadline
+        frame = encode_event({"chunk": "".join(buffer)})
+        buffer, buffered_bytes, deadline = [], 0, None
+        return frame
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:  # flush interval passed with no new token
+                yield flush()
+                continue
+
+            task, pending = pending, None
+            try:
+                payload = task.result()
+            except StopAsyncIteration:
+                if buffer:
+                    yield flush()
+                return
+
+            chunk = payload.get("chunk")
+            if chunk is None:
+                if buffer:
+                    yield flush()
+                yield encode_event(payload)
+            elif not sent_first_chunk:
+                sent_first_chunk = True
+                yield encode_event(payload)
+            elif chunk:
+                buffer.append(chunk)
+                buffered_bytes += len(chunk)
+                if deadline is None:
+                    deadline = time.perf_counter() + flush_ms / 1000
+                if buffered_bytes >= flush_bytes:
+                    yield flush()
+    finally:
+        await _close(pending, events)
+
+
+async def with_heartbeats(frames: AsyncIterator[bytes], request, heartbeat_s: float, poll_s: float = 1.0) -> AsyncIterator[bytes]:
+    """Relays frames to one client, adding heartbeats when idle and stopping if the client disconnected."""
+    last_sent = time.perf_counter()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(frames.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=min(poll_s, heartbeat_s))
+            if not done:
+                if request is not None and await request.is_disconnected():
+                    print("🔌 Client disconnected - cancelling its stream")
+                    return
+                if time.perf_counter() - last_sent >= heartbeat_s:
+                    last_sent = time.perf_counter()
+                    yield HEARTBEAT
+                continue
+
+            task, pending = pending, None
+            try:
+                frame = task.result()
+            except StopAsyncIteration:
+                return
+            last_sent = time.perf_counter()
+            yield frame
+    finally:
+        await _close(pending, frames)
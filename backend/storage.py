@@ -0,0 +1,359 @@
+"""
+Persistent document store: per-document FAISS indexes on disk plus a small
+JSON metadata catalog.
+
+Layout (same save_local format ingest.py uses for faiss_index/):
+
+    document_store/
+    ├── catalog.json            # { "doc_id": {"filename": ..., "status": ...} }
+    ├── embedding_cache.sqlite3 # chunk embeddings, see embedding_cache.py
+    └── <doc_id>/
+        └── <index_version>/    # one folder per saved index, see below
+            ├── index.faiss
+            ├── index.pkl
+            └── bm25.npz        # lexical index over the same chunks, see bm25.py
+
+Re-uploads of an identical file get their own catalog entry with
+"alias_of" pointing at the original, and share its index.
+
+Only the catalog is read at startup; indexes are loaded lazily on first use,
+with their vectors memory-mapped (see index_engine.py).
+
+The directory can be shared by several server processes (uvicorn workers).
+Catalog writes are read-modify-write under an exclusive file lock
+(catalog.lock), and readers reload catalog.json whenever its inode changes,
+so a document published by one worker shows up in every other worker
+without a restart. Each saved index gets a new version folder (written to
+a temp folder, then renamed); the catalog entry's index_version says which
+one is current. A re-index publishes the new version in the catalog before
+deleting the old folder, so every reader always finds the version its
+catalog points at. Each process holds a lock on
+workers/<owner id>.lock while it is alive. On startup, in-flight entries
+whose owner's lock is free are marked interrupted; entries owned by live
+workers are left alone.
+"""
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - no cross-process locking, run a single worker
+    fcntl = None
+MULTI_WORKER_SUPPORTED = fcntl is not None
+
+from langchain_community.vectorstores import FAISS
+
+from bm25 import BM25Index
+from index_engine import read_index
+
+# Statuses that cannot survive a restart (their temp upload is gone)
+IN_FLIGHT_STATUSES = ("queued", "processing", "partial")
+# Non-persisted progress updates still reach the shared catalog this often (seconds)
+PROGRESS_PERSIST_INTERVAL = 2.0
+
+
+class DocumentStore:
+    """Catalog of document metadata + on-disk FAISS indexes."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.catalog_path = os.path.join(root, "catalog.json")
+        self.catalog: Dict[str, Dict] = {}
+        # Called with a doc_id when another process published a new index for it
+        self.on_index_changed: Optional[Callable[[str], None]] = None
+        self.owner_id = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._catalog_stamp = None
+        self._unsaved: Dict[str, Dict] = {}  # persist=False fields not written to disk yet
+        self._last_persist = 0.0
+        os.makedirs(os.path.join(root, "workers"), exist_ok=True)
+        self._owner_lock = self._hold_owner_lock()
+        self._load_catalog()
+
+    # --- Cross-process coordination ---
+    def _hold_owner_lock(self):
+        """Locked for as long as this process lives - tells other workers our in-flight jobs are still running."""
+        if fcntl is None:
+            return None
+        f = open(os.path.join(self.root, "workers", f"{self.owner_id}.lock"), "w")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _owner_alive(self, owner_id: Optional[str]) -> bool:
+        if owner_id == self.owner_id:
+            return True
+        if fcntl is None or not owner_id:
+            return False
+        path = os.path.join(self.root, "workers", f"{owner_id}.lock")
+        try:
+            with open(path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        os.remove(path)  # its process is gone
+        return False
+
+    @contextmanager
+    def _catalog_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, "catalog.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --- Catalog ---
+    def _stamp(self):
+        try:
+            stat = os.stat(self.catalog_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_disk(self) -> Dict[str, Dict]:
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _install(self, catalog: Dict[str, Dict], stamp, notify: bool, own: Optional[str] = None):
+        """Swaps in a catalog read from disk, keeping this process's unsaved progress on top."""
+        previous = self.catalog
+        for doc_id, fields in self._unsaved.items():
+            if doc_id in catalog:
+                catalog[doc_id].update(fields)
+        self.catalog = catalog
+        self._catalog_stamp = stamp
+        if notify and self.on_index_changed:
+            for doc_id, entry in catalog.items():
+                old = previous.get(doc_id)
+                if doc_id != own and old is not None and entry.get("index_version") != old.get("index_version"):
+                    self.on_index_changed(doc_id)
+
+    def refresh(self):
+        """Re-reads the catalog if another process replaced it since we last looked (a stat call otherwise)."""
+        stamp = self._stamp()
+        if stamp == self._catalog_stamp:
+            return
+        with self._lock:
+            stamp = self._stamp()
+            if stamp == self._catalog_stamp:
+                return
+            try:
+                catalog = self._read_disk()
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not re-read document catalog: {e}")
+                return
+            self._install(catalog, stamp, notify=True)
+
+    def _load_catalog(self):
+        with self._catalog_lock():
+            try:
+                catalog = self._read_disk()
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not read document catalog, starting empty: {e}")
+                catalog = {}
+
+            interrupted = [
+                doc_id for doc_id, entry in catalog.items()
+                if entry.get("status") in IN_FLIGHT_STATUSES and not self._owner_alive(entry.get("owner"))
+            ]
+            for doc_id in interrupted:
+                catalog[doc_id].update(status="error", error="Processing was interrupted by a server restart. Please upload again.")
+            if interrupted:
+                self._write_disk(catalog)
+            self._install(catalog, self._stamp(), notify=False)
+        # Drop the lock files of processes that are gone
+        for name in os.listdir(os.path.join(self.root, "workers")):
+            if name.endswith(".lock"):
+                self._owner_alive(name[:-len(".lock")])
+
+    def _write_disk(self, catalog: Dict[str, Dict]):
+        # Write-then-rename so a crash (or a reader in another worker) never sees a half-written catalog
+        payload = json.dumps(catalog, indent=2)
+        tmp_path = f"{self.catalog_path}.{self.owner_id}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.catalog_path)
+
+    def _save(self, doc_id: str, apply: Callable[[Dict[str, Dict]], None]):
+        """Read-modify-write of the shared catalog: apply(catalog) runs on the latest version on disk."""
+        with self._catalog_lock():
+            catalog = self._read_disk()
+            if doc_id in catalog:
+                catalog[doc_id].update(self._unsaved.pop(doc_id, {}))
+            apply(catalog)
+            self._write_disk(catalog)
+            self._last_persist = time.monotonic()
+            self._install(catalog, self._stamp(), notify=True, own=doc_id)
+
+    def add(self, doc_id: str, filename: str, **fields):
+        """New entry, owned by this process (a restart checks the owner before calling it interrupted)."""
+        def apply(catalog):
+            catalog[doc_id] = {"filename": filename, "created_at": str(datetime.now()), "owner": self.owner_id, **fields}
+        self._save(doc_id, apply)
+
+    def add_many(self, entries: Dict[str, Dict]):
+        """Several new entries ({doc_id: fields, with "filename"}) in one catalog write - for bulk ingestion."""
+        created_at = str(datetime.now())
+        def apply(catalog):
+            for doc_id, fields in entries.items():
+                catalog[doc_id] = {"filename": fields["filename"], "created_at": created_at, "owner": self.owner_id, **fields}
+        self._save(None, apply)
+
+    def update(self, doc_id: str, persist: bool = True, **fields):
+        """
+        Merge fields into a catalog entry. Use persist=False for high-frequency progress updates - they are
+        visible here at once and written to the shared catalog at most every PROGRESS_PERSIST_INTERVAL seconds.
+        """
+        with self._lock:
+            entry = self.catalog.get(doc_id)
+            if entry is None:
+                return
+            if not persist:
+                entry.update(fields)
+                self._unsaved.setdefault(doc_id, {}).update(fields)
+                if time.monotonic() - self._last_persist < PROGRESS_PERSIST_INTERVAL:
+                    return
+        def apply(catalog):
+            if doc_id in catalog:
+                catalog[doc_id].update(fields)
+        self._save(doc_id, apply)
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        self.refresh()
+        return self.catalog.get(doc_id)
+
+    def remove(self, doc_id: str):
+        self._unsaved.pop(doc_id, None)
+        self._save(doc_id, lambda catalog: catalog.pop(doc_id, None))
+        shutil.rmtree(os.path.join(self.root, doc_id), ignore_errors=True)
+
+    def items(self):
+        self.refresh()
+        return list(self.catalog.items())
+
+    def find_ready_by_hash(self, file_hash: str, match: Optional[Callable[[Dict], bool]] = None) -> Optional[str]:
+        """Returns the id of an already-indexed document with identical file content (and match(entry) true), if any."""
+        for doc_id, entry in self.items():
+            if entry.get("file_hash") == file_hash and entry.get("status") == "ready" and not entry.get("alias_of"):
+                if match is None or match(entry):
+                    return doc_id
+        return None
+
+    def resolve(self, doc_id: str) -> str:
+        """Maps a duplicate-upload alias to the document whose index it shares."""
+        entry = self.get(doc_id) or {}
+        return entry.get("alias_of", doc_id)
+
+    def __contains__(self, doc_id: str) -> bool:
+        self.refresh()
+        return doc_id in self.catalog
+
+    # --- Indexes ---
+    def index_path(self, doc_id: str, version: Optional[str] = None) -> str:
+        """Folder holding an index version (default: the catalog's current one); <doc_id> itself for pre-versioning indexes."""
+        doc_path = os.path.join(self.root, doc_id)
+        if version is None:
+            version = (self.get(doc_id) or {}).get("index_version")
+        if version and os.path.isdir(os.path.join(doc_path, version)):
+            return os.path.join(doc_path, version)
+        return doc_path
+
+    def has_index(self, doc_id: str) -> bool:
+        return os.path.exists(os.path.join(self.index_path(doc_id), "index.faiss"))
+
+    def save_index(self, doc_id: str, vector_store: FAISS) -> str:
+        """
+        Writes the index (plus its BM25 index, built here if missing) to a new version folder and returns the version.
+        Readers keep using the catalog's current version until publish_index() switches them over.
+        """
+        version = uuid.uuid4().hex
+        final_path = os.path.join(self.root, doc_id, version)
+        tmp_path = f"{final_path}.{self.owner_id}.tmp"
+        vector_store.save_local(tmp_path)
+        if getattr(vector_store, "lexical_index", None) is None:
+            vector_store.lexical_index = BM25Index.build(chunk_texts(vector_store))
+        vector_store.lexical_index.save(os.path.join(tmp_path, "bm25.npz"))
+        os.rename(tmp_path, final_path)
+        return version
+
+    def publish_index(self, doc_id: str, version: str, **fields):
+        """
+        Points the catalog entry at a saved index version (and merges fields), then deletes the version it replaces.
+        The old files are only removed once no catalog refers to them; indexes already memory-mapped from them stay valid.
+        """
+        replaced = {}
+        def apply(catalog):
+            if doc_id in catalog:
+                replaced["version"] = catalog[doc_id].get("index_version")
+                catalog[doc_id].update(fields, index_version=version)
+        self._save(doc_id, apply)
+        self._drop_index_version(doc_id, replaced.get("version"), keep=version)
+
+    def _drop_index_version(self, doc_id: str, version: Optional[str], keep: str):
+        doc_path = os.path.join(self.root, doc_id)
+        if version and version != keep and os.path.isdir(os.path.join(doc_path, version)):
+            shutil.rmtree(os.path.join(doc_path, version), ignore_errors=True)
+            return
+        # Saved before versioned folders: the files sit in <doc_id> itself
+        for name in ("index.faiss", "index.pkl", "bm25.npz"):
+            if os.path.exists(os.path.join(doc_path, name)):
+                os.remove(os.path.join(doc_path, name))
+
+    def load_index(self, doc_id: str, embeddings, version: Optional[str] = None) -> Optional[FAISS]:
+        path = self.index_path(doc_id, version)
+        try:
+            vector_store = self._read_index(path, embeddings)
+        except (OSError, RuntimeError):
+            if version is not None or os.path.exists(os.path.join(path, "index.faiss")):
+                raise
+            vector_store = None
+        if vector_store is None and version is None:
+            # Another worker may have published a newer version and deleted this one since we looked it up
+            latest = self.index_path(doc_id)
+            if latest != path:
+                vector_store = self._read_index(latest, embeddings)
+        return vector_store
+
+    def _read_index(self, path: str, embeddings) -> Optional[FAISS]:
+        if not os.path.exists(os.path.join(path, "index.faiss")):
+            return None
+        # Same files FAISS.load_local reads, but with the index memory-mapped.
+        # The pickle was written by this server, so deserializing it is safe.
+        index = read_index(os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vector_store = FAISS(embeddings, index, docstore, index_to_docstore_id)
+        bm25_path = os.path.join(path, "bm25.npz")
+        if os.path.exists(bm25_path):
+            vector_store.lexical_index = BM25Index.load(bm25_path)
+        else:
+            # Saved before lexical indexes existed - rebuild from the chunks (not persisted: read-only path)
+            vector_store.lexical_index = BM25Index.build(chunk_texts(vector_store))
+        return vector_store
+
+
+def chunk_documents(vector_store: FAISS):
+    """Chunks (text + metadata) in FAISS id order - the order they were added in."""
+    return [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(vector_store.index.ntotal)]
+
+
+def chunk_texts(vector_store: FAISS):
+    """Chunk texts in FAISS id order (the order the BM25 index uses)."""
+    return [doc.page_content for doc in chunk_documents(vector_store)]
@@ -0,0 +1,69 @@
+"""
+Lexical retrieval tests: tokenization of identifiers, BM25 ranking and persistence, and reciprocal rank fusion of
+dense and lexical hits (retrieval.fuse_hits).
+
+    python -m pytest test_bm25.py -q
+"""
+from langchain_core.documents import Document
+
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from retrieval import fuse_hits
+
+CHUNKS = [
+    "The pump model AB-1234 needs a new seal every year.",
+    "Warranty terms: the pump is covered for two years.",
+    "Replace filter v2.1 before the warranty expires. The warranty covers parts only.",
+    "Contact support for questions about delivery.",
+]
+
+
+def test_identifiers_are_indexed_whole_and_by_their_parts():
+    assert tokenize("The AB-1234 pump, v2.1 and part_no") == ["ab-1234", "ab", "1234", "pump", "v2.1", "v2", "1", "part_no", "part", "no"]
+
+
+def test_exact_identifier_ranks_its_chunk_first():
+    index = BM25Index.build(CHUNKS)
+    assert [position for position, _ in index.search("seal for AB-1234", 3)] == [0]
+    hits = index.search("warranty", 3)
+    assert [position for position, _ in hits] == [2, 1]  # two mentions beat one
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search("the what", 3) == [] and index.search("nothing matches", 3) == []
+    assert len(index.search("pump warranty", 1)) == 1
+
+
+def test_saved_index_searches_the_same(tmp_path):
+    index = BM25Index.build(CHUNKS)
+    index.save(str(tmp_path / "bm25.npz"))
+    loaded = BM25Index.load(str(tmp_path / "bm25.npz"))
+    for query in ("pump", "warranty parts", "AB-1234", "delivery support"):
+        assert loaded.search(query, 4) == index.search(query, 4)
+    assert loaded.nbytes == index.nbytes
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60))
+    assert fused["a"] == 1 / 61 + 1 / 62
+    assert max(fused, key=fused.get) == "a"
+    assert fused["c"] > fused["b"]
+
+
+def chunk(text: str) -> Document:
+    return Document(page_content=text, metadata={"page": 1})
+
+
+def test_fused_hits_key_chunks_by_position_not_document_object():
+    # The dense hits come from a shared index with its own Document copies - the same chunks must still merge
+    dense = [(0.5, "doc-1", 2, chunk("warranty")), (0.1, "doc-1", 0, chunk("seal")), (0.9, "doc-2", 0, chunk("other"))]
+    lexical = [(7.0, "doc-1", 2, chunk("warranty")), (3.0, "doc-1", 5, chunk("lexical only"))]
+
+    results = fuse_hits(dense, lexical, k=10)
+    keys = [(doc.metadata["document_id"], doc.page_content) for doc in results]
+    assert len(keys) == len(set(keys)) == 4
+    assert keys[0] == ("doc-1", "warranty")  # ranked by both
+    by_text = {doc.page_content: doc.metadata for doc in results}
+    assert by_text["warranty"]["score"] == 0.5  # dense distance kept for chunks the dense search found
+    assert by_text["lexical only"]["score"] is None
+    assert by_text["seal"]["page"] == 1 and by_text["seal"]["fusion_score"] > 0
+    # The same position in another document is another chunk
+    assert ("doc-2", "other") in keys
+    assert len(fuse_hits(dense, lexical, k=2)) == 2
@@ -0,0 +1,100 @@
+"""
+/chat and /chat/stream must not cache answers from the gateway's local fallback model, so a Groq outage doesn't
+keep serving the weak answer after Groq is back. Runs the app with fake models and a temporary document store.
+
+    python -m pytest test_chat_fallback.py -q
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+os.environ["DOCUMENT_STORE_PATH"] = tempfile.mkdtemp()
+
+import httpx
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel, FakeListLLM
+
+import main
+from llm_gateway import CircuitBreaker, LLMGateway, RateLimiter
+from query_service import QueryService
+
+REPLY = "The notice period is thirty days."
+FALLBACK_REPLY = "local answer"
+
+
+class FlakyChatModel(FakeListChatModel):
+    """Answers REPLY, or fails like an unreachable Groq while down is set."""
+    down: bool = False
+
+    async def _agenerate(self, *args, **kwargs):
+        if self.down:
+            raise httpx.ConnectError("upstream down")
+        return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        if self.down:
+            raise httpx.ConnectError("upstream down")
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+def setup_app() -> FlakyChatModel:
+    primary = FlakyChatModel(responses=[REPLY])
+    main.embeddings_model = DeterministicFakeEmbedding(size=384)
+    main.query_service = QueryService(main.embeddings_model)
+    main.llm = LLMGateway(
+        primary=primary,
+        fallback_factory=lambda: FakeListLLM(responses=[FALLBACK_REPLY]),
+        limiter=RateLimiter(),
+        breaker=CircuitBreaker(failure_threshold=100),
+        max_attempts=1,
+    )
+    main.warmup.ready()
+    main.answer_cache.invalidate("doc")
+    if "doc" not in main.document_store:
+        texts = [f"Chunk {i}: the notice period, payment terms and warranty of the contract." for i in range(20)]
+        main.document_store.add("doc", "contract.pdf", status="ready")
+        main.document_store.publish_index("doc", main.document_store.save_index("doc", FAISS.from_texts(texts, main.embeddings_model)))
+    return primary
+
+
+async def ask(client: httpx.AsyncClient, stream: bool) -> dict:
+    request = {"document_id": "doc", "question": "What is the notice period?"}
+    if not stream:
+        return (await client.post("/chat", json=request)).json()
+    body = (await client.post("/chat/stream", json=request)).text
+    frames = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+    return {"answer": "".join(frame.get("chunk", "") for frame in frames), "cached": any(frame.get("cached") for frame in frames)}
+
+
+def run_outage(stream: bool):
+    primary = setup_app()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            primary.down = True
+            during = [await ask(client, stream) for _ in range(2)]
+            primary.down = False
+            after = [await ask(client, stream) for _ in range(2)]
+        return during, after
+
+    return asyncio.run(run())
+
+
+def test_fallback_answers_are_not_cached():
+    during, after = run_outage(stream=False)
+    assert [answer["answer"] for answer in during] == [FALLBACK_REPLY, FALLBACK_REPLY]
+    assert not any(answer.get("cached") for answer in during)
+    # Groq is back: the first answer comes from it and is cached, the second is served from the cache
+    assert [answer["answer"] for answer in after] == [REPLY, REPLY]
+    assert [bool(answer.get("cached")) for answer in after] == [False, True]
+
+
+def test_fallback_answers_are_not_cached_when_streaming():
+    during, after = run_outage(stream=True)
+    assert [answer["answer"] for answer in during] == [FALLBACK_REPLY, FALLBACK_REPLY]
+    assert not any(answer["cached"] for answer in during)
+    assert [answer["answer"].strip() for answer in after] == [REPLY, REPLY]
+    assert [answer["cached"] for answer in after] == [False, True]
@@ -0,0 +1,55 @@
+"""
+Parity check: the ONNX embedding backends must produce (almost) the same
+vectors as the torch/sentence-transformers model they replace.
+
+Skipped when sentence-transformers, onnxruntime or the model files are unavailable.
+
+    python -m pytest test_embedding_parity.py -q
+"""
+import numpy as np
+import pytest
+
+from embedding_backends import load_embeddings
+
+TEXTS = [
+    "What is this document about?",
+    "The agreement may be terminated by either party with thirty days written notice.",
+    "Payment is due within fifteen days of the invoice date; late payments accrue interest at 1% per month.",
+    "ContextAI lets you upload PDFs and chat with them using retrieval augmented generation.",
+    "",
+    "a " * 400,  # longer than the 256-token limit - both sides must truncate the same way
+]
+# Minimum cosine similarity to the torch vector, per backend
+THRESHOLDS = {"onnx": 0.999, "onnx-int8": 0.97}
+
+
+def _load(backend: str):
+    try:
+        return load_embeddings(backend)
+    except ImportError as e:
+        pytest.skip(f"{backend} backend dependencies not installed: {e}")
+    except Exception as e:  # offline / model files not downloadable
+        pytest.skip(f"could not load {backend} backend: {e}")
+
+
+@pytest.fixture(scope="module")
+def torch_vectors():
+    return np.array(_load("torch").embed_documents(TEXTS))
+
+
+@pytest.mark.parametrize("backend", sorted(THRESHOLDS))
+def test_documents_match_torch(backend, torch_vectors):
+    vectors = np.array(_load(backend).embed_documents(TEXTS))
+    assert vectors.shape == torch_vectors.shape
+    cosine = (vectors * torch_vectors).sum(axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(torch_vectors, axis=1)
+    )
+    assert cosine.min() >= THRESHOLDS[backend], f"min cosine {cosine.min():.4f}"
+
+
+@pytest.mark.parametrize("backend", sorted(THRESHOLDS))
+def test_query_matches_documents(backend):
+    embeddings = _load(backend)
+    query = embeddings.embed_query(TEXTS[0])
+    assert np.allclose(query, embeddings.embed_documents(TEXTS[:1])[0], atol=1e-5)
+    assert np.isclose(np.linalg.norm(query), 1.0, atol=1e-4)
@@ -0,0 +1,256 @@
+"""
+LLM gateway tests against a local mock of Groq's chat completions API.
+They run the real ChatGroq client over HTTP, with no network or API key needed.
+
+    python -m pytest test_llm_gateway.py -q
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.language_models import FakeListLLM
+from langchain_groq import ChatGroq
+
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable, RateLimiter, Throttled, watch_fallback
+
+REPLY = "The notice period is thirty days."
+FALLBACK_REPLY = "local answer"
+
+
+class MockGroq:
+    """/openai/v1/chat/completions answering REPLY, or the scripted failures queued with fail_next()."""
+
+    def __init__(self):
+        self.app = FastAPI()
+        self.app.post("/openai/v1/chat/completions")(self.completions)
+        self.reset()
+
+    def reset(self):
+        self.failures = []  # (status, retry_after) per upcoming request
+        self.always_fail = None
+        self.delay_s = 0.0
+        self.requests = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    def fail_next(self, count: int, status: int, retry_after: float = None):
+        self.failures += [(status, retry_after)] * count
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        self.concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(self.delay_s)
+        finally:
+            self.concurrent -= 1
+        failure = self.failures.pop(0) if self.failures else self.always_fail
+        if failure:
+            status, retry_after = failure
+            headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+            return JSONResponse({"error": {"message": f"mock {status}", "type": "mock"}}, status_code=status, headers=headers)
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": body["model"]}
+        usage = {"prompt_tokens": 40, "completion_tokens": 8, "total_tokens": 48}
+        if not body.get("stream"):
+            return {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}]}
+
+        def events():
+            for word in REPLY.split(" "):
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"role": "assistant", "content": word + " "}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            last = {**base, "object": "chat.completion.chunk", "x_groq": {"usage": usage},
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@pytest.fixture(scope="module")
+def mock_groq():
+    mock = MockGroq()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(mock.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    mock.url = f"http://127.0.0.1:{port}"
+    yield mock
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def groq(mock_groq):
+    mock_groq.reset()
+    return mock_groq
+
+
+def gateway(mock: MockGroq, fallback: bool = True, limiter: RateLimiter = None, **overrides) -> LLMGateway:
+    """Built the way main.py builds it, pointed at the mock (the httpx client must be created inside the test's loop)."""
+    primary = ChatGroq(
+        model="llama-3.1-8b-instant", api_key="test", base_url=mock.url, max_retries=0,
+        http_async_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=4)),
+    )
+    settings = dict(
+        primary=primary,
+        fallback_factory=(lambda: FakeListLLM(responses=[FALLBACK_REPLY] * 100)) if fallback else None,
+        limiter=limiter or RateLimiter(requests_per_minute=600, tokens_per_minute=100_000),
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout_s=0.3),
+        max_concurrency=4,
+        max_queue_wait_s=2.0,
+        backoff_s=0.01,
+    )
+    return LLMGateway(**{**settings, **overrides})
+
+
+def test_answers_through_upstream(groq):
+    async def run():
+        llm = gateway(groq)
+        answer = await llm.ainvoke("What is the notice period?")
+        streamed = [chunk.content async for chunk in llm.astream("What is the notice period?")]
+        return llm, answer, streamed
+
+    llm, answer, streamed = asyncio.run(run())
+    assert answer.content == REPLY
+    assert "".join(streamed).strip() == REPLY and len(streamed) > 1
+    assert groq.requests == 2
+    assert llm.stats()["upstream"] == 2 and llm.stats()["fallback"] == 0
+
+
+def test_rate_limited_request_waits_for_retry_after(groq):
+    groq.fail_next(1, 429, retry_after=0.3)
+
+    async def run():
+        llm = gateway(groq)
+        started = time.perf_counter()
+        answer = await llm.ainvoke("question")
+        return llm, answer, time.perf_counter() - started
+
+    llm, answer, elapsed = asyncio.run(run())
+    assert answer.content == REPLY
+    assert groq.requests == 2
+    assert elapsed >= 0.15  # Retry-After (jittered), not an immediate retry
+    assert llm.stats()["throttled"] == 1 and llm.breaker.state == "closed"
+
+
+def test_breaker_opens_falls_back_and_recovers(groq):
+    groq.always_fail = (500, None)
+
+    async def run():
+        llm = gateway(groq, max_attempts=1)
+        first = [(await llm.ainvoke("question")).content for _ in range(2)]
+        requests_when_opened = groq.requests
+        skipped = (await llm.ainvoke("question")).content  # breaker open - upstream not called
+        streamed = "".join([chunk.content async for chunk in llm.astream("question")])
+        state_while_open, requests_while_open = llm.breaker.state, groq.requests - requests_when_opened
+        groq.always_fail = None
+        await asyncio.sleep(0.35)
+        recovered = (await llm.ainvoke("question")).content  # half-open probe succeeds
+        return llm, first, skipped, streamed, state_while_open, requests_while_open, recovered
+
+    llm, first, skipped, streamed, state_while_open, requests_while_open, recovered = asyncio.run(run())
+    assert first == [FALLBACK_REPLY, FALLBACK_REPLY]
+    assert skipped == FALLBACK_REPLY and streamed == FALLBACK_REPLY
+    assert state_while_open == "open" and requests_while_open == 0
+    assert recovered == REPLY and llm.breaker.state == "closed"
+    assert llm.stats()["fallback"] == 4
+
+
+def test_fallback_answers_are_reported_to_the_caller(groq):
+    async def run():
+        llm = gateway(groq, max_attempts=1)
+        upstream = watch_fallback()
+        await llm.ainvoke("question")
+        groq.always_fail = (500, None)
+        invoked = watch_fallback()
+        await llm.ainvoke("question")
+        streamed = watch_fallback()
+        [chunk async for chunk in llm.astream("question")]
+        return upstream.used, invoked.used, streamed.used
+
+    assert asyncio.run(run()) == (False, True, True)
+
+
+def test_concurrency_is_capped(groq):
+    groq.delay_s = 0.1
+
+    async def run():
+        llm = gateway(groq, max_concurrency=2)
+        return await asyncio.gather(*(llm.ainvoke(f"question {i}") for i in range(6)))
+
+    answers = asyncio.run(run())
+    assert [answer.content for answer in answers] == [REPLY] * 6
+    assert groq.max_concurrent == 2
+
+
+def test_queue_wait_beyond_limit_falls_back(groq):
+    groq.delay_s = 0.5
+
+    async def run():
+        llm = gateway(groq, max_concurrency=1, max_queue_wait_s=0.1)
+        return await asyncio.gather(llm.ainvoke("first"), llm.ainvoke("second"))
+
+    answers = sorted(answer.content for answer in asyncio.run(run()))
+    assert answers == sorted([REPLY, FALLBACK_REPLY])
+
+
+def test_unavailable_without_fallback(groq):
+    groq.always_fail = (503, None)
+
+    async def run():
+        llm = gateway(groq, fallback=False, max_attempts=1)
+        for _ in range(2):
+            with pytest.raises(LLMUnavailable):
+                await llm.ainvoke("question")
+        with pytest.raises(LLMUnavailable) as raised:
+            await llm.ainvoke("question")
+        return raised.value
+
+    error = asyncio.run(run())
+    assert error.retry_after > 0
+    assert groq.requests == 2
+
+
+def test_client_errors_are_not_retried_or_counted(groq):
+    groq.fail_next(1, 400)
+
+    async def run():
+        llm = gateway(groq)
+        with pytest.raises(Exception) as raised:
+            await llm.ainvoke("question")
+        return llm, raised.value
+
+    llm, error = asyncio.run(run())
+    assert not isinstance(error, LLMUnavailable)
+    assert groq.requests == 1
+    assert llm.breaker.failures == 0 and llm.stats()["fallback"] == 0
+
+
+def test_rate_limiter_reserves_quota():
+    now = [0.0]
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000, clock=lambda: now[0])
+    assert limiter.reserve(600, max_wait=60) == 0
+    assert limiter.reserve(100, max_wait=60) == 0
+    # Third request in the same minute: wait for one request's worth of refill (30s)
+    assert limiter.reserve(100, max_wait=60) == pytest.approx(30)
+    with pytest.raises(Throttled):
+        limiter.reserve(100, max_wait=10)  # nothing is reserved when it would wait too long
+    now[0] = 60.0
+    # A minute later both buckets are full again
+    assert limiter.reserve(1000, max_wait=60) == pytest.approx(0, abs=1e-9)
+    limiter.correct(reserved=1000, used=100)  # real usage was lower - the rest is given back
+    assert limiter.token_bucket.level == pytest.approx(900)
+    limiter.pause(5)
+    assert limiter.reserve(10, max_wait=60) >= 5
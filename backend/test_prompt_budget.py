@@ -0,0 +1,70 @@
+"""
+Prompt budget tests: packing retrieved chunks into a token budget (duplicates, splitter overlap, truncation) and
+compacting chat history into recent messages plus a summary.
+
+    python -m pytest test_prompt_budget.py -q
+"""
+from langchain_core.documents import Document
+
+from prompt_budget import CHARS_PER_TOKEN, MIN_OVERLAP_CHARS, compact_history, estimate_tokens, overlap_length, pack_context
+
+OVERLAP = "shared between both neighbouring chunks."
+FIRST = "The first chunk ends with text " + OVERLAP
+SECOND = OVERLAP + " The second chunk continues from there."
+
+
+def docs(*texts):
+    return [Document(page_content=text) for text in texts]
+
+
+def test_overlap_length_finds_the_splitter_overlap():
+    assert overlap_length(FIRST, SECOND) == len(OVERLAP)
+    assert overlap_length(SECOND, FIRST) == 0
+    assert overlap_length(FIRST, SECOND, max_chars=10) == 0  # longer than allowed: no match at all
+    # Short coincidental matches don't count
+    assert overlap_length("ends with the", "the start") == 0
+    assert overlap_length("x" * 50 + "y" * MIN_OVERLAP_CHARS, "y" * MIN_OVERLAP_CHARS + "z") == MIN_OVERLAP_CHARS
+
+
+def test_duplicates_and_overlap_are_removed_before_they_cost_tokens():
+    context, stats = pack_context(docs(FIRST, FIRST, "  ", SECOND), budget_tokens=1000)
+    assert context == FIRST + "\n\n" + "The second chunk continues from there."
+    assert stats["chunks_packed"] == 2 and stats["duplicates_dropped"] == 2
+    assert stats["overlap_chars_trimmed"] == len(OVERLAP) + 1
+    # Retrieved in the other order, the overlap is trimmed from the end of the later one
+    context, _ = pack_context(docs(SECOND, FIRST), budget_tokens=1000)
+    assert context == SECOND + "\n\n" + "The first chunk ends with text"
+
+
+def test_chunks_that_do_not_fit_are_skipped_but_smaller_ones_still_packed():
+    big, small, fits = "a" * 400, "b" * 40, "c" * 4000
+    context, stats = pack_context(docs(small, fits, big), budget_tokens=estimate_tokens(small) + estimate_tokens(big) + 2)
+    assert context == small + "\n\n" + big
+    assert stats["chunks_packed"] == 2 and stats["context_tokens"] <= estimate_tokens(small) + estimate_tokens(big) + 2
+
+
+def test_top_chunk_is_truncated_to_the_budget():
+    context, stats = pack_context(docs("x" * 1000), budget_tokens=11)
+    assert context == "x" * (10 * CHARS_PER_TOKEN)
+    assert stats["context_tokens"] == 11
+
+
+def test_history_keeps_recent_messages_and_summarizes_the_rest():
+    history = [("user", f"Question {i}? With some more words after it.") for i in range(6)]
+    recent, summary = compact_history(history, budget_tokens=1000, max_messages=2)
+    assert recent == history[-2:]
+    assert summary.splitlines() == ["Summary of the earlier conversation:"] + [f"User: Question {i}?" for i in range(4)]
+
+    recent, summary = compact_history(history[:2], budget_tokens=1000, max_messages=4)
+    assert recent == history[:2] and summary == ""
+
+
+def test_history_budget_limits_recent_messages_and_trims_the_summary():
+    history = [("user" if i % 2 == 0 else "bot", f"Message {i}. " + "word " * 40) for i in range(20)]
+    recent, summary = compact_history(history, budget_tokens=120, max_messages=10)
+    assert recent == history[-2:]  # each message costs ~55 tokens
+    assert summary.splitlines()[-1] == "Assistant: Message 17."  # the most recent older turns are kept
+    assert estimate_tokens(summary) <= 120 // 4 + estimate_tokens("Assistant: Message 17.") + 1
+    # The newest message is always kept, even when it alone is over budget
+    recent, _ = compact_history([("user", "x" * 10_000)], budget_tokens=10, max_messages=5)
+    assert len(recent) == 1
@@ -0,0 +1,160 @@
+"""
+SingleFlight tests: identical in-flight calls and streams share one upstream run, late joiners get the whole stream,
+and a stream nobody listens to any more is cancelled without catching requests that arrive right after.
+
+    python -m pytest test_singleflight.py -q
+"""
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight, request_fingerprint
+
+
+class CountingSource:
+    """factory() for SingleFlight.stream: yields `frames` items, one every delay_s; counts runs, finishes and cancels."""
+
+    def __init__(self, frames: int = 3, delay_s: float = 0.01, fail_after: int = None):
+        self.frames, self.delay_s, self.fail_after = frames, delay_s, fail_after
+        self.started = self.finished = self.cancelled = 0
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            for i in range(self.frames):
+                if i == self.fail_after:
+                    raise ValueError("upstream failed")
+                await asyncio.sleep(self.delay_s)
+                yield i
+            self.finished += 1
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_identical_calls_share_one_run():
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", answer) for _ in range(5)), flights.do("other", answer))
+        return flights, results
+
+    flights, results = asyncio.run(run())
+    assert results == ["answer"] * 6
+    assert len(calls) == 2
+    assert flights.stats() == {"in_flight": 0, "leaders": 2, "coalesced": 4}
+
+
+def test_a_failed_call_fails_every_waiter_and_is_not_remembered():
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", failing) for _ in range(3)), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flights.do("key", failing)  # the next call starts over
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(attempts) == 2
+
+
+def test_a_waiter_going_away_does_not_cancel_the_call():
+    async def answer():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        flights = SingleFlight()
+        leaving = asyncio.ensure_future(flights.do("key", answer))
+        staying = asyncio.ensure_future(flights.do("key", answer))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(run()) == "answer"
+
+
+def test_late_joiner_gets_the_frames_it_missed():
+    source = CountingSource(frames=5)
+
+    async def collect(flights, delay_s):
+        await asyncio.sleep(delay_s)
+        return [frame async for frame in flights.stream("key", source)]
+
+    async def run():
+        flights = SingleFlight()
+        return flights, await asyncio.gather(collect(flights, 0), collect(flights, 0.025))
+
+    flights, (first, late) = asyncio.run(run())
+    assert first == late == [0, 1, 2, 3, 4]
+    assert source.started == 1 and flights.coalesced == 1
+
+
+def test_stream_errors_reach_every_subscriber():
+    source = CountingSource(frames=5, fail_after=2)
+
+    async def collect(flights):
+        frames = []
+        with pytest.raises(ValueError):
+            async for frame in flights.stream("key", source):
+                frames.append(frame)
+        return frames
+
+    async def run():
+        flights = SingleFlight()
+        return await asyncio.gather(collect(flights), collect(flights))
+
+    assert asyncio.run(run()) == [[0, 1], [0, 1]]
+
+
+def test_last_subscriber_leaving_cancels_the_stream():
+    source = CountingSource(frames=100)
+
+    async def run():
+        flights = SingleFlight()
+        first, second = flights.stream("key", source), flights.stream("key", source)
+        await first.__anext__()
+        await second.__anext__()
+        await first.aclose()
+        await asyncio.sleep(0.03)
+        cancelled_while_one_listens = source.cancelled
+        await second.aclose()
+        await asyncio.sleep(0.01)
+        return flights, cancelled_while_one_listens
+
+    flights, cancelled_while_one_listens = asyncio.run(run())
+    assert cancelled_while_one_listens == 0
+    assert source.cancelled == 1 and flights.stats()["in_flight"] == 0
+
+
+def test_request_right_after_a_cancelled_stream_starts_a_new_one():
+    source = CountingSource(frames=3)
+
+    async def run():
+        flights = SingleFlight()
+        leaving = flights.stream("key", source)
+        await leaving.__anext__()
+        await leaving.aclose()  # cancels the pump, which only finishes on a later loop iteration
+        return [frame async for frame in flights.stream("key", source)]
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert source.started == 2 and source.finished == 1
+
+
+def test_fingerprint_is_stable_and_order_sensitive():
+    assert request_fingerprint("chat", ["a", "b"], "q") == request_fingerprint("chat", ["a", "b"], "q")
+    assert request_fingerprint("chat", ["a", "b"], "q") != request_fingerprint("chat", ["b", "a"], "q")
+    assert request_fingerprint({"x": 1, "y": 2}) == request_fingerprint({"y": 2, "x": 1})
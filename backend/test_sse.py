@@ -0,0 +1,94 @@
+"""
+SSE framing tests: chunk coalescing (first chunk unbuffered, then by time and size) and per-client heartbeats
+with disconnect detection.
+
+    python -m pytest test_sse.py -q
+"""
+import asyncio
+import json
+
+from sse import HEARTBEAT, coalesce_events, encode_event, with_heartbeats
+
+
+async def events(payloads, delay_s: float = 0.0, closed: list = None):
+    try:
+        for payload in payloads:
+            if delay_s:
+                await asyncio.sleep(delay_s)
+            yield payload
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+def decode(frames):
+    return [json.loads(frame[len(b"data: "):]) for frame in frames if frame.startswith(b"data: ")]
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+def test_first_chunk_goes_out_alone_and_the_rest_are_merged():
+    payloads = [{"chunk": word} for word in ("The ", "answer ", "is ", "42.")] + [{"done": True}]
+    frames = asyncio.run(collect(coalesce_events(events(payloads), flush_ms=1000, flush_bytes=1024)))
+    assert decode(frames) == [{"chunk": "The "}, {"chunk": "answer is 42."}, {"done": True}]
+    assert frames[0] == encode_event({"chunk": "The "})
+
+
+def test_chunks_are_flushed_by_size():
+    payloads = [{"chunk": "x" * 4} for _ in range(9)]
+    frames = decode(asyncio.run(collect(coalesce_events(events(payloads), flush_ms=1000, flush_bytes=8))))
+    assert [frame["chunk"] for frame in frames] == ["xxxx", "x" * 8, "x" * 8, "x" * 8, "x" * 8]
+
+
+def test_chunks_are_flushed_by_time_while_the_source_is_slow():
+    async def slow_then_done():
+        for word in ("a", "b", "c"):
+            yield {"chunk": word}
+        await asyncio.sleep(0.1)
+        yield {"chunk": "d"}
+        yield {"done": True}
+
+    frames = decode(asyncio.run(collect(coalesce_events(slow_then_done(), flush_ms=20, flush_bytes=1024))))
+    # "bc" goes out after flush_ms instead of waiting for the next token
+    assert frames == [{"chunk": "a"}, {"chunk": "bc"}, {"chunk": "d"}, {"done": True}]
+
+
+def test_errors_flush_the_buffer_first():
+    payloads = [{"chunk": "a"}, {"chunk": "b"}, {"chunk": "c"}, {"error": "failed"}]
+    frames = decode(asyncio.run(collect(coalesce_events(events(payloads), flush_ms=1000, flush_bytes=1024))))
+    assert frames == [{"chunk": "a"}, {"chunk": "bc"}, {"error": "failed"}]
+
+
+def test_heartbeats_are_sent_while_idle():
+    frames = [encode_event({"chunk": "a"}), encode_event({"done": True})]
+    relayed = asyncio.run(collect(with_heartbeats(events(frames, delay_s=0.12), None, heartbeat_s=0.05, poll_s=0.01)))
+    assert [frame for frame in relayed if frame != HEARTBEAT] == frames
+    assert relayed.count(HEARTBEAT) >= 2
+    assert relayed[0] == HEARTBEAT  # nothing was sent before the first frame
+
+
+class Request:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+def test_disconnected_client_stops_and_closes_the_source():
+    request, closed = Request(), []
+
+    async def run():
+        relayed = []
+        source = events([encode_event({"chunk": str(i)}) for i in range(100)], delay_s=0.02, closed=closed)
+        async for frame in with_heartbeats(source, request, heartbeat_s=1.0, poll_s=0.005):
+            relayed.append(frame)
+            if len(relayed) == 2:
+                request.disconnected = True
+        return relayed
+
+    relayed = asyncio.run(run())
+    assert len(relayed) in (2, 3)
+    assert closed == [True]
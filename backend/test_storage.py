@@ -0,0 +1,184 @@
+"""
+DocumentStore tests: the shared catalog (locking, restart recovery, throttled progress, bulk adds, dedupe lookups)
+and versioned index publishing. Several stores on one folder stand in for uvicorn workers.
+
+    python -m pytest test_storage.py -q
+"""
+import os
+import threading
+import time
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import storage
+from storage import DocumentStore
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=16)
+
+
+def vector_store(n_chunks: int) -> FAISS:
+    return FAISS.from_texts([f"chunk {i} of {n_chunks}" for i in range(n_chunks)], EMBEDDINGS)
+
+
+def publish(store: DocumentStore, doc_id: str, n_chunks: int) -> str:
+    version = store.save_index(doc_id, vector_store(n_chunks))
+    store.publish_index(doc_id, version, status="ready")
+    return version
+
+
+def test_concurrent_writers_keep_every_entry(tmp_path):
+    workers = [DocumentStore(str(tmp_path)) for _ in range(2)]
+
+    def add_entries(store: DocumentStore, prefix: str):
+        for i in range(20):
+            store.add(f"{prefix}-{i}", f"{prefix}-{i}.pdf", status="queued")
+            store.update(f"{prefix}-{i}", status="ready")
+
+    threads = [threading.Thread(target=add_entries, args=(store, f"w{n}")) for n, store in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    catalog = dict(DocumentStore(str(tmp_path)).items())
+    assert len(catalog) == 40
+    assert {entry["status"] for entry in catalog.values()} == {"ready"}
+    # Each worker sees the other's documents without a restart
+    assert all(f"w1-{i}" in workers[0] and f"w0-{i}" in workers[1] for i in range(20))
+
+
+@pytest.mark.skipif(not storage.MULTI_WORKER_SUPPORTED, reason="needs fcntl file locks")
+def test_restart_interrupts_only_jobs_of_dead_workers(tmp_path):
+    live = DocumentStore(str(tmp_path))
+    live.add("running", "a.pdf", status="processing")
+    dead = DocumentStore(str(tmp_path))
+    dead.add("orphaned", "b.pdf", status="partial")
+    dead.add("done", "c.pdf", status="ready")
+    dead._owner_lock.close()  # its process is gone: the lock is released, the file is left behind
+
+    restarted = DocumentStore(str(tmp_path))
+    assert restarted.get("running")["status"] == "processing"
+    assert restarted.get("orphaned")["status"] == "error"
+    assert "interrupted" in restarted.get("orphaned")["error"]
+    assert restarted.get("done")["status"] == "ready"
+    # The dead worker's lock file is cleaned up, the live one's is kept
+    assert sorted(os.listdir(tmp_path / "workers")) == sorted(f"{owner}.lock" for owner in (live.owner_id, restarted.owner_id))
+
+
+def test_progress_updates_reach_other_workers_at_most_every_interval(tmp_path):
+    writer, reader = DocumentStore(str(tmp_path)), DocumentStore(str(tmp_path))
+    writer.add("doc", "a.pdf", status="processing")
+
+    writer.update("doc", persist=False, pages_indexed=1)
+    assert writer.get("doc")["pages_indexed"] == 1
+    assert "pages_indexed" not in reader.get("doc")  # throttled: only in the writer's memory
+
+    writer._last_persist = time.monotonic() - storage.PROGRESS_PERSIST_INTERVAL
+    writer.update("doc", persist=False, pages_indexed=2)
+    assert reader.get("doc")["pages_indexed"] == 2
+
+    writer.update("doc", persist=False, pages_indexed=3)
+    writer.update("doc", status="ready")  # a persisted update carries the unsaved progress with it
+    assert reader.get("doc")["pages_indexed"] == 3 and reader.get("doc")["status"] == "ready"
+    # Unsaved progress survives another worker rewriting the catalog
+    writer.update("doc", persist=False, pages_indexed=4)
+    reader.add("other", "b.pdf", status="queued")
+    assert writer.get("doc")["pages_indexed"] == 4
+
+
+def test_add_many_writes_the_catalog_once(tmp_path, monkeypatch):
+    store = DocumentStore(str(tmp_path))
+    writes = []
+    original = DocumentStore._write_disk
+    monkeypatch.setattr(DocumentStore, "_write_disk", lambda self, catalog: (writes.append(len(catalog)), original(self, catalog)))
+
+    store.add_many({f"doc-{i}": {"filename": f"{i}.pdf", "status": "ready"} for i in range(50)})
+    assert writes == [50]
+    entry = DocumentStore(str(tmp_path)).get("doc-7")
+    assert entry["filename"] == "7.pdf" and entry["owner"] == store.owner_id
+
+
+def test_find_ready_by_hash_skips_aliases_unfinished_and_unmatched_entries(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    store.add("processing", "a.pdf", status="processing", file_hash="h1")
+    store.add("alias", "b.pdf", status="ready", file_hash="h1", alias_of="original")
+    assert store.find_ready_by_hash("h1") is None
+
+    store.add("original", "c.pdf", status="ready", file_hash="h1", profile={"name": "long"})
+    assert store.find_ready_by_hash("h1") == "original"
+    assert store.find_ready_by_hash("h1", match=lambda entry: entry["profile"]["name"] == "compact") is None
+    assert store.find_ready_by_hash("h2") is None
+    assert store.resolve("alias") == "original"
+
+
+def test_republishing_never_leaves_readers_without_an_index(tmp_path):
+    writer, reader = DocumentStore(str(tmp_path)), DocumentStore(str(tmp_path))
+    writer.add("doc", "a.pdf", status="processing")
+    first = publish(writer, "doc", 3)
+
+    # Saved but not published yet: readers keep the current version
+    second = writer.save_index("doc", vector_store(5))
+    assert reader.has_index("doc") and reader.load_index("doc", EMBEDDINGS).index.ntotal == 3
+    writer.publish_index("doc", second)
+    assert reader.load_index("doc", EMBEDDINGS).index.ntotal == 5
+    assert os.listdir(tmp_path / "doc") == [second]  # the replaced version is deleted after the catalog update
+    assert not os.path.exists(tmp_path / "doc" / first)
+
+
+def test_reader_whose_version_is_deleted_mid_load_reloads_the_new_one(tmp_path, monkeypatch):
+    writer, reader = DocumentStore(str(tmp_path)), DocumentStore(str(tmp_path))
+    writer.add("doc", "a.pdf", status="processing")
+    publish(writer, "doc", 3)
+
+    # The reader has picked its folder when another worker publishes a new version and deletes that folder
+    read_index = reader._read_index
+    def republish_first(path, embeddings):
+        if not republished:
+            republished.append(publish(writer, "doc", 5))
+        return read_index(path, embeddings)
+    republished = []
+    monkeypatch.setattr(reader, "_read_index", republish_first)
+    assert reader.load_index("doc", EMBEDDINGS).index.ntotal == 5
+
+
+def test_every_step_of_a_republish_leaves_the_index_loadable(tmp_path, monkeypatch):
+    writer, reader = DocumentStore(str(tmp_path)), DocumentStore(str(tmp_path))
+    writer.add("doc", "a.pdf", status="processing")
+    publish(writer, "doc", 3)
+
+    # Another worker loads the document after every file system change the re-index makes
+    loaded = []
+
+    def then_load(change):
+        def wrapped(*args, **kwargs):
+            result = change(*args, **kwargs)
+            index = reader.load_index("doc", EMBEDDINGS)
+            loaded.append(index.index.ntotal if index is not None else None)
+            return result
+        return wrapped
+
+    for name in ("rename", "replace", "remove"):
+        monkeypatch.setattr(os, name, then_load(getattr(os, name)))
+    monkeypatch.setattr(storage.shutil, "rmtree", then_load(storage.shutil.rmtree))
+    publish(writer, "doc", 5)
+    monkeypatch.undo()
+
+    assert loaded and None not in loaded
+    assert loaded[0] == 3 and loaded[-1] == 5
+    assert len(os.listdir(tmp_path / "doc")) == 1
+
+
+def test_indexes_saved_before_versioning_are_read_and_replaced(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    vector_store(2).save_local(str(tmp_path / "doc"))  # the old layout: files directly in <doc_id>/
+    store.add("doc", "a.pdf", status="ready", index_version="written-before-versioning")
+    assert store.load_index("doc", EMBEDDINGS).index.ntotal == 2
+
+    version = publish(store, "doc", 4)
+    assert store.load_index("doc", EMBEDDINGS).index.ntotal == 4
+    assert os.listdir(tmp_path / "doc") == [version]
+
+    store.remove("doc")
+    assert not os.path.exists(tmp_path / "doc") and "doc" not in store
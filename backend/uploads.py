@@ -0,0 +1,74 @@
+"""
+Streaming upload handling.
+
+Copies an UploadFile to a spool file in fixed-size chunks, hashing as it
+goes, so a large PDF is never held in memory and dedupe doesn't need a
+second read. The copy runs on a worker thread, off the event loop. It reads
+the temp file Starlette spooled the body into; that file is anonymous, so
+it can't simply be renamed into place for the ingestion workers. Size and
+page limits are enforced before any parsing starts.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pypdf import PdfReader
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+async def spool_upload(file: UploadFile, max_bytes: int, spool_dir: str = None) -> Tuple[str, int, str]:
+    """
+    Streams the upload to a temp .pdf file. Returns (path, size_in_bytes, sha256_hex).
+    Raises 413 past max_bytes and 415 if the content isn't a PDF; the spool file is removed on failure.
+    """
+    # Multipart parsing already knows the size - reject oversized files without copying anything
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB.")
+    # Starlette has already spooled the whole body - copy it on a thread so the disk I/O stays off the event loop
+    return await asyncio.to_thread(_spool, file.file, max_bytes, spool_dir)
+
+
+def _spool(source: BinaryIO, max_bytes: int, spool_dir: str = None) -> Tuple[str, int, str]:
+    hasher = hashlib.sha256()
+    size = 0
+    source.seek(0)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=spool_dir)
+    try:
+        with temp_file:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(b"%PDF"):
+                    raise HTTPException(status_code=415, detail="Only PDF files are supported.")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB.")
+                hasher.update(chunk)
+                temp_file.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+    except BaseException:
+        os.remove(temp_file.name)
+        raise
+    return temp_file.name, size, hasher.hexdigest()
+
+
+def _count_pages(path: str) -> int:
+    # Only reads the xref/page tree - no text extraction
+    return len(PdfReader(path).pages)
+
+
+async def check_page_limit(path: str, max_pages: int) -> int:
+    """Returns the page count; raises 413 over max_pages and 400 for unreadable PDFs."""
+    try:
+        pages = await asyncio.to_thread(_count_pages, path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read PDF: {e}")
+    if pages > max_pages:
+        raise HTTPException(status_code=413, detail=f"PDF has {pages} pages. Maximum is {max_pages}.")
+    return pages
@@ -0,0 +1,52 @@
+"""
+Background model warm-up state.
+
+The server starts answering (health checks, document listing, uploads)
+right away while the embedding model and LLM load on a thread. Endpoints
+that need the models check `state` (or block on wait() from worker
+threads); /health reports it together with per-stage load timings.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class Warmup:
+    """warming -> ready | error, plus how long each loading stage took."""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.state = "warming"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._done = threading.Event()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_s"] = round(time.perf_counter() - start, 3)
+
+    def ready(self):
+        self.timings["time_to_ready_s"] = round(time.perf_counter() - self.started_at, 3)
+        self.state = "ready"
+        self._done.set()
+
+    def failed(self, error: Exception):
+        self.error = str(error)
+        self.state = "error"
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until warm-up finished (True) or the timeout passed (False). Raises if loading failed."""
+        if not self._done.wait(timeout):
+            return False
+        if self.state == "error":
+            raise RuntimeError(f"Model loading failed: {self.error}")
+        return True
+
+    def status(self) -> Dict:
+        return {"state": self.state, "error": self.error, "timings": dict(self.timings)}